@@ -0,0 +1,241 @@
+"""Async HTTP client for the background writes to the Moltin API."""
+
+import asyncio
+import time
+
+import httpx
+
+from ...metrics import normalize_endpoint, observe_request
+from ..client import RATE_LIMITED_STATUS, RETRY_STATUSES, moltin
+from ..ratelimit import get_request_priority, get_retry_after
+from ..settings import (
+    API_BASE_URL,
+    MOLTIN_ASYNC_MAX_CONNECTIONS,
+    MOLTIN_CONNECT_TIMEOUT,
+    MOLTIN_READ_TIMEOUT,
+    MOLTIN_RETRIES,
+    MOLTIN_RETRY_BACKOFF,
+)
+
+IDEMPOTENT_METHODS = frozenset(('GET', 'PUT', 'DELETE', 'HEAD', 'OPTIONS'))
+
+
+class AsyncMoltinClient:
+    """Keep-alive async client with a connection pool for the Moltin API."""
+
+    def __init__(self, base_url, max_connections, retries, backoff_factor):
+        """
+        Create the client.
+
+        Args:
+            base_url: URL of the API.
+            max_connections: number of connections kept alive.
+            retries: number of retries for idempotent requests.
+            backoff_factor: factor of the delay between retries.
+        """
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._client = None
+
+    async def request(
+        self,
+        method,
+        path,
+        access_token=None,
+        headers=None,
+        **kwargs,
+    ):
+        """
+        Send request to the API.
+
+        Requests wait for their turn in the scheduler of the sync client,
+        a request answered with 429 is sent again after the time the API
+        asked to wait. Idempotent requests are retried with backoff, a
+        request rejected with 401 is sent once more with a refreshed
+        access token.
+
+        Returns:
+            return: response of the API.
+
+        Args:
+            method: HTTP method.
+            path: path of the endpoint.
+            access_token: required to get access to the API.
+            headers: additional headers.
+            kwargs: other arguments for the request.
+        """
+        retries = self.retries if method in IDEMPOTENT_METHODS else 0
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff_factor * 2 ** (attempt - 1))
+            try:
+                response = await self._send(
+                    method,
+                    path,
+                    access_token,
+                    headers,
+                    **kwargs,
+                )
+            except httpx.TransportError:
+                if attempt == retries:
+                    raise
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                break
+
+        is_rejected = response.status_code == 401 and access_token
+        if is_rejected and moltin.token_refresher is not None:
+            loop = asyncio.get_running_loop()
+            access_token = await loop.run_in_executor(
+                None,
+                moltin.token_refresher,
+                access_token,
+            )
+            if access_token:
+                response = await self._send(
+                    method,
+                    path,
+                    access_token,
+                    headers,
+                    **kwargs,
+                )
+
+        response.raise_for_status()
+
+        return response
+
+    async def get(self, path, access_token=None, **kwargs):
+        """
+        Send GET request to the API.
+
+        Returns:
+            return: response of the API.
+
+        Args:
+            path: path of the endpoint.
+            access_token: required to get access to the API.
+            kwargs: other arguments for the request.
+        """
+        return await self.request('GET', path, access_token, **kwargs)
+
+    async def post(self, path, access_token=None, **kwargs):
+        """
+        Send POST request to the API.
+
+        Returns:
+            return: response of the API.
+
+        Args:
+            path: path of the endpoint.
+            access_token: required to get access to the API.
+            kwargs: other arguments for the request.
+        """
+        return await self.request('POST', path, access_token, **kwargs)
+
+    async def put(self, path, access_token=None, **kwargs):
+        """
+        Send PUT request to the API.
+
+        Returns:
+            return: response of the API.
+
+        Args:
+            path: path of the endpoint.
+            access_token: required to get access to the API.
+            kwargs: other arguments for the request.
+        """
+        return await self.request('PUT', path, access_token, **kwargs)
+
+    async def delete(self, path, access_token=None, **kwargs):
+        """
+        Send DELETE request to the API.
+
+        Returns:
+            return: response of the API.
+
+        Args:
+            path: path of the endpoint.
+            access_token: required to get access to the API.
+            kwargs: other arguments for the request.
+        """
+        return await self.request('DELETE', path, access_token, **kwargs)
+
+    async def _send(self, method, path, access_token, headers, **kwargs):
+        # The scheduler is shared with the sync client, as both spend
+        # the same rate limit.
+        priority = get_request_priority()
+        for _ in range(self.retries + 1):
+            await moltin.scheduler.acquire_async(priority)
+            response = await self._send_request(
+                method,
+                path,
+                access_token,
+                headers,
+                **kwargs,
+            )
+            if response.status_code != RATE_LIMITED_STATUS:
+                break
+            moltin.scheduler.pause(get_retry_after(response))
+
+        return response
+
+    async def _send_request(
+        self,
+        method,
+        path,
+        access_token,
+        headers,
+        **kwargs,
+    ):
+        # The pool is bound to the event loop, so it is created on the
+        # first request inside the loop.
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=httpx.Timeout(
+                    MOLTIN_READ_TIMEOUT,
+                    connect=MOLTIN_CONNECT_TIMEOUT,
+                ),
+            )
+
+        request_headers = {}
+        if access_token:
+            request_headers['Authorization'] = 'Bearer {0}'.format(
+                access_token,
+            )
+        request_headers.update(headers or {})
+
+        endpoint = normalize_endpoint(path)
+        started_at = time.monotonic()
+        try:
+            response = await self._client.request(
+                method,
+                path,
+                headers=request_headers,
+                **kwargs,
+            )
+        except httpx.HTTPError as err:
+            observe_request('moltin', endpoint, started_at, type(err).__name__)
+            raise
+        observe_request(
+            'moltin',
+            endpoint,
+            started_at,
+            response.status_code if response.status_code >= 400 else None,
+        )
+
+        return response
+
+
+moltin_async = AsyncMoltinClient(
+    base_url=API_BASE_URL,
+    max_connections=MOLTIN_ASYNC_MAX_CONNECTIONS,
+    retries=MOLTIN_RETRIES,
+    backoff_factor=MOLTIN_RETRY_BACKOFF,
+)
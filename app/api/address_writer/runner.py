@@ -0,0 +1,41 @@
+"""Event loop for the background writes from sync handlers."""
+
+import asyncio
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """
+    Get the event loop running in the background thread.
+
+    Returns:
+        return: event loop.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever,
+                name='moltin-async',
+                daemon=True,
+            ).start()
+
+    return _loop
+
+
+def submit(coroutine):
+    """
+    Schedule coroutine without waiting for it.
+
+    Returns:
+        return: concurrent future with the result of the coroutine.
+
+    Args:
+        coroutine: coroutine to run.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_loop())
+
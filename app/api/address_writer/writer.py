@@ -0,0 +1,50 @@
+"""Background writes of customer addresses to Moltin."""
+
+from ..ratelimit import BACKGROUND, request_priority
+from .client import moltin_async
+from .runner import submit
+
+
+def write_customer_address(access_token, customer_position, cart_id):
+    """
+    Create customer address without waiting for Moltin.
+
+    The address is only read by the staff, so the checkout goes on while
+    the request is sent from the event loop, behind interactive requests.
+
+    Returns:
+        return: concurrent future of the request.
+
+    Args:
+        access_token: required to get access to the API.
+        customer_position: location of customer.
+        cart_id: ID for the customer's cart.
+    """
+    with request_priority(BACKGROUND):
+        return submit(create_customer_address(
+            access_token,
+            customer_position,
+            cart_id,
+        ))
+
+
+async def create_customer_address(access_token, customer_position, cart_id):
+    """
+    Create customer address.
+
+    Args:
+        access_token: required to get access to the API.
+        customer_position: location of customer.
+        cart_id: ID for the customer's cart.
+    """
+    longitude, latitude = customer_position
+    payload = {
+        'data': {
+            'type': 'entry',
+            'longitude': longitude,
+            'latitude': latitude,
+            'cart-id': cart_id,
+        }
+    }
+    api_path = '/v2/flows/customer-address/entries'
+    await moltin_async.post(api_path, access_token, data=payload)
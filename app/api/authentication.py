@@ -1,28 +1,119 @@
 """Authentication functions for the API access."""
 
-import requests
+import logging
+import secrets
+import threading
+import time
+from concurrent.futures import Future
 
-from .settings import API_BASE_URL, CLIENT_ID, CLIENT_SECRET
+from .client import moltin
+from .settings import (
+    ACCESS_TOKEN_LOCK_TIMEOUT,
+    ACCESS_TOKEN_REFRESH_MARGIN,
+    CLIENT_ID,
+    CLIENT_SECRET,
+)
+
+logger = logging.getLogger(__name__)
+
+ACCESS_TOKEN_KEY = 'access_token'
+ACCESS_TOKEN_LOCK_KEY = 'access_token:lock'
+
+# The lock expires on its own, so a worker deletes it only while it still
+# holds its own value, not the lock taken by another worker since.
+RELEASE_LOCK_SCRIPT = '''
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+'''
+
+_token_lock = threading.Lock()
+_token = {
+    'value': None,
+    'expires_at': 0,
+    'refreshing': False,
+    'redis_db': None,
+    'refresh': None,
+}
 
 
 def get_access_token(redis_db):
     """
     Get access token and store it in DB.
 
+    The token is kept in process memory and refreshed in the background
+    ACCESS_TOKEN_REFRESH_MARGIN seconds before it expires.
+
     Returns:
         return: access token.
 
     Args:
         redis_db: database.
     """
-    access_token = redis_db.get('access_token')
-    if not access_token:
-        access_token, time_to_expire = get_auth_data()
-        redis_db.set(
-            'access_token',
-            access_token,
-            ex=time_to_expire,
+    _token['redis_db'] = redis_db
+    access_token = _token['value']
+    time_to_expire = _token['expires_at'] - time.time()
+
+    if not access_token or time_to_expire <= 0:
+        return refresh_access_token(redis_db)
+
+    if time_to_expire < ACCESS_TOKEN_REFRESH_MARGIN:
+        _start_token_refresh(redis_db)
+
+    return access_token
+
+
+def refresh_access_token(redis_db, rejected_token=None):
+    """
+    Refresh access token.
+
+    Only one thread of the process refreshes the token, the others wait
+    for it and reuse the result.
+
+    Returns:
+        return: access token.
+
+    Args:
+        redis_db: database.
+        rejected_token: token the API answered 401 to, if any.
+    """
+    while True:
+        with _token_lock:
+            access_token = _token['value']
+            time_to_expire = _token['expires_at'] - time.time()
+            is_valid = time_to_expire > ACCESS_TOKEN_REFRESH_MARGIN
+            if access_token and access_token != rejected_token and is_valid:
+                return access_token
+
+            refresh = _token['refresh']
+            if refresh is None:
+                refresh = Future()
+                _token['refresh'] = refresh
+                break
+
+        # The lock is not held while another thread waits for Redis and
+        # the API, so threads with a valid token are not blocked.
+        access_token = refresh.result()
+        if access_token != rejected_token:
+            return access_token
+
+    try:
+        access_token, time_to_expire = _get_shared_token(
+            redis_db,
+            rejected_token,
         )
+    except Exception as err:
+        with _token_lock:
+            _token['refresh'] = None
+        refresh.set_exception(err)
+        raise
+
+    with _token_lock:
+        _token['value'] = access_token
+        _token['expires_at'] = time.time() + time_to_expire
+        _token['refresh'] = None
+    refresh.set_result(access_token)
 
     return access_token
 
@@ -40,9 +131,79 @@ def get_auth_data():
         'grant_type': 'client_credentials',
     }
 
-    api_url = '{0}/oauth/access_token'.format(API_BASE_URL)
-    response = requests.post(url=api_url, data=payload)
-    response.raise_for_status()
+    response = moltin.post('/oauth/access_token', data=payload)
     auth_data = response.json()
 
     return auth_data['access_token'], auth_data['expires_in']
+
+
+def _get_shared_token(redis_db, rejected_token):
+    deadline = time.time() + ACCESS_TOKEN_LOCK_TIMEOUT
+    while time.time() < deadline:
+        pipeline = redis_db.pipeline()
+        pipeline.get(ACCESS_TOKEN_KEY)
+        pipeline.ttl(ACCESS_TOKEN_KEY)
+        access_token, time_to_expire = pipeline.execute()
+
+        is_fresh = (time_to_expire or 0) > ACCESS_TOKEN_REFRESH_MARGIN
+        if access_token and access_token != rejected_token and is_fresh:
+            return access_token, time_to_expire
+
+        lock_value = secrets.token_hex(16)
+        is_locked = redis_db.set(
+            ACCESS_TOKEN_LOCK_KEY,
+            lock_value,
+            nx=True,
+            ex=ACCESS_TOKEN_LOCK_TIMEOUT,
+        )
+        if is_locked:
+            try:
+                return _store_new_token(redis_db)
+            finally:
+                release_lock = redis_db.register_script(RELEASE_LOCK_SCRIPT)
+                release_lock(keys=[ACCESS_TOKEN_LOCK_KEY], args=[lock_value])
+
+        time.sleep(0.1)
+
+    logger.warning('Access token lock timed out, fetching the token anyway')
+
+    return _store_new_token(redis_db)
+
+
+def _store_new_token(redis_db):
+    access_token, time_to_expire = get_auth_data()
+    redis_db.set(ACCESS_TOKEN_KEY, access_token, ex=time_to_expire)
+
+    return access_token, time_to_expire
+
+
+def _start_token_refresh(redis_db):
+    if _token['refreshing']:
+        return
+    _token['refreshing'] = True
+
+    threading.Thread(
+        target=_refresh_in_background,
+        args=(redis_db,),
+        daemon=True,
+    ).start()
+
+
+def _refresh_in_background(redis_db):
+    try:
+        refresh_access_token(redis_db)
+    except Exception as err:
+        logger.error('Access token refresh failed: {0}'.format(err))
+    finally:
+        _token['refreshing'] = False
+
+
+def _refresh_rejected_token(rejected_token):
+    redis_db = _token['redis_db']
+    if redis_db is None:
+        return None
+
+    return refresh_access_token(redis_db, rejected_token)
+
+
+moltin.token_refresher = _refresh_rejected_token
@@ -1,8 +1,6 @@
 """Functions for manipulating with Carts in Moltin API."""
 
-import requests
-
-from .settings import API_BASE_URL
+from .client import moltin
 
 
 def get_or_create_cart(access_token, cart_id):
@@ -16,13 +14,8 @@ def get_or_create_cart(access_token, cart_id):
         access_token: required to get access to the API.
         cart_id: ID for the cart that the customer created.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-    }
-
-    api_url = '{0}/v2/carts/{1}'.format(API_BASE_URL, cart_id)
-    response = requests.get(url=api_url, headers=headers)
-    response.raise_for_status()
+    api_path = '/v2/carts/{0}'.format(cart_id)
+    response = moltin.get(api_path, access_token)
 
     return response.json()
 
@@ -41,8 +34,6 @@ def add_product_to_cart(access_token, cart_id, product_id, product_amount):
         product_amount: number of products to add to the cart.
     """
     headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-        'Content-type': 'application/json',
         'X-MOLTIN-CURRENCY': 'RUB',
     }
 
@@ -53,10 +44,14 @@ def add_product_to_cart(access_token, cart_id, product_id, product_amount):
             'quantity': product_amount,
         },
     }
-    
-    api_url = '{0}/v2/carts/{1}/items'.format(API_BASE_URL, cart_id)
-    response = requests.post(url=api_url, headers=headers, json=payload)
-    response.raise_for_status()
+
+    api_path = '/v2/carts/{0}/items'.format(cart_id)
+    response = moltin.post(
+        api_path,
+        access_token,
+        headers=headers,
+        json=payload,
+    )
 
     return response.json()
 
@@ -72,13 +67,8 @@ def get_cart_items(access_token, cart_id):
         access_token: required to get access to the API.
         cart_id: ID for the cart that the customer created.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-    }
-
-    api_url = '{0}/v2/carts/{1}/items'.format(API_BASE_URL, cart_id)
-    response = requests.get(url=api_url, headers=headers)
-    response.raise_for_status()
+    api_path = '/v2/carts/{0}/items'.format(cart_id)
+    response = moltin.get(api_path, access_token)
 
     return response.json()
 
@@ -95,15 +85,34 @@ def delete_product_from_cart(access_token, cart_id, product_id):
         cart_id: ID for the cart that the customer created.
         product_id: ID of the product you want to remove from cart.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
+    api_path = '/v2/carts/{0}/items/{1}'.format(cart_id, product_id)
+    response = moltin.delete(api_path, access_token)
+
+    return response.json()
+
+
+def update_cart_item_quantity(access_token, cart_id, item_id, quantity):
+    """
+    Set quantity of the cart item.
+
+    Returns:
+        return: returns cart items.
+
+    Args:
+        access_token: required to get access to the API.
+        cart_id: ID for the cart that the customer created.
+        item_id: ID of the cart item.
+        quantity: new number of products in the cart item.
+    """
+    payload = {
+        'data': {
+            'id': item_id,
+            'type': 'cart_item',
+            'quantity': quantity,
+        },
     }
-    api_url = '{0}/v2/carts/{1}/items/{2}'.format(
-        API_BASE_URL,
-        cart_id,
-        product_id,
-    )
-    response = requests.delete(url=api_url, headers=headers)
-    response.raise_for_status()
+
+    api_path = '/v2/carts/{0}/items/{1}'.format(cart_id, item_id)
+    response = moltin.put(api_path, access_token, json=payload)
 
     return response.json()
@@ -0,0 +1,273 @@
+"""HTTP client for the Moltin API."""
+
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ..metrics import Gauge, normalize_endpoint, observe_request
+from .ratelimit import (
+    RequestScheduler,
+    get_request_priority,
+    get_retry_after,
+)
+from .settings import (
+    API_BASE_URL,
+    MOLTIN_CONNECT_TIMEOUT,
+    MOLTIN_FILES_READ_TIMEOUT,
+    MOLTIN_POOL_SIZE,
+    MOLTIN_RATE_BURST,
+    MOLTIN_RATE_LIMIT,
+    MOLTIN_READ_TIMEOUT,
+    MOLTIN_RETRIES,
+    MOLTIN_RETRY_BACKOFF,
+)
+
+RETRY_STATUSES = (500, 502, 503, 504)
+RATE_LIMITED_STATUS = 429
+
+
+class MoltinClient:
+    """Keep-alive client with a connection pool for the Moltin API."""
+
+    def __init__(
+        self,
+        base_url,
+        pool_size,
+        retries,
+        backoff_factor,
+        timeouts,
+        default_timeout,
+        scheduler,
+    ):
+        """
+        Create the client.
+
+        Args:
+            base_url: URL of the API.
+            pool_size: number of connections kept alive.
+            retries: number of retries for idempotent requests.
+            backoff_factor: factor of the delay between retries.
+            timeouts: timeouts by the path prefix of the endpoint.
+            default_timeout: timeout for other endpoints.
+            scheduler: scheduler limiting the request rate.
+        """
+        self.base_url = base_url
+        self.timeouts = timeouts
+        self.default_timeout = default_timeout
+        self.scheduler = scheduler
+        self.retries = retries
+        self.token_refresher = None
+
+        # Retry's default method whitelist holds idempotent methods only,
+        # so POST requests are never repeated.
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount(base_url, adapter)
+
+    def request(self, method, path, access_token=None, headers=None, **kwargs):
+        """
+        Send request to the API.
+
+        Requests wait for their turn in the scheduler by the priority of
+        the caller, a request answered with 429 is sent again after the
+        time the API asked to wait. A request rejected with 401 is sent
+        once more with a refreshed access token.
+
+        Returns:
+            return: response of the API.
+
+        Args:
+            method: HTTP method.
+            path: path of the endpoint.
+            access_token: required to get access to the API.
+            headers: additional headers.
+            kwargs: other arguments for the request.
+        """
+        kwargs.setdefault('timeout', self.get_timeout(path))
+        response = self._send(method, path, access_token, headers, **kwargs)
+
+        is_rejected = response.status_code == 401 and access_token
+        if is_rejected and self.token_refresher is not None:
+            access_token = self.token_refresher(access_token)
+            if access_token:
+                response = self._send(
+                    method,
+                    path,
+                    access_token,
+                    headers,
+                    **kwargs,
+                )
+
+        response.raise_for_status()
+
+        return response
+
+    def get(self, path, access_token=None, **kwargs):
+        """
+        Send GET request to the API.
+
+        Returns:
+            return: response of the API.
+
+        Args:
+            path: path of the endpoint.
+            access_token: required to get access to the API.
+            kwargs: other arguments for the request.
+        """
+        return self.request('GET', path, access_token, **kwargs)
+
+    def post(self, path, access_token=None, **kwargs):
+        """
+        Send POST request to the API.
+
+        Returns:
+            return: response of the API.
+
+        Args:
+            path: path of the endpoint.
+            access_token: required to get access to the API.
+            kwargs: other arguments for the request.
+        """
+        return self.request('POST', path, access_token, **kwargs)
+
+    def put(self, path, access_token=None, **kwargs):
+        """
+        Send PUT request to the API.
+
+        Returns:
+            return: response of the API.
+
+        Args:
+            path: path of the endpoint.
+            access_token: required to get access to the API.
+            kwargs: other arguments for the request.
+        """
+        return self.request('PUT', path, access_token, **kwargs)
+
+    def delete(self, path, access_token=None, **kwargs):
+        """
+        Send DELETE request to the API.
+
+        Returns:
+            return: response of the API.
+
+        Args:
+            path: path of the endpoint.
+            access_token: required to get access to the API.
+            kwargs: other arguments for the request.
+        """
+        return self.request('DELETE', path, access_token, **kwargs)
+
+    def get_timeout(self, path):
+        """
+        Get timeout for the endpoint.
+
+        Returns:
+            return: connect and read timeouts.
+
+        Args:
+            path: path of the endpoint.
+        """
+        for prefix, timeout in self.timeouts.items():
+            if path.startswith(prefix):
+                return timeout
+
+        return self.default_timeout
+
+    def _send(self, method, path, access_token, headers, **kwargs):
+        priority = get_request_priority()
+        for _ in range(self.retries + 1):
+            self.scheduler.acquire(priority)
+            response = self._send_request(
+                method,
+                path,
+                access_token,
+                headers,
+                **kwargs,
+            )
+            if response.status_code != RATE_LIMITED_STATUS:
+                break
+            self.scheduler.pause(get_retry_after(response))
+
+        return response
+
+    def _send_request(self, method, path, access_token, headers, **kwargs):
+        request_headers = {}
+        if access_token:
+            request_headers['Authorization'] = 'Bearer {0}'.format(
+                access_token,
+            )
+        request_headers.update(headers or {})
+
+        endpoint = normalize_endpoint(path)
+        started_at = time.monotonic()
+        try:
+            response = self.session.request(
+                method,
+                '{0}{1}'.format(self.base_url, path),
+                headers=request_headers,
+                **kwargs,
+            )
+        except requests.RequestException as err:
+            observe_request('moltin', endpoint, started_at, type(err).__name__)
+            raise
+        observe_request(
+            'moltin',
+            endpoint,
+            started_at,
+            response.status_code if response.status_code >= 400 else None,
+        )
+
+        return response
+
+
+moltin = MoltinClient(
+    base_url=API_BASE_URL,
+    pool_size=MOLTIN_POOL_SIZE,
+    retries=MOLTIN_RETRIES,
+    backoff_factor=MOLTIN_RETRY_BACKOFF,
+    timeouts={
+        '/v2/files': (MOLTIN_CONNECT_TIMEOUT, MOLTIN_FILES_READ_TIMEOUT),
+    },
+    default_timeout=(MOLTIN_CONNECT_TIMEOUT, MOLTIN_READ_TIMEOUT),
+    scheduler=RequestScheduler(MOLTIN_RATE_LIMIT, MOLTIN_RATE_BURST),
+)
+
+
+def _get_queue_depths():
+    stats = moltin.scheduler.get_stats()
+
+    return {
+        ('interactive',): stats['interactive_queue_depth'],
+        ('background',): stats['background_queue_depth'],
+    }
+
+
+Gauge(
+    'moltin_queue_depth',
+    'Moltin requests waiting for the rate limit.',
+    _get_queue_depths,
+    ('priority',),
+)
+Gauge(
+    'moltin_throttled_requests',
+    'Moltin requests that waited for the rate limit since the start.',
+    lambda: moltin.scheduler.throttled_count,
+)
+Gauge(
+    'moltin_rate_limited_responses',
+    'Moltin responses with 429 status since the start.',
+    lambda: moltin.scheduler.rate_limited_count,
+)
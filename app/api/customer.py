@@ -1,7 +1,6 @@
 """Customer functions for Moltin API."""
 
-import requests
-from .settings import API_BASE_URL
+from .client import moltin
 
 
 def create_customer(access_token, chat_id, email):
@@ -16,9 +15,6 @@ def create_customer(access_token, chat_id, email):
         chat_id: ID for the customer.
         email: the customer email.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-    }
     payload = {
         'data': {
             'type': 'customer',
@@ -26,9 +22,7 @@ def create_customer(access_token, chat_id, email):
             'email': email,
         },
     }
-    api_url = '{0}/v2/customers/'.format(API_BASE_URL)
-    response = requests.post(url=api_url, headers=headers, json=payload)
-    response.raise_for_status()
+    response = moltin.post('/v2/customers/', access_token, json=payload)
 
     return response.json()['data']['id']
 
@@ -42,10 +36,6 @@ def create_customer_address(access_token, customer_position, cart_id):
         customer_position: location of customer.
         cart_id: ID for the customer's cart.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-    }
-
     longitude, latitude = customer_position
     payload = {
         'data': {
@@ -55,7 +45,5 @@ def create_customer_address(access_token, customer_position, cart_id):
             'cart-id': cart_id,
         }
     }
-    api_url = '{0}/v2/flows/customer-address/entries'.format(API_BASE_URL)
-
-    response = requests.post(url=api_url, headers=headers, data=payload)
-    response.raise_for_status()
+    api_path = '/v2/flows/customer-address/entries'
+    moltin.post(api_path, access_token, data=payload)
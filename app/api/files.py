@@ -1,26 +1,37 @@
 """Functions for manipulating files."""
 
+import hashlib
+import json
 import os
+import tempfile
+import threading
 from urllib.parse import urlparse
 
-import requests
-from slugify import slugify
+from PIL import Image
 
-from .settings import API_BASE_URL
+from .client import moltin
+from .settings import PICTURE_MAX_SIZE, PICTURE_QUALITY, PICTURES_DIR
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+UPLOADED_PICTURES_FILE = 'uploaded.json'
+
+_uploaded_pictures_lock = threading.Lock()
 
 
 def download_picture(product):
     """
     Download picture for the product.
 
+    The picture is streamed to disk and named by the hash of its content,
+    so different products never overwrite each other's pictures.
+
     Returns:
         return: path for the picture file.
 
     Args:
         product: piece of information about for the product.
     """
-    os.makedirs('./pictures', exist_ok=True)
-    product_name = slugify(product['name'])
+    os.makedirs(PICTURES_DIR, exist_ok=True)
 
     picture_url = product['product_image']['url']
     parsed_url = urlparse(picture_url)
@@ -28,17 +39,63 @@ def download_picture(product):
         os.path.basename(parsed_url.path),
     )[-1]
 
-    picture_name = '{0}{1}'.format(product_name, file_extension)
-    picture_path = os.path.join('pictures', picture_name)
-
-    response = requests.get(picture_url)
+    picture_hash = hashlib.sha256()
+    response = moltin.session.get(
+        picture_url,
+        timeout=moltin.default_timeout,
+        stream=True,
+    )
     response.raise_for_status()
-    with open(picture_path, 'wb') as picture_file:
-        picture_file.write(response.content)
+    picture_file = tempfile.NamedTemporaryFile(dir=PICTURES_DIR, delete=False)
+    try:
+        with response, picture_file:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                picture_hash.update(chunk)
+                picture_file.write(chunk)
+    except BaseException:
+        # The import may be interrupted and resumed, so no partial
+        # download is left behind.
+        os.remove(picture_file.name)
+        raise
+
+    picture_name = '{0}{1}'.format(picture_hash.hexdigest(), file_extension)
+    picture_path = os.path.join(PICTURES_DIR, picture_name)
+    os.replace(picture_file.name, picture_path)
 
     return picture_path
 
 
+def resize_picture(picture):
+    """
+    Resize and recompress the picture for Telegram.
+
+    Returns:
+        return: path for the resized picture file.
+
+    Args:
+        picture: path for the picture file.
+    """
+    picture_name = os.path.splitext(os.path.basename(picture))[0]
+    resized_path = os.path.join(
+        PICTURES_DIR,
+        '{0}_{1}.jpg'.format(picture_name, PICTURE_MAX_SIZE),
+    )
+    if os.path.exists(resized_path):
+        return resized_path
+
+    with Image.open(picture) as image:
+        image.thumbnail((PICTURE_MAX_SIZE, PICTURE_MAX_SIZE))
+        image.convert('RGB').save(
+            resized_path,
+            'JPEG',
+            quality=PICTURE_QUALITY,
+            optimize=True,
+            progressive=True,
+        )
+
+    return resized_path
+
+
 def create_picture(access_token, picture):
     """
     Create picture for the product.
@@ -50,17 +107,61 @@ def create_picture(access_token, picture):
         access_token: required to get access to the API.
         picture: the picture you want to upload.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-    }
+    with open(picture, 'rb') as picture_file:
+        response = moltin.post(
+            '/v2/files',
+            access_token,
+            files={'file': picture_file},
+            data={'public': 'true'},
+        )
+
+    return response.json()['data']['id']
 
-    files = {
-        'file': open(picture, 'rb'),
-        'public': True,
-    }
 
-    api_url = '{0}/v2/files'.format(API_BASE_URL)
-    response = requests.post(url=api_url, headers=headers, files=files)
-    response.raise_for_status()
+def upload_picture(access_token, product):
+    """
+    Download, resize and upload picture for the product.
 
-    return response.json()['data']['id']
+    Pictures already uploaded are found by the hash of their content and
+    are not uploaded again.
+
+    Returns:
+        return: ID of the picture.
+
+    Args:
+        access_token: required to get access to the API.
+        product: piece of information about for the product.
+    """
+    picture_path = download_picture(product)
+    picture_hash = os.path.splitext(os.path.basename(picture_path))[0]
+
+    with _uploaded_pictures_lock:
+        picture_id = _load_uploaded_pictures().get(picture_hash)
+    if picture_id:
+        return picture_id
+
+    picture_id = create_picture(access_token, resize_picture(picture_path))
+
+    with _uploaded_pictures_lock:
+        uploaded_pictures = _load_uploaded_pictures()
+        uploaded_pictures[picture_hash] = picture_id
+        _save_uploaded_pictures(uploaded_pictures)
+
+    return picture_id
+
+
+def _load_uploaded_pictures():
+    uploaded_path = os.path.join(PICTURES_DIR, UPLOADED_PICTURES_FILE)
+    if not os.path.exists(uploaded_path):
+        return {}
+
+    with open(uploaded_path) as uploaded_file:
+        return json.load(uploaded_file)
+
+
+def _save_uploaded_pictures(uploaded_pictures):
+    uploaded_path = os.path.join(PICTURES_DIR, UPLOADED_PICTURES_FILE)
+    temporary_path = '{0}.tmp'.format(uploaded_path)
+    with open(temporary_path, 'w') as uploaded_file:
+        json.dump(uploaded_pictures, uploaded_file)
+    os.replace(temporary_path, uploaded_path)
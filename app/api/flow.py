@@ -1,25 +1,24 @@
 """Functions for flow actions."""
 
-import requests
 from slugify import slugify
 
-from .settings import API_BASE_URL
+from .client import moltin
+
+ENTRIES_PAGE_LIMIT = 100
 
 
 def create_flow(access_token, name, description):
     """
     Create flow.
 
+    Returns:
+        return: ID of the flow.
+
     Args:
         access_token: required to get access to the API.
         name: specifies the name of the flow.
         description: specifies the description for the flow.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-        'Content-Type': 'application/json',
-    }
-
     payload = {
         'data': {
             'type': 'flow',
@@ -30,9 +29,9 @@ def create_flow(access_token, name, description):
         },
     }
 
-    api_url = '{0}/v2/flows'.format(API_BASE_URL)
-    response = requests.post(url=api_url, headers=headers, json=payload)
-    response.raise_for_status()
+    response = moltin.post('/v2/flows', access_token, json=payload)
+
+    return response.json()['data']['id']
 
 
 def create_flow_field(access_token, name, description, flow_id):
@@ -45,11 +44,6 @@ def create_flow_field(access_token, name, description, flow_id):
         description: specifies the description for this field.
         flow_id: id for the flow to create the field.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-        'Content-Type': 'application/json',
-    }
-
     payload = {
         'data': {
             'type': 'field',
@@ -71,9 +65,7 @@ def create_flow_field(access_token, name, description, flow_id):
         },
     }
 
-    api_url = '{0}/v2/fields'.format(API_BASE_URL)
-    response = requests.post(url=api_url, headers=headers, json=payload)
-    response.raise_for_status()
+    moltin.post('/v2/fields', access_token, json=payload)
 
 
 def create_entry(access_token, entry_data, flow_slug):
@@ -85,14 +77,34 @@ def create_entry(access_token, entry_data, flow_slug):
         entry_data: piece of information to create entry with needed data.
         flow_slug: slug for the flow to create an entry.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-        'Content-Type': 'application/json',
+    payload = {
+        'data': {
+            'type': 'entry',
+            'address': entry_data['address']['full'],
+            'alias': entry_data['alias'],
+            'longitude': entry_data['coordinates']['lon'],
+            'latitude': entry_data['coordinates']['lat'],
+        },
     }
 
+    api_path = '/v2/flows/{0}/entries'.format(flow_slug)
+    moltin.post(api_path, access_token, json=payload)
+
+
+def update_entry(access_token, entry_id, entry_data, flow_slug):
+    """
+    Update entry in flow.
+
+    Args:
+        access_token: required to get access to the API.
+        entry_id: specifies an entry to update.
+        entry_data: piece of information to update entry with needed data.
+        flow_slug: slug for the flow of the entry.
+    """
     payload = {
         'data': {
             'type': 'entry',
+            'id': entry_id,
             'address': entry_data['address']['full'],
             'alias': entry_data['alias'],
             'longitude': entry_data['coordinates']['lon'],
@@ -100,15 +112,29 @@ def create_entry(access_token, entry_data, flow_slug):
         },
     }
 
-    api_url = '{0}/v2/flows/{1}/entries'.format(API_BASE_URL, flow_slug)
-    response = requests.post(url=api_url, headers=headers, json=payload)
-    response.raise_for_status()
+    api_path = '/v2/flows/{0}/entries/{1}'.format(flow_slug, entry_id)
+    moltin.put(api_path, access_token, json=payload)
+
+
+def delete_entry(access_token, entry_id, flow_slug):
+    """
+    Delete entry from flow.
+
+    Args:
+        access_token: required to get access to the API.
+        entry_id: specifies an entry to delete.
+        flow_slug: slug for the flow of the entry.
+    """
+    api_path = '/v2/flows/{0}/entries/{1}'.format(flow_slug, entry_id)
+    moltin.delete(api_path, access_token)
 
 
 def get_entries(access_token, flow_slug):
     """
     Get all entries of chosen flow.
 
+    Entries are requested page by page until the last one.
+
     Returns:
         return: data about all entries.
 
@@ -117,15 +143,18 @@ def get_entries(access_token, flow_slug):
         flow_slug: specifies the slug of the flow.
 
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-    }
+    api_path = '/v2/flows/{0}/entries'.format(flow_slug)
 
-    api_url = '{0}/v2/flows/{1}/entries'.format(API_BASE_URL, flow_slug)
-    response = requests.get(url=api_url, headers=headers)
-    response.raise_for_status()
-
-    return response.json()['data']
+    entries = []
+    while True:
+        response = moltin.get(api_path, access_token, params={
+            'page[limit]': ENTRIES_PAGE_LIMIT,
+            'page[offset]': len(entries),
+        })
+        page_entries = response.json()['data']
+        entries.extend(page_entries)
+        if len(page_entries) < ENTRIES_PAGE_LIMIT:
+            return entries
 
 
 def get_entry(access_token, flow_slug, entry_id):
@@ -141,17 +170,8 @@ def get_entry(access_token, flow_slug, entry_id):
         entry_id: specifies an entry to return data.
 
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-    }
-
-    api_url = '{0}/v2/flows/{1}/entries/{2}'.format(
-        API_BASE_URL,
-        flow_slug,
-        entry_id,
-    )
-    response = requests.get(url=api_url, headers=headers)
-    response.raise_for_status()
+    api_path = '/v2/flows/{0}/entries/{1}'.format(flow_slug, entry_id)
+    response = moltin.get(api_path, access_token)
 
     return response.json()['data']
 
@@ -168,12 +188,39 @@ def get_flow(access_token, flow_id):
         flow_id: specifies the id of the flow.
 
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-    }
+    api_path = '/v2/flows/{0}'.format(flow_id)
+    response = moltin.get(api_path, access_token)
 
-    api_url = '{0}/v2/flows/{1}'.format(API_BASE_URL, flow_id)
-    response = requests.get(url=api_url, headers=headers)
-    response.raise_for_status()
+    return response.json()['data']
+
+
+def get_flows(access_token):
+    """
+    Get all flows.
+
+    Returns:
+        return: data about all flows.
+
+    Args:
+        access_token: required to get access to the API.
+    """
+    response = moltin.get('/v2/flows', access_token)
+
+    return response.json()['data']
+
+
+def get_flow_fields(access_token, flow_slug):
+    """
+    Get fields of the flow.
+
+    Returns:
+        return: data about all fields of the flow.
+
+    Args:
+        access_token: required to get access to the API.
+        flow_slug: specifies the slug of the flow.
+    """
+    api_path = '/v2/flows/{0}/fields'.format(flow_slug)
+    response = moltin.get(api_path, access_token)
 
     return response.json()['data']
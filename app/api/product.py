@@ -1,9 +1,38 @@
 """Functions for product actions."""
 
-import requests
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
 from slugify import slugify
 
-from .settings import API_BASE_URL
+from ..metrics import CACHE_REQUESTS
+from .client import moltin
+from .ratelimit import BACKGROUND, request_priority
+from .settings import (
+    CATALOG_CACHE_TTL,
+    CATALOG_VERSION_CHECK_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+CATALOG_KEY = 'catalog:products'
+CATALOG_VERSION_KEY = 'catalog:version'
+PRODUCTS_PAGE_LIMIT = 100
+
+_catalog_lock = threading.Lock()
+_catalog = {
+    'version': None,
+    'products': None,
+    'products_by_id': {},
+    'fetched_at': 0,
+    'checked_at': 0,
+    'refreshing': False,
+    'refresh': None,
+}
 
 
 def create_product(access_token, product):
@@ -17,11 +46,6 @@ def create_product(access_token, product):
         access_token: required to get access to the API.
         product: piece of information about for the product.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-        'Content-type': 'application/json',
-    }
-
     payload = {
         'data': {
             'type': 'product',
@@ -42,13 +66,42 @@ def create_product(access_token, product):
         },
     }
 
-    api_url = '{0}/v2/products'.format(API_BASE_URL)
-    response = requests.post(url=api_url, headers=headers, json=payload)
-    response.raise_for_status()
+    response = moltin.post('/v2/products', access_token, json=payload)
 
     return response.json()['data']['id']
 
 
+def update_product(access_token, product_id, product):
+    """
+    Update attributes of the product.
+
+    Args:
+        access_token: required to get access to the API.
+        product_id: the ID of the product you want to update.
+        product: piece of information about for the product.
+    """
+    payload = {
+        'data': {
+            'type': 'product',
+            'id': product_id,
+            'name': product['name'],
+            'slug': slugify(product['name']),
+            'sku': str(product['id']),
+            'description': product['description'],
+            'price': [
+                {
+                    'amount': product['price'],
+                    'currency': 'RUB',
+                    'includes_tax': True,
+                },
+            ],
+        },
+    }
+
+    api_path = '/v2/products/{0}'.format(product_id)
+    moltin.put(api_path, access_token, json=payload)
+
+
 def link_picture_to_product(access_token, product_id, picture_id):
     """
     Create product relationship to the picture.
@@ -58,11 +111,6 @@ def link_picture_to_product(access_token, product_id, picture_id):
         product_id: the ID of the product you want to relate to the image.
         picture_id: the ID of the image.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-        'Content-Type': 'application/json',
-    }
-
     payload = {
         'data': {
             'type': 'main_image',
@@ -70,36 +118,34 @@ def link_picture_to_product(access_token, product_id, picture_id):
         },
     }
 
-    api_url = '{0}/v2/products/{1}/relationships/main-image'.format(
-        API_BASE_URL,
+    api_path = '/v2/products/{0}/relationships/main-image'.format(
         product_id,
     )
-    response = requests.post(url=api_url, headers=headers, json=payload)
-    response.raise_for_status()
+    moltin.post(api_path, access_token, json=payload)
 
 
 def get_all_products(access_token):
     """
     Get all products.
 
+    Products are requested page by page until the last one.
+
     Returns:
         return: a list with all products.
 
     Args:
         access_token: required to get access to the API.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-        'content-type': 'application/json',
-    }
-    api_url = '{0}/v2/products'.format(API_BASE_URL)
-    response = requests.get(url=api_url, headers=headers)
-    response.raise_for_status()
-    products = response.json()
-
-    all_products = [product for product in products['data']]
-
-    return all_products
+    all_products = []
+    while True:
+        response = moltin.get('/v2/products', access_token, params={
+            'page[limit]': PRODUCTS_PAGE_LIMIT,
+            'page[offset]': len(all_products),
+        })
+        page_products = response.json()['data']
+        all_products.extend(page_products)
+        if len(page_products) < PRODUCTS_PAGE_LIMIT:
+            return all_products
 
 
 def get_product_by_id(access_token, product_id):
@@ -113,12 +159,8 @@ def get_product_by_id(access_token, product_id):
         access_token: required to get access to the API.
         product_id: specifies needed product.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-    }
-    api_url = '{0}/v2/products/{1}'.format(API_BASE_URL, product_id)
-    response = requests.get(url=api_url, headers=headers)
-    response.raise_for_status()
+    api_path = '/v2/products/{0}'.format(product_id)
+    response = moltin.get(api_path, access_token)
 
     return response.json()['data']
 
@@ -134,11 +176,220 @@ def get_product_photo_by_id(access_token, product_id):
         access_token: required to get access to the API.
         product_id: specifies needed product.
     """
-    headers = {
-        'Authorization': 'Bearer {0}'.format(access_token),
-    }
-    api_url = '{0}/v2/files/{1}'.format(API_BASE_URL, product_id)
-    response = requests.get(url=api_url, headers=headers)
-    response.raise_for_status()
+    api_path = '/v2/files/{0}'.format(product_id)
+    response = moltin.get(api_path, access_token)
 
     return response.json()['data']['link']['href']
+
+
+def get_cached_catalog(redis_db, access_token):
+    """
+    Get the catalog from the catalog cache.
+
+    The catalog is kept in process memory and shared between workers
+    through Redis. A stale catalog is still served while it is refreshed
+    in the background. Only one thread of the process fills the empty
+    cache, the others wait for it and reuse the result.
+
+    Returns:
+        return: version of the catalog and a list with all products.
+
+    Args:
+        redis_db: database for the shared catalog, can be None.
+        access_token: required to get access to the API.
+    """
+    with _catalog_lock:
+        version = _catalog['version']
+        products = _catalog['products']
+        is_stale = _is_catalog_stale(redis_db)
+
+    if products is None:
+        CACHE_REQUESTS.inc('catalog', 'miss')
+        catalog = _refresh_catalog(redis_db, access_token)
+        return catalog['version'], catalog['products']
+
+    if is_stale:
+        CACHE_REQUESTS.inc('catalog', 'stale')
+        _start_catalog_refresh(redis_db, access_token)
+    else:
+        CACHE_REQUESTS.inc('catalog', 'hit')
+
+    return version, products
+
+
+def get_cached_products(redis_db, access_token):
+    """
+    Get all products from the catalog cache.
+
+    Returns:
+        return: a list with all products.
+
+    Args:
+        redis_db: database for the shared catalog, can be None.
+        access_token: required to get access to the API.
+    """
+    _, products = get_cached_catalog(redis_db, access_token)
+
+    return products
+
+
+def get_cached_product(redis_db, access_token, product_id):
+    """
+    Get product by id from the catalog cache.
+
+    Returns:
+        return: data about the product.
+
+    Args:
+        redis_db: database for the shared catalog, can be None.
+        access_token: required to get access to the API.
+        product_id: specifies needed product.
+    """
+    get_cached_products(redis_db, access_token)
+    product = _catalog['products_by_id'].get(product_id)
+    if product is None:
+        product = get_product_by_id(access_token, product_id)
+
+    return product
+
+
+def invalidate_catalog(redis_db=None):
+    """
+    Drop the cached catalog so the next read fetches it from the API.
+
+    Other workers notice the invalidation within
+    CATALOG_VERSION_CHECK_INTERVAL seconds.
+
+    Args:
+        redis_db: database for the shared catalog, can be None.
+    """
+    with _catalog_lock:
+        _catalog['fetched_at'] = 0
+        _catalog['checked_at'] = 0
+
+    if redis_db is not None:
+        redis_db.delete(CATALOG_KEY, CATALOG_VERSION_KEY)
+
+
+def _is_catalog_stale(redis_db):
+    now = time.time()
+    if now - _catalog['fetched_at'] > CATALOG_CACHE_TTL:
+        return True
+
+    if redis_db is None:
+        return False
+
+    if now - _catalog['checked_at'] < CATALOG_VERSION_CHECK_INTERVAL:
+        return False
+
+    _catalog['checked_at'] = now
+
+    return redis_db.get(CATALOG_VERSION_KEY) != _catalog['version']
+
+
+def _start_catalog_refresh(redis_db, access_token):
+    with _catalog_lock:
+        if _catalog['refreshing']:
+            return
+        _catalog['refreshing'] = True
+
+    threading.Thread(
+        target=_refresh_catalog_in_background,
+        args=(redis_db, access_token),
+        daemon=True,
+    ).start()
+
+
+def _refresh_catalog_in_background(redis_db, access_token):
+    with request_priority(BACKGROUND):
+        _refresh_catalog(redis_db, access_token)
+
+
+def _refresh_catalog(redis_db, access_token):
+    with _catalog_lock:
+        refresh = _catalog['refresh']
+        is_refreshing = refresh is not None
+        if not is_refreshing:
+            refresh = Future()
+            _catalog['refresh'] = refresh
+
+    # Handlers missing the cold cache at once wait for the same pages
+    # instead of fetching the whole catalog each.
+    if is_refreshing:
+        return refresh.result()
+
+    try:
+        catalog = _update_catalog(redis_db, access_token)
+    except Exception as err:
+        with _catalog_lock:
+            _catalog['refresh'] = None
+        refresh.set_exception(err)
+        raise
+
+    with _catalog_lock:
+        _catalog['refresh'] = None
+    refresh.set_result(catalog)
+
+    return catalog
+
+
+def _update_catalog(redis_db, access_token):
+    try:
+        catalog = None
+        if redis_db is not None:
+            catalog = _load_shared_catalog(redis_db)
+
+        if catalog is None:
+            catalog = _fetch_catalog(access_token)
+            if redis_db is not None:
+                _store_shared_catalog(redis_db, catalog)
+
+        with _catalog_lock:
+            _catalog.update(
+                version=catalog['version'],
+                products=catalog['products'],
+                products_by_id={
+                    product['id']: product
+                    for product in catalog['products']
+                },
+                fetched_at=catalog['fetched_at'],
+                checked_at=time.time(),
+            )
+    except Exception as err:
+        if _catalog['products'] is None:
+            raise
+        logger.error('Catalog refresh failed: {0}'.format(err))
+    finally:
+        _catalog['refreshing'] = False
+
+    return _catalog
+
+
+def _fetch_catalog(access_token):
+    products = get_all_products(access_token)
+    serialized_products = json.dumps(products, sort_keys=True)
+
+    return {
+        'version': hashlib.sha1(serialized_products.encode()).hexdigest(),
+        'products': products,
+        'fetched_at': time.time(),
+    }
+
+
+def _load_shared_catalog(redis_db):
+    serialized_catalog = redis_db.get(CATALOG_KEY)
+    if not serialized_catalog:
+        return None
+
+    catalog = json.loads(serialized_catalog)
+    if time.time() - catalog['fetched_at'] > CATALOG_CACHE_TTL:
+        return None
+
+    return catalog
+
+
+def _store_shared_catalog(redis_db, catalog):
+    pipeline = redis_db.pipeline()
+    pipeline.set(CATALOG_KEY, json.dumps(catalog), ex=CATALOG_CACHE_TTL)
+    pipeline.set(CATALOG_VERSION_KEY, catalog['version'])
+    pipeline.execute()
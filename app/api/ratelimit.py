@@ -0,0 +1,273 @@
+"""Rate limiting of requests to the Moltin API."""
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+DEFAULT_RETRY_AFTER = 1
+
+_request_priority = contextvars.ContextVar('request_priority')
+_default_priority = {'value': INTERACTIVE}
+
+
+class TokenBucket:
+    """
+    Token bucket of the request rate.
+
+    The bucket is not thread-safe, so it is guarded by the lock of its
+    owner.
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        Create the full bucket.
+
+        Args:
+            rate: number of tokens added per second.
+            capacity: maximum number of tokens, the allowed burst.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0
+
+    def get_wait(self):
+        """
+        Get time to wait for a token.
+
+        Returns:
+            return: seconds to wait, zero if a token is available.
+        """
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated_at) * self.rate,
+        )
+        self.updated_at = now
+
+        return max(
+            self.paused_until - now,
+            (1 - self.tokens) / self.rate,
+            0,
+        )
+
+    def consume(self):
+        """Take a token from the bucket."""
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        """
+        Hand out no tokens for a while.
+
+        Args:
+            seconds: duration of the pause.
+        """
+        self.paused_until = max(
+            self.paused_until,
+            time.monotonic() + seconds,
+        )
+        self.tokens = min(self.tokens, 0)
+
+
+class RequestScheduler:
+    """
+    Priority queue of requests in front of the token bucket.
+
+    Waiting requests are let through one at a time by priority, then by
+    arrival, so interactive requests jump ahead of background ones.
+    """
+
+    def __init__(self, rate, burst):
+        """
+        Create the scheduler.
+
+        Args:
+            rate: number of requests per second.
+            burst: number of requests allowed at once.
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.throttled_count = 0
+        self.rate_limited_count = 0
+        self._condition = threading.Condition()
+        self._queue = []
+        self._counter = itertools.count()
+        self._async_waiters = []
+
+    def acquire(self, priority=INTERACTIVE):
+        """
+        Wait until the request may be sent.
+
+        Args:
+            priority: priority of the request, lower goes first.
+        """
+        entry = (priority, next(self._counter))
+        is_throttled = False
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    wait = None
+                    if self._queue[0] == entry:
+                        wait = self.bucket.get_wait()
+                        if wait <= 0:
+                            break
+                    if not is_throttled:
+                        is_throttled = True
+                        self.throttled_count += 1
+                    self._condition.wait(wait)
+                self.bucket.consume()
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._notify_all()
+
+    async def acquire_async(self, priority=INTERACTIVE):
+        """
+        Wait until the request may be sent without blocking the loop.
+
+        The task waits in the same queue as the threads, and is woken up
+        by the scheduler instead of parking an executor thread.
+
+        Args:
+            priority: priority of the request, lower goes first.
+        """
+        loop = asyncio.get_running_loop()
+        entry = (priority, next(self._counter))
+        is_throttled = False
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+        try:
+            while True:
+                with self._condition:
+                    wait = None
+                    if self._queue[0] == entry:
+                        wait = self.bucket.get_wait()
+                        if wait <= 0:
+                            self.bucket.consume()
+                            return
+                    if not is_throttled:
+                        is_throttled = True
+                        self.throttled_count += 1
+                    wakeup = loop.create_future()
+                    self._async_waiters.append((loop, wakeup))
+                await asyncio.wait((wakeup,), timeout=wait)
+        finally:
+            with self._condition:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._notify_all()
+
+    def pause(self, seconds):
+        """
+        Stop sending requests after the API answered 429.
+
+        Args:
+            seconds: time the API asked to wait.
+        """
+        with self._condition:
+            self.rate_limited_count += 1
+            self.bucket.pause(seconds)
+            self._notify_all()
+
+    def get_stats(self):
+        """
+        Get state of the scheduler.
+
+        Returns:
+            return: queue depth by priority and throttle counters.
+        """
+        with self._condition:
+            priorities = [priority for priority, _ in self._queue]
+
+        return {
+            'interactive_queue_depth': priorities.count(INTERACTIVE),
+            'background_queue_depth': priorities.count(BACKGROUND),
+            'throttled_count': self.throttled_count,
+            'rate_limited_count': self.rate_limited_count,
+        }
+
+    def _notify_all(self):
+        self._condition.notify_all()
+        for loop, wakeup in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(_wake_up, wakeup)
+            except RuntimeError:
+                # The loop of the waiter is closed.
+                pass
+        self._async_waiters.clear()
+
+
+def _wake_up(wakeup):
+    if not wakeup.done():
+        wakeup.set_result(None)
+
+
+def get_request_priority():
+    """
+    Get priority of requests sent by the current thread or task.
+
+    Returns:
+        return: priority of the requests.
+    """
+    return _request_priority.get(_default_priority['value'])
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """
+    Send requests inside the block with the priority.
+
+    Args:
+        priority: priority of the requests.
+    """
+    token = _request_priority.set(priority)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+
+def set_default_priority(priority):
+    """
+    Set priority of requests sent outside of request_priority blocks.
+
+    Args:
+        priority: priority of the requests.
+    """
+    _default_priority['value'] = priority
+
+
+def get_retry_after(response):
+    """
+    Get time the API asked to wait before the next request.
+
+    Returns:
+        return: seconds to wait.
+
+    Args:
+        response: response of the API with 429 status.
+    """
+    retry_after = response.headers.get('Retry-After')
+    if not retry_after:
+        return DEFAULT_RETRY_AFTER
+
+    try:
+        return max(float(retry_after), 0)
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+    return max(retry_at.timestamp() - time.time(), 0)
@@ -5,6 +5,27 @@ from environs import Env
 env = Env()
 env.read_env()
 
-API_BASE_URL = 'https://api.moltin.com'
+API_BASE_URL = env.str('API_BASE_URL', 'https://api.moltin.com')
 CLIENT_ID = env.str('CLIENT_ID')
 CLIENT_SECRET = env.str('CLIENT_SECRET')
+
+CATALOG_CACHE_TTL = env.int('CATALOG_CACHE_TTL', 300)
+CATALOG_VERSION_CHECK_INTERVAL = env.int('CATALOG_VERSION_CHECK_INTERVAL', 10)
+
+MOLTIN_POOL_SIZE = env.int('MOLTIN_POOL_SIZE', 8)
+MOLTIN_RETRIES = env.int('MOLTIN_RETRIES', 2)
+MOLTIN_RETRY_BACKOFF = env.float('MOLTIN_RETRY_BACKOFF', 0.3)
+MOLTIN_CONNECT_TIMEOUT = env.float('MOLTIN_CONNECT_TIMEOUT', 3.05)
+MOLTIN_READ_TIMEOUT = env.float('MOLTIN_READ_TIMEOUT', 10)
+MOLTIN_FILES_READ_TIMEOUT = env.float('MOLTIN_FILES_READ_TIMEOUT', 60)
+MOLTIN_RATE_LIMIT = env.float('MOLTIN_RATE_LIMIT', 20)
+MOLTIN_RATE_BURST = env.int('MOLTIN_RATE_BURST', 20)
+
+ACCESS_TOKEN_REFRESH_MARGIN = env.int('ACCESS_TOKEN_REFRESH_MARGIN', 300)
+ACCESS_TOKEN_LOCK_TIMEOUT = env.int('ACCESS_TOKEN_LOCK_TIMEOUT', 10)
+
+MOLTIN_ASYNC_MAX_CONNECTIONS = env.int('MOLTIN_ASYNC_MAX_CONNECTIONS', 100)
+
+PICTURES_DIR = env.str('PICTURES_DIR', 'pictures')
+PICTURE_MAX_SIZE = env.int('PICTURE_MAX_SIZE', 1280)
+PICTURE_QUALITY = env.int('PICTURE_QUALITY', 85)
@@ -1,31 +1,127 @@
 """Cart fucntions for telegram bot."""
 
+import json
+import time
 from textwrap import dedent
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 from app.api.authentication import get_access_token
-from app.api.cart import get_cart_items
+from app.api.cart import (
+    add_product_to_cart,
+    delete_product_from_cart,
+    get_cart_items,
+    update_cart_item_quantity,
+)
+from app.bots.render import render_text
+from app.bots.settings import CART_MIRROR_MAX_AGE, SESSION_TTL
+from app.metrics import CACHE_REQUESTS
 
+CART_MIRROR_KEY = 'cart:{0}'
+CART_PENDING_KEY = 'cart:{0}:pending'
 
-def generate_cart(db, bot, update):
+
+def get_cart(db, access_token, chat_id, reconcile=False):
+    """
+    Get cart items from the cart mirror.
+
+    The mirror is reloaded from Moltin when it is missing, older than
+    CART_MIRROR_MAX_AGE or reconciliation is requested.
+
+    Returns:
+        return: data about the cart items.
+
+    Args:
+        db: database for the cart mirror.
+        access_token: required to get access to the API.
+        chat_id: ID of the chat and its cart.
+        reconcile: whether to reload the cart from Moltin.
+    """
+    if not reconcile:
+        serialized_mirror = db.get(CART_MIRROR_KEY.format(chat_id))
+        if serialized_mirror:
+            cart_mirror = json.loads(serialized_mirror)
+            if time.time() - cart_mirror['updated_at'] < CART_MIRROR_MAX_AGE:
+                CACHE_REQUESTS.inc('cart', 'hit')
+                return cart_mirror['cart_items']
+        CACHE_REQUESTS.inc('cart', 'miss')
+
+    cart_items = get_cart_items(access_token, chat_id)
+    store_cart_mirror(db, chat_id, cart_items)
+
+    return cart_items
+
+
+def store_cart_mirror(db, chat_id, cart_items):
     """
-    Generate cart keyboard.
+    Store cart items returned by Moltin in the cart mirror.
 
     Args:
-        db: database for access_token.
+        db: database for the cart mirror.
+        chat_id: ID of the chat and its cart.
+        cart_items: data about the cart items.
+    """
+    cart_mirror = {
+        'updated_at': time.time(),
+        'cart_items': cart_items,
+    }
+    db.set(
+        CART_MIRROR_KEY.format(chat_id),
+        json.dumps(cart_mirror),
+        ex=SESSION_TTL,
+    )
+
+
+def generate_cart(db, bot, update, cart_items=None):
+    """
+    Show the cart in place of the tapped message.
+
+    Args:
+        db: database for access_token and the cart mirror.
         bot: a pre-initialized bot instance.
         update: Update class instance that represents an incoming update.
+        cart_items: data about the cart items, taken from the cart
+            mirror if not passed.
     """
-    access_token = get_access_token(db)
     query = update.callback_query
-    cart_items = get_cart_items(access_token, query.message.chat_id)
+    if cart_items is None:
+        access_token = get_access_token(db)
+        cart_items = get_cart(db, access_token, query.message.chat_id)
+
+    cart_recipe, reply_markup = build_cart_message(cart_items)
+    render_text(
+        bot,
+        query.message.chat_id,
+        query.message,
+        cart_recipe,
+        reply_markup,
+    )
+
+
+def build_cart_message(cart_items):
+    """
+    Build text and keyboard of the cart message.
+
+    Returns:
+        return: text and keyboard markup of the cart.
+
+    Args:
+        cart_items: data about the cart items.
+    """
     keyboard = [
         [
             InlineKeyboardButton(
-                'Delete {0}'.format(cart_item['name']),
+                '➖',
+                callback_data='dec, {0}'.format(cart_item['product_id']),
+            ),
+            InlineKeyboardButton(
+                '❌ {0}'.format(cart_item['name']),
                 callback_data=cart_item['id'],
             ),
+            InlineKeyboardButton(
+                '➕',
+                callback_data='inc, {0}'.format(cart_item['product_id']),
+            ),
         ]
         for cart_item in cart_items['data']
     ]
@@ -34,19 +130,9 @@ def generate_cart(db, bot, update):
             InlineKeyboardButton('Menu', callback_data='menu'),
         ],
     )
-    reply_markup = InlineKeyboardMarkup(keyboard)
 
     if not cart_items['data']:
-        bot.send_message(
-            text='Cart is empty',
-            reply_markup=reply_markup,
-            chat_id=query.message.chat_id,
-        )
-        bot.delete_message(
-            chat_id=query.message.chat_id,
-            message_id=query.message.message_id,
-        )
-        return 'HANDLE_DESCRIPTION'
+        return 'Cart is empty', InlineKeyboardMarkup(keyboard)
 
     total = cart_items['meta']['display_price']['without_tax']['formatted']
     cart_description = []
@@ -70,14 +156,181 @@ def generate_cart(db, bot, update):
 
     cart_description.append('\n\nTotal: {0}'.format(total))
     cart_recipe = ''.join(cart_description)
-    keyboard.append([InlineKeyboardButton('Pay', callback_data='payment, {0}'.format(total_price))])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    bot.send_message(
-        text=cart_recipe,
-        reply_markup=reply_markup,
-        chat_id=query.message.chat_id,
-    )
-    bot.delete_message(
-        chat_id=query.message.chat_id,
-        message_id=query.message.message_id,
+    keyboard.append([InlineKeyboardButton('Pay', callback_data='payment')])
+
+    return cart_recipe, InlineKeyboardMarkup(keyboard)
+
+
+def change_cart_quantity(
+    db,
+    access_token,
+    chat_id,
+    product_id,
+    quantity_change,
+):
+    """
+    Change quantity of the product in the cart.
+
+    The change is only buffered, so it has to be flushed to Moltin with
+    flush_cart_changes later.
+
+    Returns:
+        return: expected quantity of the product in the cart.
+
+    Args:
+        db: database for the buffered changes and the cart mirror.
+        access_token: required to get access to the API.
+        chat_id: ID of the chat and its cart.
+        product_id: ID of the product.
+        quantity_change: number of products to add, negative to remove.
+    """
+    cart_item = get_cart_item(get_cart(db, access_token, chat_id), product_id)
+    quantity = cart_item['quantity'] if cart_item else 0
+    pending_change = db.hget(CART_PENDING_KEY.format(chat_id), product_id)
+    if quantity + int(pending_change or 0) + quantity_change < 0:
+        return 0
+
+    pending_change = buffer_cart_change(
+        db,
+        chat_id,
+        product_id,
+        quantity_change,
     )
+
+    return quantity + pending_change
+
+
+def buffer_cart_change(db, chat_id, product_id, quantity_change):
+    """
+    Buffer change of the product quantity until the cart is flushed.
+
+    Returns:
+        return: all buffered changes of the product quantity.
+
+    Args:
+        db: database for the buffered changes.
+        chat_id: ID of the chat and its cart.
+        product_id: ID of the product.
+        quantity_change: number of products to add, negative to remove.
+    """
+    pending_key = CART_PENDING_KEY.format(chat_id)
+    pipeline = db.pipeline()
+    pipeline.hincrby(pending_key, product_id, quantity_change)
+    pipeline.expire(pending_key, SESSION_TTL)
+    pending_change, _ = pipeline.execute()
+
+    return pending_change
+
+
+def flush_cart_changes(db, access_token, chat_id):
+    """
+    Send buffered quantity changes to Moltin.
+
+    Every product gets a single request with its resulting quantity.
+    When a request fails, the changes that are not sent yet are buffered
+    again.
+
+    Returns:
+        return: data about the cart items or None if nothing was buffered.
+
+    Args:
+        db: database for the buffered changes and the cart mirror.
+        access_token: required to get access to the API.
+        chat_id: ID of the chat and its cart.
+    """
+    pending_key = CART_PENDING_KEY.format(chat_id)
+    pipeline = db.pipeline()
+    pipeline.hgetall(pending_key)
+    pipeline.delete(pending_key)
+    pending_changes, _ = pipeline.execute()
+    if not pending_changes:
+        return None
+
+    pending_changes = list(pending_changes.items())
+    applied_count = 0
+    try:
+        cart_items = get_cart(db, access_token, chat_id)
+        for product_id, quantity_change in pending_changes:
+            cart_items = apply_cart_change(
+                access_token,
+                chat_id,
+                cart_items,
+                product_id,
+                int(quantity_change),
+            )
+            applied_count += 1
+    except Exception:
+        # Changes that didn't reach Moltin go back to the buffer for the
+        # next flush, and the mirror is reloaded from Moltin.
+        pipeline = db.pipeline()
+        for product_id, quantity_change in pending_changes[applied_count:]:
+            pipeline.hincrby(pending_key, product_id, quantity_change)
+        pipeline.expire(pending_key, SESSION_TTL)
+        pipeline.delete(CART_MIRROR_KEY.format(chat_id))
+        pipeline.execute()
+        raise
+
+    store_cart_mirror(db, chat_id, cart_items)
+
+    return cart_items
+
+
+def apply_cart_change(
+    access_token,
+    chat_id,
+    cart_items,
+    product_id,
+    quantity_change,
+):
+    """
+    Send change of the product quantity to Moltin.
+
+    Returns:
+        return: data about the cart items after the change.
+
+    Args:
+        access_token: required to get access to the API.
+        chat_id: ID of the chat and its cart.
+        cart_items: data about the cart items before the change.
+        product_id: ID of the product.
+        quantity_change: number of products to add, negative to remove.
+    """
+    cart_item = get_cart_item(cart_items, product_id)
+    if cart_item is None:
+        if quantity_change > 0:
+            return add_product_to_cart(
+                access_token,
+                chat_id,
+                product_id,
+                quantity_change,
+            )
+        return cart_items
+
+    quantity = cart_item['quantity'] + quantity_change
+    if quantity > 0:
+        return update_cart_item_quantity(
+            access_token,
+            chat_id,
+            cart_item['id'],
+            quantity,
+        )
+
+    return delete_product_from_cart(access_token, chat_id, cart_item['id'])
+
+
+def get_cart_item(cart_items, product_id):
+    """
+    Find cart item of the product.
+
+    Returns:
+        return: cart item or None if the product is not in the cart.
+
+    Args:
+        cart_items: data about the cart items.
+        product_id: ID of the product.
+    """
+    for cart_item in cart_items['data']:
+        if cart_item['product_id'] == product_id:
+            return cart_item
+
+    return None
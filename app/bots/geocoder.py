@@ -1,9 +1,59 @@
 """Geo functions for telegram bot."""
 
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
 import requests
 
 from geopy.distance import distance
 
+from app.metrics import CACHE_REQUESTS, Counter, observe_request
+from app.bots.settings import (
+    GEOCODE_CACHE_SIZE,
+    GEOCODE_CACHE_TTL,
+    GEOCODE_NEGATIVE_CACHE_TTL,
+    GEOCODER_TIMEOUT,
+    GEOCODER_URL,
+)
+
+EARTH_RADIUS_KM = 6371.0088
+GRID_CELL_DEGREES = 0.25
+REFINED_CANDIDATES = 3
+
+GEOCODE_CACHE_PREFIX = 'geocode:'
+# Only unambiguous forms are expanded, 'пр' is left as is, since it may
+# be both 'проспект' and 'проезд'.
+ADDRESS_ABBREVIATIONS = {
+    'г': 'город',
+    'ул': 'улица',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пер': 'переулок',
+    'наб': 'набережная',
+    'пл': 'площадь',
+    'ш': 'шоссе',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'д': 'дом',
+    'к': 'корпус',
+    'корп': 'корпус',
+    'стр': 'строение',
+}
+
+_geocode_cache_lock = threading.Lock()
+_geocode_cache = OrderedDict()
+
+GEOCODER_NOT_FOUND = Counter(
+    'geocoder_not_found_total',
+    'Addresses the geocoder could not find.',
+)
+
+
 def fetch_coordinates(apikey, address):
     """
     Get the coordinates of address.
@@ -15,13 +65,21 @@ def fetch_coordinates(apikey, address):
         apikey: token for Yandex service.
         address: name of specific place.
     """
-    base_url = "https://geocode-maps.yandex.ru/1.x"
-    response = requests.get(base_url, params={
-        "geocode": address,
-        "apikey": apikey,
-        "format": "json",
-    })
-    response.raise_for_status()
+    started_at = time.monotonic()
+    try:
+        response = requests.get(GEOCODER_URL, params={
+            "geocode": address,
+            "apikey": apikey,
+            "format": "json",
+        }, timeout=GEOCODER_TIMEOUT)
+        response.raise_for_status()
+    except requests.HTTPError as err:
+        observe_request('yandex', '/1.x', started_at, err.response.status_code)
+        raise
+    except requests.RequestException as err:
+        observe_request('yandex', '/1.x', started_at, type(err).__name__)
+        raise
+    observe_request('yandex', '/1.x', started_at)
     found_places = response.json()['response']['GeoObjectCollection']['featureMember']
 
     if not found_places:
@@ -33,33 +91,246 @@ def fetch_coordinates(apikey, address):
     return lon, lat
 
 
-def get_closest_entry(current_position, entries):
+def get_coordinates(redis_db, apikey, address):
     """
-    Get closest pizzeria.
+    Get the coordinates of address through the geocode cache.
+
+    Results are cached in process memory and in Redis by the normalized
+    address, addresses the geocoder can't find are cached too.
 
     Returns:
-        return: closes entry.
+        return: longitude and latitude of address.
 
     Args:
-        current_position: location of user.
-        entries: data of all pizzerias.
+        redis_db: database for the shared geocode cache.
+        apikey: token for Yandex service.
+        address: name of specific place.
     """
-    result = []
-
-    for entry in entries:
-        entry_id = entry['id']
-        entry_position = entry['longitude'], entry['latitude']
-
-        distance_between_positions = distance(
-            current_position,
-            entry_position,
-        ).km
-
-        result.append(
-            {
-                'id': entry_id,
-                'distance': distance_between_positions,
-            }
+    normalized_address = normalize_address(address)
+
+    with _geocode_cache_lock:
+        cached = _geocode_cache.get(normalized_address)
+        if cached is not None and cached[1] > time.time():
+            _geocode_cache.move_to_end(normalized_address)
+            CACHE_REQUESTS.inc('geocode', 'hit')
+            return cached[0]
+
+    cache_key = '{0}{1}'.format(
+        GEOCODE_CACHE_PREFIX,
+        hashlib.sha1(normalized_address.encode()).hexdigest(),
+    )
+    pipeline = redis_db.pipeline()
+    pipeline.get(cache_key)
+    pipeline.ttl(cache_key)
+    serialized_coordinates, time_to_expire = pipeline.execute()
+
+    if serialized_coordinates is not None:
+        CACHE_REQUESTS.inc('geocode', 'shared_hit')
+        coordinates = json.loads(serialized_coordinates)
+    else:
+        CACHE_REQUESTS.inc('geocode', 'miss')
+        coordinates = fetch_coordinates(apikey, address)
+        time_to_expire = GEOCODE_CACHE_TTL
+        if coordinates is None:
+            GEOCODER_NOT_FOUND.inc()
+            time_to_expire = GEOCODE_NEGATIVE_CACHE_TTL
+        redis_db.set(cache_key, json.dumps(coordinates), ex=time_to_expire)
+
+    if coordinates is not None:
+        coordinates = tuple(coordinates)
+
+    with _geocode_cache_lock:
+        _geocode_cache[normalized_address] = (
+            coordinates,
+            time.time() + max(time_to_expire, 0),
         )
+        _geocode_cache.move_to_end(normalized_address)
+        while len(_geocode_cache) > GEOCODE_CACHE_SIZE:
+            _geocode_cache.popitem(last=False)
+
+    return coordinates
+
+
+def normalize_address(address):
+    """
+    Normalize address to use it as the cache key.
+
+    Returns:
+        return: address in lower case without punctuation and with
+            abbreviations expanded.
+
+    Args:
+        address: name of specific place.
+    """
+    words = re.findall(r'\w+(?:-\w+)*', address.lower().replace('ё', 'е'))
+
+    return ' '.join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+
+
+class SpatialIndex:
+    """Grid index for the nearest entry lookup."""
+
+    def __init__(self, entries, cell_size=GRID_CELL_DEGREES):
+        """
+        Build the index.
+
+        Args:
+            entries: entries with longitude and latitude.
+            cell_size: size of the grid cell in degrees.
+        """
+        self.entries = list(entries)
+        self.cell_size = cell_size
+        self.points = []
+        self.cells = defaultdict(list)
+
+        for entry_index, entry in enumerate(self.entries):
+            lon = float(entry['longitude'])
+            lat = float(entry['latitude'])
+            self.points.append(
+                (lat, lon, math.radians(lat), math.radians(lon)),
+            )
+            self.cells[self._get_cell(lon, lat)].append(entry_index)
+
+        cell_rows = [row for row, _ in self.cells] or [0]
+        cell_columns = [column for _, column in self.cells] or [0]
+        self.bounds = (
+            min(cell_rows),
+            max(cell_rows),
+            min(cell_columns),
+            max(cell_columns),
+        )
+
+    def find_closest(self, position, candidates_count=REFINED_CANDIDATES):
+        """
+        Find the entry closest to the position.
+
+        Candidates are collected from the grid rings around the position
+        and ranked by haversine distance, the best of them are refined
+        with the exact geodesic distance.
+
+        Returns:
+            return: closest entry and distance to it in km.
+
+        Args:
+            position: longitude and latitude.
+            candidates_count: number of candidates refined with geodesic.
+        """
+        if not self.entries:
+            raise ValueError('Spatial index is empty')
+
+        lon, lat = (float(coordinate) for coordinate in position)
+        row, column = self._get_cell(lon, lat)
+        lat_radians, lon_radians = math.radians(lat), math.radians(lon)
+        cos_lat = math.cos(lat_radians)
+
+        min_row, max_row, min_column, max_column = self.bounds
+        first_ring = max(
+            0,
+            row - max_row,
+            min_row - row,
+            column - max_column,
+            min_column - column,
+        )
+        last_ring = max(
+            abs(row - min_row),
+            abs(row - max_row),
+            abs(column - min_column),
+            abs(column - max_column),
+        )
+
+        candidates = []
+        visited_cells = 0
+        for ring in range(first_ring, last_ring + 1):
+            ring_cells = self._get_ring_cells(row, column, ring)
+            visited_cells += len(ring_cells)
+            if visited_cells > len(self.points):
+                # In a sparse area most of the cells are empty, so all
+                # entries are cheaper to scan directly.
+                candidates = [
+                    (
+                        _haversine(lat_radians, lon_radians, cos_lat, point),
+                        entry_index,
+                    )
+                    for entry_index, point in enumerate(self.points)
+                ]
+                break
+
+            for cell in ring_cells:
+                candidates.extend(
+                    (
+                        _haversine(
+                            lat_radians,
+                            lon_radians,
+                            cos_lat,
+                            self.points[entry_index],
+                        ),
+                        entry_index,
+                    )
+                    for entry_index in self.cells.get(cell, ())
+                )
+
+            if len(candidates) < candidates_count:
+                continue
+
+            candidates.sort()
+            worst_candidate_distance = candidates[candidates_count - 1][0]
+            if worst_candidate_distance < self._get_ring_bound(lat, ring):
+                break
+
+        candidates.sort()
+        refined = (
+            (
+                distance(
+                    (lat, lon),
+                    self.points[entry_index][:2],
+                ).km,
+                entry_index,
+            )
+            for _, entry_index in candidates[:candidates_count]
+        )
+        closest_distance, closest_index = min(refined)
+
+        return self.entries[closest_index], closest_distance
+
+    def _get_cell(self, lon, lat):
+        return (
+            math.floor(lat / self.cell_size),
+            math.floor(lon / self.cell_size),
+        )
+
+    def _get_ring_cells(self, row, column, ring):
+        if not ring:
+            return [(row, column)]
+
+        ring_cells = []
+        for offset in range(-ring, ring + 1):
+            ring_cells.extend((
+                (row - ring, column + offset),
+                (row + ring, column + offset),
+            ))
+        for offset in range(-ring + 1, ring):
+            ring_cells.extend((
+                (row + offset, column - ring),
+                (row + offset, column + ring),
+            ))
+
+        return ring_cells
+
+    def _get_ring_bound(self, lat, ring):
+        # Any entry outside of the searched rings is at least this far.
+        furthest_lat = min(abs(lat) + (ring + 1) * self.cell_size, 89)
+        degree_km = EARTH_RADIUS_KM * math.pi / 180
+
+        return ring * self.cell_size * degree_km * math.cos(
+            math.radians(furthest_lat),
+        )
+
+
+def _haversine(lat, lon, cos_lat, point):
+    _, _, point_lat, point_lon = point
+    half_chord = (
+        math.sin((point_lat - lat) / 2) ** 2
+        + cos_lat * math.cos(point_lat) * math.sin((point_lon - lon) / 2) ** 2
+    )
 
-    return min(result, key=lambda entry: entry['distance'])
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(half_chord))
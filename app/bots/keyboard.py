@@ -1,11 +1,17 @@
 import json
 import math
+import threading
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from app.api.product import get_all_products
+from app.api.product import get_cached_catalog
 
+PRODUCTS_PER_PAGE = 8
 
-def get_pagination(access_token, items_per_page):
+_menu_pages = {}
+_menu_pages_lock = threading.Lock()
+
+
+def get_pagination(products, items_per_page):
     """
     Build pagination buttons.
 
@@ -13,11 +19,9 @@ def get_pagination(access_token, items_per_page):
         return: paginated data.
 
     Args:
-        access_token: required to get access to the API.
+        products: a list with all products.
         items_per_page: number of desired items per page.
     """
-    products = get_all_products(access_token)
-
     max_page = math.ceil(len(products) / items_per_page)
 
     start = 0
@@ -28,62 +32,86 @@ def get_pagination(access_token, items_per_page):
         paginated_products.append(products[start:end])
         start = end
         end += items_per_page
-    
+
     return paginated_products
 
 
-def create_menu_markup(access_token, page=0):
+def create_menu_markup(db, access_token, page=0):
     """
-    Build menu keyboard.
+    Get menu keyboard.
+
+    Pages are built once per catalog version and handed out as
+    serialized markups.
 
     Returns:
-        return: menu keyboard markup.
+        return: serialized menu keyboard markup.
 
     Args:
+        db: database for the catalog cache.
         access_token: required to get access to the API.
         page: number of page.
     """
-    products_per_page = 8
-    products = get_pagination(access_token, products_per_page)
-    
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                '{0}'.format(product['name']),
-                callback_data=product['id'],
-            )
-        ]
-        for product in products[page]   
-    ]
+    version, products = get_cached_catalog(db, access_token)
 
-    if page == len(products) - 1:
-        keyboard.append(
-            [
-                InlineKeyboardButton('⬅ Back', callback_data=f'page, {page - 1}'),
-                InlineKeyboardButton('Cart 🛒', callback_data='cart'),
-            ],
-        )
-    elif page == 0:
-        keyboard.append(
-            [
-                InlineKeyboardButton('Cart 🛒', callback_data='cart'),
-                InlineKeyboardButton('Forward ➡', callback_data=f'page, {page + 1}'),
-            ]
-        )
-    else:
-        keyboard.append(
-            [
-                InlineKeyboardButton('⬅ Back', callback_data=f'page, {page - 1}'),
-                InlineKeyboardButton('Cart 🛒', callback_data='cart'),
-                InlineKeyboardButton('Forward ➡', callback_data=f'page, {page + 1}'),
-            ]
-        )
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = _menu_pages.get((version, page))
+    if reply_markup is None:
+        menu_pages = _build_menu_pages(version, products)
+        last_page = len(menu_pages) - 1
+        reply_markup = menu_pages[(version, min(page, last_page))]
 
     return reply_markup
 
 
+def _build_menu_pages(version, products):
+    global _menu_pages
+
+    with _menu_pages_lock:
+        if (version, 0) in _menu_pages:
+            return _menu_pages
+
+        pages = get_pagination(products, PRODUCTS_PER_PAGE) or [[]]
+        navigation_rows = _build_navigation_rows(len(pages))
+        menu_pages = {}
+        for page, page_products in enumerate(pages):
+            keyboard = [
+                [
+                    InlineKeyboardButton(
+                        '{0}'.format(product['name']),
+                        callback_data=product['id'],
+                    )
+                ]
+                for product in page_products
+            ]
+            keyboard.append(navigation_rows[page])
+            menu_pages[(version, page)] = InlineKeyboardMarkup(
+                keyboard,
+            ).to_json()
+
+        _menu_pages = menu_pages
+
+    return menu_pages
+
+
+def _build_navigation_rows(pages_count):
+    cart_button = InlineKeyboardButton('Cart 🛒', callback_data='cart')
+    navigation_rows = []
+    for page in range(pages_count):
+        row = [cart_button]
+        if page > 0:
+            row.insert(0, InlineKeyboardButton(
+                '⬅ Back',
+                callback_data='page, {0}'.format(page - 1),
+            ))
+        if page < pages_count - 1:
+            row.append(InlineKeyboardButton(
+                'Forward ➡',
+                callback_data='page, {0}'.format(page + 1),
+            ))
+        navigation_rows.append(row)
+
+    return navigation_rows
+
+
 def create_delivery_menu(delivery_man_id, customer_position):
     """
     Build keyboard for delivery option.
@@ -0,0 +1,344 @@
+"""Queue of outgoing Telegram messages under the Bot API rate limits."""
+
+import heapq
+import itertools
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from telegram.error import RetryAfter
+
+from app.api.ratelimit import (
+    BACKGROUND,
+    INTERACTIVE,
+    TokenBucket,
+    get_request_priority,
+)
+from app.bots.settings import (
+    OUTBOX_RETRIES,
+    OUTBOX_WORKERS,
+    TELEGRAM_CHAT_BURST,
+    TELEGRAM_CHAT_RATE_LIMIT,
+    TELEGRAM_RATE_LIMIT,
+)
+from app.metrics import Gauge
+
+IDLE_CHAT_BUCKETS_LIMIT = 1000
+# Bot methods that don't take chat_id. They aren't messages of the chat,
+# so they neither wait for its messages nor count to its limit.
+CHATLESS_METHODS = frozenset(('answer_callback_query',))
+
+logger = logging.getLogger(__name__)
+
+
+class OutgoingMessage:
+    """Bot API call waiting in the outbox."""
+
+    def __init__(self, bot, method, chat_id, priority, kwargs):
+        """
+        Create the message.
+
+        Args:
+            bot: a pre-initialized bot instance.
+            method: name of the bot method, like send_message.
+            chat_id: ID of the chat.
+            priority: priority of the message, lower goes first.
+            kwargs: other arguments of the bot method.
+        """
+        self.bot = bot
+        self.method = method
+        self.chat_id = chat_id
+        self.priority = priority
+        self.kwargs = kwargs
+        self.future = Future()
+        self.attempts = 0
+        self.is_chatless = method in CHATLESS_METHODS
+        self.queue_key = chat_id
+        if self.is_chatless:
+            self.queue_key = ('chatless', id(self))
+
+
+class Outbox:
+    """
+    Messages sent by worker threads under the global and per-chat limits.
+
+    Messages of a chat are sent one at a time in the order they were
+    queued. Chats take turns by the priority of their next message, then
+    by arrival, so replies to customers go ahead of notifications.
+    Calls without a chat, like callback answers, are only held back by
+    the global limit.
+    """
+
+    def __init__(self, rate, chat_rate, chat_burst, workers, retries):
+        """
+        Create the outbox, the workers start with the first message.
+
+        Args:
+            rate: number of messages per second to all chats.
+            chat_rate: number of messages per second to a chat.
+            chat_burst: number of messages allowed at once to a chat.
+            workers: number of threads sending the messages.
+            retries: number of retries after a flood-wait answer.
+        """
+        self.bucket = TokenBucket(rate, rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self.retries = retries
+        self.rate_limited_count = 0
+        self._condition = threading.Condition()
+        self._chat_messages = {}
+        self._chat_buckets = {}
+        self._ready_chats = []
+        self._counter = itertools.count()
+        self._threads = []
+
+    def send(self, bot, method, chat_id, priority=INTERACTIVE, **kwargs):
+        """
+        Queue the message without waiting for Telegram.
+
+        Returns:
+            return: future with the sent message.
+
+        Args:
+            bot: a pre-initialized bot instance.
+            method: name of the bot method, like send_message.
+            chat_id: ID of the chat.
+            priority: priority of the message, lower goes first.
+            kwargs: other arguments of the bot method.
+        """
+        message = OutgoingMessage(bot, method, chat_id, priority, kwargs)
+        message.future.add_done_callback(_log_failure)
+        with self._condition:
+            self._start_workers()
+            chat_messages = self._chat_messages.get(message.queue_key)
+            if chat_messages is None:
+                self._chat_messages[message.queue_key] = deque([message])
+                self._push_ready_chat(message)
+            else:
+                chat_messages.append(message)
+            self._condition.notify()
+
+        return message.future
+
+    def wait_sent(self, chat_id, timeout=None):
+        """
+        Wait until the queued messages of the chat are sent.
+
+        Returns:
+            return: False if the timeout expired.
+
+        Args:
+            chat_id: ID of the chat.
+            timeout: seconds to wait, forever if None.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: chat_id not in self._chat_messages,
+                timeout,
+            )
+
+    def get_stats(self):
+        """
+        Get state of the outbox.
+
+        Returns:
+            return: queued messages by priority and flood-wait counter.
+        """
+        with self._condition:
+            priorities = [
+                message.priority
+                for chat_messages in self._chat_messages.values()
+                for message in chat_messages
+            ]
+
+        return {
+            'interactive_queue_depth': priorities.count(INTERACTIVE),
+            'background_queue_depth': priorities.count(BACKGROUND),
+            'rate_limited_count': self.rate_limited_count,
+        }
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._run_worker,
+                name='telegram-outbox',
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _push_ready_chat(self, message):
+        heapq.heappush(
+            self._ready_chats,
+            (message.priority, next(self._counter), message.queue_key),
+        )
+
+    def _get_chat_bucket(self, chat_id):
+        chat_bucket = self._chat_buckets.get(chat_id)
+        if chat_bucket is None:
+            if len(self._chat_buckets) > IDLE_CHAT_BUCKETS_LIMIT:
+                self._remove_idle_chat_buckets()
+            chat_bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = chat_bucket
+
+        return chat_bucket
+
+    def _remove_idle_chat_buckets(self):
+        # A refilled bucket of a chat without messages is the same as a
+        # new one, so it can go.
+        for chat_id, chat_bucket in list(self._chat_buckets.items()):
+            if chat_id in self._chat_messages:
+                continue
+            if chat_bucket.get_wait() <= 0 and (
+                chat_bucket.tokens >= chat_bucket.capacity
+            ):
+                del self._chat_buckets[chat_id]
+
+    def _run_worker(self):
+        while True:
+            message = self._take_message()
+            self._send_message(message)
+
+    def _take_message(self):
+        with self._condition:
+            while True:
+                wait = None
+                waiting_chats = []
+                while self._ready_chats:
+                    ready_chat = heapq.heappop(self._ready_chats)
+                    message = self._chat_messages[ready_chat[2]][0]
+                    chat_bucket = None
+                    chat_wait = 0
+                    if not message.is_chatless:
+                        chat_bucket = self._get_chat_bucket(message.chat_id)
+                        chat_wait = chat_bucket.get_wait()
+                    if chat_wait > 0:
+                        waiting_chats.append(ready_chat)
+                        if wait is None or chat_wait < wait:
+                            wait = chat_wait
+                        continue
+
+                    global_wait = self.bucket.get_wait()
+                    if global_wait > 0:
+                        waiting_chats.append(ready_chat)
+                        wait = global_wait
+                        break
+
+                    self.bucket.consume()
+                    if chat_bucket is not None:
+                        chat_bucket.consume()
+                    for waiting_chat in waiting_chats:
+                        heapq.heappush(self._ready_chats, waiting_chat)
+
+                    return message
+
+                for waiting_chat in waiting_chats:
+                    heapq.heappush(self._ready_chats, waiting_chat)
+                self._condition.wait(wait)
+
+    def _send_message(self, message):
+        kwargs = dict(message.kwargs)
+        if message.method not in CHATLESS_METHODS:
+            kwargs['chat_id'] = message.chat_id
+        try:
+            result = getattr(message.bot, message.method)(**kwargs)
+        except RetryAfter as err:
+            if message.attempts < self.retries:
+                message.attempts += 1
+                self._retry_message(message, err.retry_after)
+                return
+            self._finish_message(message)
+            message.future.set_exception(err)
+        except Exception as err:
+            self._finish_message(message)
+            message.future.set_exception(err)
+        else:
+            self._finish_message(message)
+            message.future.set_result(result)
+
+    def _retry_message(self, message, retry_after):
+        # The flood-wait may be for the chat or for the whole bot, for
+        # example when shards share the token, so both wait.
+        with self._condition:
+            self.rate_limited_count += 1
+            self.bucket.pause(retry_after)
+            if not message.is_chatless:
+                self._get_chat_bucket(message.chat_id).pause(retry_after)
+            self._push_ready_chat(message)
+            self._condition.notify()
+
+    def _finish_message(self, message):
+        with self._condition:
+            chat_messages = self._chat_messages[message.queue_key]
+            chat_messages.popleft()
+            if chat_messages:
+                self._push_ready_chat(chat_messages[0])
+                self._condition.notify()
+            else:
+                del self._chat_messages[message.queue_key]
+                self._condition.notify_all()
+
+
+def send(bot, method, chat_id, **kwargs):
+    """
+    Queue the message with the priority of the current request.
+
+    Handlers are not blocked by Telegram. Messages sent inside a
+    request_priority(BACKGROUND) block, like notifications, wait for
+    the replies to customers.
+
+    Returns:
+        return: future with the sent message.
+
+    Args:
+        bot: a pre-initialized bot instance.
+        method: name of the bot method, like send_message.
+        chat_id: ID of the chat.
+        kwargs: other arguments of the bot method.
+    """
+    return outbox.send(
+        bot,
+        method,
+        chat_id,
+        priority=get_request_priority(),
+        **kwargs,
+    )
+
+
+def _log_failure(future):
+    err = future.exception()
+    if err is not None:
+        logger.error('Message is not sent: {0}'.format(err))
+
+
+outbox = Outbox(
+    rate=TELEGRAM_RATE_LIMIT,
+    chat_rate=TELEGRAM_CHAT_RATE_LIMIT,
+    chat_burst=TELEGRAM_CHAT_BURST,
+    workers=OUTBOX_WORKERS,
+    retries=OUTBOX_RETRIES,
+)
+
+
+def _get_queue_depths():
+    stats = outbox.get_stats()
+
+    return {
+        ('interactive',): stats['interactive_queue_depth'],
+        ('background',): stats['background_queue_depth'],
+    }
+
+
+Gauge(
+    'telegram_outbox_queue_depth',
+    'Telegram messages waiting in the outbox.',
+    _get_queue_depths,
+    ('priority',),
+)
+Gauge(
+    'telegram_rate_limited_responses',
+    'Telegram flood-wait answers since the start.',
+    lambda: outbox.rate_limited_count,
+)
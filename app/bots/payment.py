@@ -1,6 +1,8 @@
 from environs import Env
 from telegram import LabeledPrice
 
+from app.bots.outbox import send
+
 env = Env()
 env.read_env()
 
@@ -15,8 +17,9 @@ def start_without_shipping(bot, update, price):
     start_parameter = 'Payment_{0}'.format(chat_id)
     currency = 'RUB'
     prices = [LabeledPrice('Test payment', price * 100)]
-    bot.sendInvoice(chat_id, title, description, payload,
-                    provider_token, start_parameter, currency, prices)
+    send(bot, 'send_invoice', chat_id, title=title, description=description,
+         payload=payload, provider_token=provider_token,
+         start_parameter=start_parameter, currency=currency, prices=prices)
 
 
 def precheckout_callback(bot, update):
@@ -30,4 +33,5 @@ def precheckout_callback(bot, update):
 
 
 def successful_payment_callback(bot, update):
-    update.message.reply_text('Please, send location or address')
+    send(bot, 'send_message', update.message.chat_id,
+         text='Please, send location or address')
@@ -0,0 +1,98 @@
+"""Product photo functions for telegram bot."""
+
+import functools
+
+from telegram.error import BadRequest
+
+from app.api.product import get_product_photo_by_id
+from app.bots.render import render_photo
+from app.metrics import CACHE_REQUESTS
+
+PHOTO_FILE_IDS_KEY = 'photo_file_ids'
+
+
+def show_product_photo(
+    db,
+    bot,
+    access_token,
+    product,
+    chat_id,
+    message=None,
+    **kwargs,
+):
+    """
+    Show the product photo in place of the message.
+
+    Telegram file_id of the uploaded photo is remembered once the photo
+    is shown, so the next renders neither look up the file in Moltin nor
+    upload it again.
+
+    Returns:
+        return: future with the message with the photo.
+
+    Args:
+        db: database for the file ids.
+        bot: a pre-initialized bot instance.
+        access_token: required to get access to the API.
+        product: data about the product.
+        chat_id: ID of the chat to show the photo.
+        message: message to replace with the photo, can be None.
+        kwargs: caption and reply_markup of the photo.
+    """
+    picture_id = product['relationships']['main_image']['data']['id']
+    photo_key = '{0}:{1}'.format(picture_id, get_photo_version(product))
+
+    file_id = db.hget(PHOTO_FILE_IDS_KEY, photo_key)
+    if file_id:
+        CACHE_REQUESTS.inc('photo', 'hit')
+        photo = file_id
+    else:
+        CACHE_REQUESTS.inc('photo', 'miss')
+        photo = get_product_photo_by_id(access_token, picture_id)
+
+    shown_message = render_photo(bot, chat_id, message, photo, **kwargs)
+    shown_message.add_done_callback(functools.partial(
+        _remember_file_id,
+        db,
+        photo_key,
+        file_id,
+        functools.partial(
+            show_product_photo,
+            db,
+            bot,
+            access_token,
+            product,
+            chat_id,
+            message,
+            **kwargs,
+        ),
+    ))
+
+    return shown_message
+
+
+def _remember_file_id(db, photo_key, file_id, show_again, shown_message):
+    err = shown_message.exception()
+    if err is None:
+        if not file_id:
+            file_id = shown_message.result().photo[-1].file_id
+            db.hset(PHOTO_FILE_IDS_KEY, photo_key, file_id)
+    elif file_id and isinstance(err, BadRequest):
+        # Telegram doesn't know the file anymore, so it is uploaded again.
+        db.hdel(PHOTO_FILE_IDS_KEY, photo_key)
+        show_again()
+
+
+def get_photo_version(product):
+    """
+    Get content version of the product photo.
+
+    Returns:
+        return: time of the last product update.
+
+    Args:
+        product: data about the product.
+    """
+    timestamps = product.get('meta', {}).get('timestamps', {})
+
+    return timestamps.get('updated_at', '')
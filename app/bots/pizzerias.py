@@ -0,0 +1,93 @@
+"""Pizzeria registry for telegram bot."""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from app.api.flow import get_entries
+from app.bots.geocoder import SpatialIndex
+from app.bots.settings import PIZZERIA_FLOW_SLUG
+
+logger = logging.getLogger(__name__)
+
+PizzeriaSnapshot = namedtuple(
+    'PizzeriaSnapshot',
+    ['version', 'entries', 'entries_by_id', 'index', 'fetched_at'],
+)
+
+_registry_lock = threading.Lock()
+_registry = {
+    'snapshot': None,
+}
+
+
+def get_pizzerias(access_token):
+    """
+    Get snapshot of the pizzeria registry.
+
+    The registry is loaded from the flow on the first call and then
+    refreshed by refresh_pizzerias.
+
+    Returns:
+        return: pizzeria snapshot.
+
+    Args:
+        access_token: required to get access to the API.
+    """
+    snapshot = _registry['snapshot']
+    if snapshot is None:
+        snapshot = refresh_pizzerias(access_token)
+
+    return snapshot
+
+
+def refresh_pizzerias(access_token):
+    """
+    Reload pizzerias from the flow.
+
+    The snapshot is replaced only when the entries have changed, so its
+    version and spatial index stay the same otherwise.
+
+    Returns:
+        return: pizzeria snapshot.
+
+    Args:
+        access_token: required to get access to the API.
+    """
+    entries = get_entries(access_token, PIZZERIA_FLOW_SLUG)
+    serialized_entries = json.dumps(entries, sort_keys=True)
+    version = hashlib.sha1(serialized_entries.encode()).hexdigest()
+
+    with _registry_lock:
+        snapshot = _registry['snapshot']
+        if snapshot is not None and snapshot.version == version:
+            snapshot = snapshot._replace(fetched_at=time.time())
+        else:
+            snapshot = PizzeriaSnapshot(
+                version=version,
+                entries=entries,
+                entries_by_id={entry['id']: entry for entry in entries},
+                index=SpatialIndex(entries),
+                fetched_at=time.time(),
+            )
+            logger.info('Pizzeria registry updated to {0}'.format(version))
+        _registry['snapshot'] = snapshot
+
+    return snapshot
+
+
+def find_closest_pizzeria(access_token, position):
+    """
+    Find pizzeria closest to the position.
+
+    Returns:
+        return: pizzeria entry and distance to it in km.
+
+    Args:
+        access_token: required to get access to the API.
+        position: longitude and latitude of the customer.
+    """
+    return get_pizzerias(access_token).index.find_closest(position)
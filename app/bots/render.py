@@ -0,0 +1,227 @@
+"""Rendering of bot screens in place of the tapped message."""
+
+import functools
+import logging
+from concurrent.futures import Future
+
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest, RetryAfter
+
+from app.bots.outbox import send
+from app.metrics import Counter
+
+RENDERED_MESSAGES = Counter(
+    'bot_rendered_messages_total',
+    'Screens shown by editing or replacing the message, or skipped.',
+    ('method',),
+)
+
+logger = logging.getLogger(__name__)
+
+
+def render_text(bot, chat_id, message, text, reply_markup=None):
+    """
+    Show the text screen in place of the message.
+
+    A text message is edited, and Telegram leaves it as is if it already
+    shows the screen. Telegram can't turn a photo into a text, so other
+    messages are replaced with a new one sent through the outbox.
+
+    Returns:
+        return: future with the message that shows the screen.
+
+    Args:
+        bot: a pre-initialized bot instance.
+        chat_id: ID of the chat.
+        message: message to replace, can be None.
+        text: text of the screen.
+        reply_markup: keyboard markup of the screen.
+    """
+    # python-telegram-bot 11.1 doesn't parse the keyboard of a message,
+    # so an unchanged screen is only known from the answer to the edit.
+    if message is not None and message.text is not None:
+        shown_message = edit_message(
+            bot,
+            chat_id,
+            message,
+            'edit_message_text',
+            text=text,
+            reply_markup=reply_markup,
+        )
+        if shown_message is not None:
+            return shown_message
+
+    return replace_message(
+        bot,
+        chat_id,
+        message,
+        'send_message',
+        text=text,
+        reply_markup=reply_markup,
+    )
+
+
+def render_photo(bot, chat_id, message, photo, caption, reply_markup=None):
+    """
+    Show the photo screen in place of the message.
+
+    A photo message gets the new photo with edit_message_media, and
+    Telegram leaves it as is if it already shows the screen. Other
+    messages are replaced with a new one sent through the outbox.
+
+    Returns:
+        return: future with the message that shows the screen.
+
+    Args:
+        bot: a pre-initialized bot instance.
+        chat_id: ID of the chat.
+        message: message to replace, can be None.
+        photo: Telegram file_id or URL of the photo.
+        caption: caption of the photo.
+        reply_markup: keyboard markup of the screen.
+    """
+    if message is not None and message.photo:
+        shown_message = edit_message(
+            bot,
+            chat_id,
+            message,
+            'edit_message_media',
+            media=InputMediaPhoto(photo, caption=caption),
+            reply_markup=reply_markup,
+        )
+        if shown_message is not None:
+            return shown_message
+
+    return replace_message(
+        bot,
+        chat_id,
+        message,
+        'send_photo',
+        photo=photo,
+        caption=caption,
+        reply_markup=reply_markup,
+    )
+
+
+def edit_message(bot, chat_id, message, method, **kwargs):
+    """
+    Edit the message right away, or through the outbox on a flood-wait.
+
+    Returns:
+        return: future with the edited message, None if it can't be edited.
+
+    Args:
+        bot: a pre-initialized bot instance.
+        chat_id: ID of the chat.
+        message: message to edit.
+        method: name of the bot method, like edit_message_text.
+        kwargs: other arguments of the bot method.
+    """
+    try:
+        edited_message = getattr(bot, method)(
+            chat_id=chat_id,
+            message_id=message.message_id,
+            **kwargs,
+        )
+    except RetryAfter:
+        # The outbox waits for the end of the flood-wait and retries, so
+        # the handler still saves the state.
+        RENDERED_MESSAGES.inc('edited')
+        return send(
+            bot,
+            method,
+            chat_id,
+            message_id=message.message_id,
+            **kwargs,
+        )
+    except BadRequest as err:
+        if is_not_modified(err):
+            RENDERED_MESSAGES.inc('skipped')
+            return get_done_future(message)
+        logger.info('Message is not edited: {0}'.format(err))
+        return None
+
+    RENDERED_MESSAGES.inc('edited')
+
+    return get_done_future(edited_message)
+
+
+def replace_message(bot, chat_id, message, method, **kwargs):
+    """
+    Send the new message and delete the old one once the new is shown.
+
+    Returns:
+        return: future with the sent message.
+
+    Args:
+        bot: a pre-initialized bot instance.
+        chat_id: ID of the chat.
+        message: message to replace, can be None.
+        method: name of the bot method, like send_message.
+        kwargs: other arguments of the bot method.
+    """
+    sent_message = send(bot, method, chat_id, **kwargs)
+    if message is not None:
+        sent_message.add_done_callback(functools.partial(
+            _delete_replaced_message,
+            bot,
+            chat_id,
+            message,
+        ))
+    RENDERED_MESSAGES.inc('replaced')
+
+    return sent_message
+
+
+def _delete_replaced_message(bot, chat_id, message, sent_message):
+    if sent_message.exception() is None:
+        delete_message(bot, chat_id, message)
+
+
+def get_done_future(message):
+    """
+    Wrap the message shown without the outbox in a future.
+
+    Returns:
+        return: completed future with the message.
+
+    Args:
+        message: message that shows the screen.
+    """
+    future = Future()
+    future.set_result(message)
+
+    return future
+
+
+def delete_message(bot, chat_id, message):
+    """
+    Delete the replaced message.
+
+    Args:
+        bot: a pre-initialized bot instance.
+        chat_id: ID of the chat.
+        message: message to delete, can be None.
+    """
+    if message is None:
+        return
+
+    try:
+        bot.delete_message(chat_id=chat_id, message_id=message.message_id)
+    except RetryAfter:
+        send(bot, 'delete_message', chat_id, message_id=message.message_id)
+    except BadRequest as err:
+        logger.info('Message is not deleted: {0}'.format(err))
+
+
+def is_not_modified(err):
+    """
+    Check that Telegram refused the edit of a message that is up to date.
+
+    Returns:
+        return: True if the message is not modified.
+
+    Args:
+        err: error of the edit.
+    """
+    return 'not modified' in str(err).lower()
@@ -0,0 +1,35 @@
+"""Instrumented requests to the Telegram Bot API."""
+
+import time
+
+from telegram.error import TelegramError
+from telegram.utils.request import Request
+
+from app.metrics import observe_request
+
+
+class InstrumentedRequest(Request):
+    """Request recording duration and errors of Bot API calls."""
+
+    def _request_wrapper(self, method, url, *args, **kwargs):
+        # Bot API URLs end with the method name, while file URLs end with
+        # the file path, and both hold the bot token.
+        if '/file/bot' in url:
+            endpoint = 'file'
+        else:
+            endpoint = url.rsplit('/', 1)[-1]
+
+        started_at = time.monotonic()
+        try:
+            result = super()._request_wrapper(method, url, *args, **kwargs)
+        except TelegramError as err:
+            observe_request(
+                'telegram',
+                endpoint,
+                started_at,
+                type(err).__name__,
+            )
+            raise
+        observe_request('telegram', endpoint, started_at)
+
+        return result
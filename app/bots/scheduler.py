@@ -0,0 +1,169 @@
+"""Durable scheduler of delayed jobs for telegram bot."""
+
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED_JOBS_KEY = 'scheduled_jobs'
+SCHEDULED_JOBS_PAYLOAD_KEY = 'scheduled_jobs:payload'
+SHARD_JOBS_KEY = 'scheduled_jobs:shard:{0}'
+SHARD_JOBS_PAYLOAD_KEY = 'scheduled_jobs:shard:{0}:payload'
+CLAIM_BATCH_SIZE = 100
+
+# Removing the job from the schedule and taking its payload in one step
+# makes sure only one worker runs the job.
+CLAIM_JOB_SCRIPT = '''
+if redis.call('zrem', KEYS[1], ARGV[1]) == 1 then
+    local payload = redis.call('hget', KEYS[2], ARGV[1])
+    redis.call('hdel', KEYS[2], ARGV[1])
+    return payload
+end
+return false
+'''
+
+_job_callbacks = {}
+
+
+def register_job(name, callback):
+    """
+    Register callback for the jobs with the name.
+
+    Args:
+        name: name of the job.
+        callback: function called with the bot and job payload.
+    """
+    _job_callbacks[name] = callback
+
+
+def schedule_job(redis_db, job_id, name, delay, payload, shard_id=None):
+    """
+    Schedule the job to run after the delay.
+
+    The job is stored in Redis, so it survives restarts. It can be run by
+    any worker, or only by the worker of the shard if it is given.
+    Scheduling a job with the same ID replaces it.
+
+    Args:
+        redis_db: database for the scheduled jobs.
+        job_id: unique ID of the job.
+        name: name of the registered job.
+        delay: seconds to wait before running the job.
+        payload: data for the job callback.
+        shard_id: ID of the shard that runs the job, any if None.
+    """
+    jobs_key, payload_key = get_job_keys(shard_id)
+    pipeline = redis_db.pipeline()
+    pipeline.hset(
+        payload_key,
+        job_id,
+        json.dumps({'name': name, 'payload': payload}),
+    )
+    pipeline.zadd(jobs_key, {job_id: time.time() + delay})
+    pipeline.execute()
+
+
+def cancel_job(redis_db, job_id, shard_id=None):
+    """
+    Cancel the scheduled job.
+
+    Returns:
+        return: True if the job was waiting to run.
+
+    Args:
+        redis_db: database for the scheduled jobs.
+        job_id: unique ID of the job.
+        shard_id: ID of the shard the job was scheduled for.
+    """
+    jobs_key, payload_key = get_job_keys(shard_id)
+    pipeline = redis_db.pipeline()
+    pipeline.zrem(jobs_key, job_id)
+    pipeline.hdel(payload_key, job_id)
+    is_removed, _ = pipeline.execute()
+
+    return bool(is_removed)
+
+
+def get_job_keys(shard_id=None):
+    """
+    Get keys of the schedule and of the job payloads.
+
+    Returns:
+        return: key of the schedule and key of the payloads.
+
+    Args:
+        shard_id: ID of the shard, None for the jobs of any worker.
+    """
+    if shard_id is None:
+        return SCHEDULED_JOBS_KEY, SCHEDULED_JOBS_PAYLOAD_KEY
+
+    return (
+        SHARD_JOBS_KEY.format(shard_id),
+        SHARD_JOBS_PAYLOAD_KEY.format(shard_id),
+    )
+
+
+def run_due_jobs(redis_db, bot, shard_id=None):
+    """
+    Claim and run jobs that are due.
+
+    Returns:
+        return: number of jobs run.
+
+    Args:
+        redis_db: database for the scheduled jobs.
+        bot: a pre-initialized bot instance.
+        shard_id: ID of the shard to run the jobs of besides the common.
+    """
+    claim_job = redis_db.register_script(CLAIM_JOB_SCRIPT)
+    jobs_count = _run_due_jobs(redis_db, bot, claim_job, get_job_keys())
+    if shard_id is not None:
+        jobs_count += _run_due_jobs(
+            redis_db,
+            bot,
+            claim_job,
+            get_job_keys(shard_id),
+        )
+
+    return jobs_count
+
+
+def _run_due_jobs(redis_db, bot, claim_job, job_keys):
+    jobs_key = job_keys[0]
+    jobs_count = 0
+    while True:
+        job_ids = redis_db.zrangebyscore(
+            jobs_key,
+            0,
+            time.time(),
+            start=0,
+            num=CLAIM_BATCH_SIZE,
+        )
+        for job_id in job_ids:
+            serialized_job = claim_job(keys=list(job_keys), args=[job_id])
+            if not serialized_job:
+                continue
+
+            job = json.loads(serialized_job)
+            try:
+                _job_callbacks[job['name']](bot, job['payload'])
+            except Exception as err:
+                logger.error('Job {0} failed: {1}'.format(job_id, err))
+            jobs_count += 1
+
+        if len(job_ids) < CLAIM_BATCH_SIZE:
+            return jobs_count
+
+
+def poll_scheduled_jobs(bot, job):
+    """
+    Run due jobs, to be run repeatedly by the job queue.
+
+    Args:
+        bot: a pre-initialized bot instance.
+        job: job with the database and the shard ID, can be None, as
+            context.
+    """
+    redis_db, shard_id = job.context
+    run_due_jobs(redis_db, bot, shard_id)
@@ -0,0 +1,62 @@
+"""Chat sessions of telegram bot."""
+
+from app.bots.settings import SESSION_TTL
+
+SESSION_KEY = 'session:{0}'
+
+
+def load_session(redis_db, chat_id):
+    """
+    Load session of the chat in one round-trip.
+
+    State of chats that used the bot before sessions were introduced is
+    moved to the session.
+
+    Returns:
+        return: session data.
+
+    Args:
+        redis_db: database for the sessions.
+        chat_id: ID of the chat.
+    """
+    pipeline = redis_db.pipeline()
+    pipeline.hgetall(SESSION_KEY.format(chat_id))
+    pipeline.get(chat_id)
+    session, legacy_state = pipeline.execute()
+
+    if legacy_state and 'state' not in session:
+        session['state'] = legacy_state
+        redis_db.delete(chat_id)
+
+    return session
+
+
+def save_session(redis_db, chat_id, session):
+    """
+    Save session of the chat in one round-trip.
+
+    Fields set to None are removed, the session expires after SESSION_TTL
+    seconds without updates.
+
+    Args:
+        redis_db: database for the sessions.
+        chat_id: ID of the chat.
+        session: session data.
+    """
+    session_key = SESSION_KEY.format(chat_id)
+    fields = {
+        field: value for field, value in session.items()
+        if value is not None
+    }
+    removed_fields = [
+        field for field, value in session.items()
+        if value is None
+    ]
+
+    pipeline = redis_db.pipeline()
+    if fields:
+        pipeline.hmset(session_key, fields)
+    if removed_fields:
+        pipeline.hdel(session_key, *removed_fields)
+    pipeline.expire(session_key, SESSION_TTL)
+    pipeline.execute()
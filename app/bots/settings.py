@@ -0,0 +1,50 @@
+"""Settings for the telegram bot."""
+
+from environs import Env
+
+env = Env()
+env.read_env()
+
+PIZZERIA_FLOW_SLUG = env.str('PIZZERIA_FLOW_SLUG', 'pizzeria')
+PIZZERIA_REFRESH_INTERVAL = env.int('PIZZERIA_REFRESH_INTERVAL', 600)
+
+GEOCODER_URL = env.str('GEOCODER_URL', 'https://geocode-maps.yandex.ru/1.x')
+GEOCODER_TIMEOUT = env.float('GEOCODER_TIMEOUT', 5)
+GEOCODE_CACHE_SIZE = env.int('GEOCODE_CACHE_SIZE', 10000)
+GEOCODE_CACHE_TTL = env.int('GEOCODE_CACHE_TTL', 30 * 24 * 60 * 60)
+GEOCODE_NEGATIVE_CACHE_TTL = env.int('GEOCODE_NEGATIVE_CACHE_TTL', 60 * 60)
+
+TELEGRAM_API_URL = env.str('TELEGRAM_API_URL', 'https://api.telegram.org/bot')
+TELEGRAM_RATE_LIMIT = env.float('TELEGRAM_RATE_LIMIT', 30)
+TELEGRAM_CHAT_RATE_LIMIT = env.float('TELEGRAM_CHAT_RATE_LIMIT', 1)
+TELEGRAM_CHAT_BURST = env.int('TELEGRAM_CHAT_BURST', 3)
+OUTBOX_WORKERS = env.int('OUTBOX_WORKERS', 4)
+OUTBOX_RETRIES = env.int('OUTBOX_RETRIES', 3)
+
+BOT_MODE = env.str('BOT_MODE', 'polling')
+WEBHOOK_URL = env.str('WEBHOOK_URL', None)
+WEBHOOK_SECRET = env.str('WEBHOOK_SECRET', None)
+WEBHOOK_LISTEN = env.str('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = env.int('WEBHOOK_PORT', 8443)
+WEBHOOK_WORKERS = env.int('WEBHOOK_WORKERS', 4)
+WEBHOOK_QUEUE_SIZE = env.int('WEBHOOK_QUEUE_SIZE', 1000)
+
+SHARD_ROLE = env.str('SHARD_ROLE', '')
+SHARDS_COUNT = env.int('SHARDS_COUNT', 1)
+SHARD_ID = env.int('SHARD_ID', 0)
+SHARD_REPORT_INTERVAL = env.int('SHARD_REPORT_INTERVAL', 60)
+
+SCHEDULER_POLL_INTERVAL = env.float('SCHEDULER_POLL_INTERVAL', 1)
+LATE_DELIVERY_DELAY = env.int('LATE_DELIVERY_DELAY', 60 * 60)
+
+SESSION_TTL = env.int('SESSION_TTL', 30 * 24 * 60 * 60)
+
+CART_MIRROR_MAX_AGE = env.int('CART_MIRROR_MAX_AGE', 10 * 60)
+CART_DEBOUNCE_DELAY = env.float('CART_DEBOUNCE_DELAY', 2)
+
+CHECKOUT_EXECUTOR_SIZE = env.int('CHECKOUT_EXECUTOR_SIZE', 8)
+
+METRICS_LISTEN = env.str('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = env.int('METRICS_PORT', None)
+
+UPDATE_LOG_PATH = env.str('UPDATE_LOG_PATH', None)
@@ -0,0 +1,171 @@
+"""Partitioning of updates between bot workers."""
+
+import bisect
+import hashlib
+import json
+import logging
+
+from telegram import Update
+from telegram.ext import DispatcherHandlerStop
+
+logger = logging.getLogger(__name__)
+
+SHARD_QUEUE_KEY = 'updates:shard:{0}'
+SHARD_PROCESSING_KEY = 'updates:shard:{0}:processing'
+VIRTUAL_NODES = 64
+BLOCK_TIMEOUT = 5
+
+
+class ShardRing:
+    """Consistent hashing of chats to shards."""
+
+    def __init__(self, shards_count, virtual_nodes=VIRTUAL_NODES):
+        """
+        Build the ring.
+
+        Args:
+            shards_count: number of shards.
+            virtual_nodes: points of every shard on the ring.
+        """
+        self.shards_count = shards_count
+        nodes = sorted(
+            (_hash('{0}:{1}'.format(shard_id, node)), shard_id)
+            for shard_id in range(shards_count)
+            for node in range(virtual_nodes)
+        )
+        self.node_hashes = [node_hash for node_hash, _ in nodes]
+        self.node_shards = [shard_id for _, shard_id in nodes]
+
+    def get_shard(self, chat_id):
+        """
+        Get shard of the chat.
+
+        Returns:
+            return: ID of the shard.
+
+        Args:
+            chat_id: ID of the chat.
+        """
+        node = bisect.bisect(self.node_hashes, _hash(str(chat_id)))
+
+        return self.node_shards[node % len(self.node_shards)]
+
+
+def create_router(redis_db, ring):
+    """
+    Create handler callback pushing updates to the shard queues.
+
+    Returns:
+        return: callback for the TypeHandler.
+
+    Args:
+        redis_db: database with the shard queues.
+        ring: ring of the shards.
+    """
+    def route_update(bot, update):
+        shard_id = ring.get_shard(get_update_chat_id(update))
+        redis_db.lpush(SHARD_QUEUE_KEY.format(shard_id), update.to_json())
+
+        raise DispatcherHandlerStop()
+
+    return route_update
+
+
+def get_update_chat_id(update):
+    """
+    Get ID of the chat the update belongs to.
+
+    Returns:
+        return: ID of the chat or of the user for updates without chat.
+
+    Args:
+        update: Update class instance that represents an incoming update.
+    """
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+
+    return 0
+
+
+def run_shard_worker(redis_db, dispatcher, shard_id):
+    """
+    Process updates of the shard one by one.
+
+    Updates of a chat always come to the same shard, so they are handled
+    strictly in order. An update taken by a crashed worker is processed
+    again on restart.
+
+    Args:
+        redis_db: database with the shard queues.
+        dispatcher: dispatcher with the bot handlers.
+        shard_id: ID of the shard to process.
+    """
+    queue_key = SHARD_QUEUE_KEY.format(shard_id)
+    processing_key = SHARD_PROCESSING_KEY.format(shard_id)
+
+    while True:
+        serialized_update = redis_db.rpop(processing_key)
+        if serialized_update is None:
+            break
+        redis_db.rpush(queue_key, serialized_update)
+
+    logger.info('Worker of shard {0} started'.format(shard_id))
+    while True:
+        serialized_update = redis_db.brpoplpush(
+            queue_key,
+            processing_key,
+            timeout=BLOCK_TIMEOUT,
+        )
+        if serialized_update is None:
+            continue
+
+        try:
+            update = Update.de_json(
+                json.loads(serialized_update),
+                dispatcher.bot,
+            )
+            dispatcher.process_update(update)
+        except Exception as err:
+            logger.error(err)
+        finally:
+            redis_db.lrem(processing_key, 1, serialized_update)
+
+
+def get_shard_queue_depths(redis_db, shards_count):
+    """
+    Get number of updates waiting in every shard.
+
+    Returns:
+        return: queue depths by shard ID.
+
+    Args:
+        redis_db: database with the shard queues.
+        shards_count: number of shards.
+    """
+    pipeline = redis_db.pipeline()
+    for shard_id in range(shards_count):
+        pipeline.llen(SHARD_QUEUE_KEY.format(shard_id))
+
+    return dict(enumerate(pipeline.execute()))
+
+
+def report_shard_queue_depths(bot, job):
+    """
+    Log queue depths of the shards.
+
+    Args:
+        bot: a pre-initialized bot instance.
+        job: job with the database and number of shards as context.
+    """
+    redis_db, shards_count = job.context
+    queue_depths = get_shard_queue_depths(redis_db, shards_count)
+    logger.info('Shard queue depths: {0}'.format(', '.join(
+        '{0}={1}'.format(shard_id, depth)
+        for shard_id, depth in queue_depths.items()
+    )))
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
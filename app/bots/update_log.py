@@ -0,0 +1,136 @@
+"""Anonymized log of incoming updates for load replay."""
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+ID_PATTERN = re.compile(
+    r'\b(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+    r'|[0-9a-f]{24,})\b',
+)
+NUMBER_PATTERN = re.compile(r'\b\d+\b')
+KEPT_TEXTS = frozenset(('/start',))
+
+_update_log = {
+    'file': None,
+    'lock': threading.Lock(),
+    'salt': os.urandom(16),
+}
+
+
+def open_update_log(path):
+    """
+    Start appending handled updates to the log.
+
+    Args:
+        path: path of the log file.
+    """
+    with _update_log['lock']:
+        _update_log['file'] = open(path, 'a', buffering=1)
+
+
+def record_update(chat_id, state, update, started_at, duration):
+    """
+    Append the update to the log if it is open.
+
+    Only the shape of the update is written: chats are replaced by salted
+    hashes, IDs and numbers in callback data are masked and texts other
+    than commands are dropped.
+
+    Args:
+        chat_id: ID of the chat.
+        state: state that handled the update.
+        update: Update class instance that represents an incoming update.
+        started_at: time.time() when the update was received.
+        duration: seconds spent in the handler.
+    """
+    if _update_log['file'] is None:
+        return
+
+    kind, shape = get_update_shape(update)
+    record = json.dumps({
+        't': round(started_at, 3),
+        'c': get_chat_alias(chat_id),
+        's': state,
+        'k': kind,
+        'd': shape,
+        'ms': round(duration * 1000, 1),
+    }, ensure_ascii=False, separators=(',', ':'))
+
+    with _update_log['lock']:
+        _update_log['file'].write('{0}\n'.format(record))
+
+
+def get_update_shape(update):
+    """
+    Get kind of the update and its anonymized payload.
+
+    Returns:
+        return: kind of the update and its shape.
+
+    Args:
+        update: Update class instance that represents an incoming update.
+    """
+    if update.callback_query:
+        return 'callback', get_callback_shape(update.callback_query.data)
+
+    if update.message.location:
+        return 'location', None
+
+    text = update.message.text
+    if text in KEPT_TEXTS:
+        return 'text', text
+
+    return 'text', None
+
+
+def get_callback_shape(data):
+    """
+    Mask IDs and numbers in the callback data.
+
+    Returns:
+        return: callback data shape, like 'add, :id' or 'page, :n'.
+
+    Args:
+        data: callback data of the button.
+    """
+    if data.startswith('['):
+        return 'delivery'
+
+    return NUMBER_PATTERN.sub(':n', ID_PATTERN.sub(':id', data))
+
+
+def get_chat_alias(chat_id):
+    """
+    Get anonymous alias of the chat, stable while the process runs.
+
+    Returns:
+        return: alias of the chat.
+
+    Args:
+        chat_id: ID of the chat.
+    """
+    return hashlib.blake2b(
+        str(chat_id).encode(),
+        key=_update_log['salt'],
+        digest_size=6,
+    ).hexdigest()
+
+
+def read_update_log(path):
+    """
+    Read records of the update log in the order of arrival.
+
+    Returns:
+        return: list of the records.
+
+    Args:
+        path: path of the log file.
+    """
+    with open(path) as log_file:
+        records = [json.loads(line) for line in log_file if line.strip()]
+
+    return sorted(records, key=lambda record: record['t'])
+
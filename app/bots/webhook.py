@@ -0,0 +1,137 @@
+"""Webhook server for telegram bot."""
+
+import hmac
+import json
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram import Update
+
+from app.bots.sharding import get_update_chat_id
+
+logger = logging.getLogger(__name__)
+
+MAX_UPDATE_SIZE = 1024 * 1024
+
+
+def run_webhook(updater, url, secret, listen, port, workers, queue_size):
+    """
+    Receive updates through the webhook and dispatch them.
+
+    Chats are spread between the worker threads, and every worker has
+    its own bounded queue, so updates of a chat are processed one by one
+    in the order they came. When the queue is full the server answers
+    503, so Telegram delivers the update later instead of the bot falling
+    behind.
+
+    Args:
+        updater: updater with the bot and dispatcher.
+        url: public URL of the server.
+        secret: secret path of the webhook.
+        listen: address to listen on.
+        port: port to listen on.
+        workers: number of threads processing updates.
+        queue_size: number of updates waiting for processing in all
+            queues.
+    """
+    if not url or not secret:
+        raise ValueError('WEBHOOK_URL and WEBHOOK_SECRET are required')
+
+    worker_queues = [
+        queue.Queue(maxsize=max(queue_size // workers, 1))
+        for _ in range(workers)
+    ]
+    for worker_number, updates in enumerate(worker_queues):
+        threading.Thread(
+            target=process_updates,
+            args=(updater.dispatcher, updates),
+            name='webhook-worker-{0}'.format(worker_number),
+            daemon=True,
+        ).start()
+
+    updater.job_queue.start()
+    updater.bot.set_webhook(url='{0}/{1}'.format(url.rstrip('/'), secret))
+
+    server = ThreadingHTTPServer(
+        (listen, port),
+        create_request_handler(updater.bot, worker_queues, secret),
+    )
+    logger.info('Webhook is listening on {0}:{1}'.format(listen, port))
+    server.serve_forever()
+
+
+def process_updates(dispatcher, updates):
+    """
+    Dispatch updates from the queue.
+
+    Args:
+        dispatcher: dispatcher with the bot handlers.
+        updates: queue with incoming updates.
+    """
+    while True:
+        update = updates.get()
+        try:
+            dispatcher.process_update(update)
+        except Exception as err:
+            logger.error(err)
+        finally:
+            updates.task_done()
+
+
+def create_request_handler(bot, worker_queues, secret):
+    """
+    Create handler of the webhook requests.
+
+    Returns:
+        return: request handler class.
+
+    Args:
+        bot: a pre-initialized bot instance.
+        worker_queues: queues of the worker threads.
+        secret: secret path of the webhook.
+    """
+    webhook_path = '/{0}'.format(secret).encode()
+
+    class WebhookRequestHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            # Bytes, as compare_digest rejects non-ASCII strings.
+            if not hmac.compare_digest(self.path.encode(), webhook_path):
+                self.send_response(403)
+                self.end_headers()
+                return
+
+            content_length = int(self.headers.get('Content-Length', 0))
+            if not 0 < content_length <= MAX_UPDATE_SIZE:
+                self.send_response(400)
+                self.end_headers()
+                return
+
+            try:
+                update_data = json.loads(self.rfile.read(content_length))
+                update = Update.de_json(update_data, bot)
+            except ValueError:
+                update = None
+            if update is None:
+                self.send_response(400)
+                self.end_headers()
+                return
+
+            chat_id = get_update_chat_id(update)
+            updates = worker_queues[chat_id % len(worker_queues)]
+            try:
+                updates.put_nowait(update)
+            except queue.Full:
+                logger.warning('Update queue is full, shedding update')
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return WebhookRequestHandler
@@ -0,0 +1,374 @@
+"""Metrics in the Prometheus text format."""
+
+import bisect
+import contextlib
+import contextvars
+import logging
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+)
+ID_SEGMENT_PATTERN = re.compile(
+    r'(?<=/)(?:\d+|[0-9a-f]{8}-[0-9a-f-]{27}|[0-9a-f]{24,})(?=/|$)',
+)
+
+_metrics = []
+_io_waits = contextvars.ContextVar('io_waits')
+
+
+class Counter:
+    """Counter of events by label values."""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Create and register the counter.
+
+        Args:
+            name: name of the metric.
+            documentation: help text of the metric.
+            labelnames: names of the labels.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        """
+        Increase the counter.
+
+        Args:
+            labelvalues: values of the labels.
+            amount: value to add.
+        """
+        with self._lock:
+            self._values[labelvalues] = self._values.get(
+                labelvalues,
+                0,
+            ) + amount
+
+    def collect(self):
+        """
+        Get samples of the metric.
+
+        Returns:
+            return: list of sample name, labels and value.
+        """
+        with self._lock:
+            values = list(self._values.items())
+
+        return [
+            (self.name, dict(zip(self.labelnames, labelvalues)), value)
+            for labelvalues, value in values
+        ]
+
+
+class Histogram:
+    """Histogram of observed values by label values."""
+
+    type_name = 'histogram'
+
+    def __init__(
+        self,
+        name,
+        documentation,
+        labelnames=(),
+        buckets=DEFAULT_BUCKETS,
+    ):
+        """
+        Create and register the histogram.
+
+        Args:
+            name: name of the metric.
+            documentation: help text of the metric.
+            labelnames: names of the labels.
+            buckets: upper bounds of the buckets.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}
+        _metrics.append(self)
+
+    def observe(self, value, *labelvalues):
+        """
+        Record the value.
+
+        Args:
+            value: observed value.
+            labelvalues: values of the labels.
+        """
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labelvalues)
+            if counts is None:
+                # Bucket counts, then count and sum of the values.
+                counts = [0] * (len(self.buckets) + 2)
+                self._values[labelvalues] = counts
+            counts[bucket_index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def collect(self):
+        """
+        Get samples of the metric.
+
+        Returns:
+            return: list of sample name, labels and value.
+        """
+        with self._lock:
+            values = [
+                (labelvalues, list(counts))
+                for labelvalues, counts in self._values.items()
+            ]
+
+        samples = []
+        for labelvalues, counts in values:
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative_count = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative_count += count
+                samples.append((
+                    '{0}_bucket'.format(self.name),
+                    dict(labels, le=format_value(bound)),
+                    cumulative_count,
+                ))
+            samples.append((
+                '{0}_bucket'.format(self.name),
+                dict(labels, le='+Inf'),
+                counts[-2],
+            ))
+            samples.append(('{0}_count'.format(self.name), labels, counts[-2]))
+            samples.append(('{0}_sum'.format(self.name), labels, counts[-1]))
+
+        return samples
+
+
+class Gauge:
+    """Gauge read from a callback when the metrics are scraped."""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, callback, labelnames=()):
+        """
+        Create and register the gauge.
+
+        Args:
+            name: name of the metric.
+            documentation: help text of the metric.
+            callback: function returning the value, or values by label
+                values if the gauge has labels.
+            labelnames: names of the labels.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = labelnames
+        _metrics.append(self)
+
+    def collect(self):
+        """
+        Get samples of the metric.
+
+        Returns:
+            return: list of sample name, labels and value.
+        """
+        values = self.callback()
+        if not self.labelnames:
+            return [(self.name, {}, values)]
+
+        return [
+            (self.name, dict(zip(self.labelnames, labelvalues)), value)
+            for labelvalues, value in values.items()
+        ]
+
+
+def format_value(value):
+    """
+    Format the sample value.
+
+    Returns:
+        return: value in the text format.
+
+    Args:
+        value: number to format.
+    """
+    if isinstance(value, float) and value.is_integer():
+        return '{0:.1f}'.format(value)
+
+    return str(value)
+
+
+def format_labels(labels):
+    """
+    Format labels of the sample.
+
+    Returns:
+        return: labels in the text format.
+
+    Args:
+        labels: values by label names.
+    """
+    if not labels:
+        return ''
+
+    formatted_labels = []
+    for label, label_value in labels.items():
+        label_value = str(label_value).replace('\\', '\\\\')
+        label_value = label_value.replace('"', '\\"').replace('\n', '\\n')
+        formatted_labels.append('{0}="{1}"'.format(label, label_value))
+
+    return '{{{0}}}'.format(','.join(formatted_labels))
+
+
+def render_metrics():
+    """
+    Render all registered metrics.
+
+    Returns:
+        return: metrics in the Prometheus text format.
+    """
+    lines = []
+    for metric in _metrics:
+        try:
+            samples = metric.collect()
+        except Exception as err:
+            logger.error('Metric {0} failed: {1}'.format(metric.name, err))
+            continue
+
+        lines.append('# HELP {0} {1}'.format(
+            metric.name,
+            metric.documentation,
+        ))
+        lines.append('# TYPE {0} {1}'.format(metric.name, metric.type_name))
+        for sample_name, labels, value in samples:
+            lines.append('{0}{1} {2}'.format(
+                sample_name,
+                format_labels(labels),
+                format_value(value),
+            ))
+    lines.append('')
+
+    return '\n'.join(lines)
+
+
+def normalize_endpoint(path):
+    """
+    Replace IDs in the path, so endpoints don't multiply the labels.
+
+    Returns:
+        return: path with ':id' instead of IDs.
+
+    Args:
+        path: path of the request.
+    """
+    return ID_SEGMENT_PATTERN.sub(':id', path.split('?', 1)[0])
+
+
+def observe_request(service, endpoint, started_at, status=None):
+    """
+    Record duration and outcome of the external request.
+
+    Args:
+        service: name of the called service.
+        endpoint: normalized endpoint of the request.
+        started_at: time.monotonic() before the request.
+        status: HTTP status or name of the error, None on success.
+    """
+    duration = time.monotonic() - started_at
+    EXTERNAL_REQUEST_DURATION.observe(duration, service, endpoint)
+    if status is not None:
+        EXTERNAL_REQUEST_ERRORS.inc(service, endpoint, str(status))
+
+    io_waits = _io_waits.get(None)
+    if io_waits is not None:
+        io_waits.append(duration)
+
+
+@contextlib.contextmanager
+def measure_io_wait(histogram, *labelvalues):
+    """
+    Observe time the block spent in external requests.
+
+    Requests made from threads and tasks started with a copy of the
+    context are counted too, so concurrent requests add up. Requests
+    finished after the block exits, like outbox sends, are not counted.
+
+    Args:
+        histogram: histogram for the total duration of the requests.
+        labelvalues: values of the histogram labels.
+    """
+    io_waits = []
+    token = _io_waits.set(io_waits)
+    try:
+        yield
+    finally:
+        _io_waits.reset(token)
+        histogram.observe(sum(io_waits), *labelvalues)
+
+
+def start_metrics_server(listen, port):
+    """
+    Serve the metrics over HTTP in a background thread.
+
+    Returns:
+        return: the running server.
+
+    Args:
+        listen: address to listen on.
+        port: port to listen on.
+    """
+    server = ThreadingHTTPServer((listen, port), MetricsRequestHandler)
+    threading.Thread(
+        target=server.serve_forever,
+        name='metrics-server',
+        daemon=True,
+    ).start()
+    logger.info('Metrics are served on {0}:{1}'.format(listen, port))
+
+    return server
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Handler answering every GET with the metrics."""
+
+    def do_GET(self):
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+EXTERNAL_REQUEST_DURATION = Histogram(
+    'external_request_duration_seconds',
+    'Duration of requests to Moltin, Yandex and Telegram.',
+    ('service', 'endpoint'),
+)
+EXTERNAL_REQUEST_ERRORS = Counter(
+    'external_request_errors_total',
+    'Failed requests to Moltin, Yandex and Telegram.',
+    ('service', 'endpoint', 'status'),
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total',
+    'Cache lookups by the result.',
+    ('cache', 'result'),
+)
@@ -0,0 +1,716 @@
+"""Local stand-ins for Moltin, Yandex geocoder and Telegram Bot API."""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+CITY_CENTER = (37.6176, 55.7558)
+CITY_RADIUS_DEGREES = 0.2
+
+
+class FakeService:
+    """HTTP server answering with injected latency and errors."""
+
+    name = 'fake'
+
+    def __init__(self, latency=0, jitter=0, error_rate=0, throttle_rate=0):
+        """
+        Create the server on a free local port.
+
+        Args:
+            latency: mean delay of the answers in seconds.
+            jitter: maximum deviation of the delay in seconds.
+            error_rate: share of requests answered with 500.
+            throttle_rate: share of requests answered with 429.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            self.create_request_handler(),
+        )
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        """URL of the server."""
+        host, port = self.server.server_address
+
+        return 'http://{0}:{1}'.format(host, port)
+
+    def start(self):
+        """Serve requests in a background thread."""
+        threading.Thread(
+            target=self.server.serve_forever,
+            name='{0}-server'.format(self.name),
+            daemon=True,
+        ).start()
+
+        return self
+
+    def stop(self):
+        """Stop the server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_delay(self):
+        """
+        Get delay of the next answer.
+
+        Returns:
+            return: seconds to wait.
+        """
+        return max(
+            self.latency + random.uniform(-self.jitter, self.jitter),
+            0,
+        )
+
+    def get_injected_error(self):
+        """
+        Choose the injected error of the next answer.
+
+        Returns:
+            return: 500 or 429 status, None for a normal answer.
+        """
+        chance = random.random()
+        if chance < self.throttle_rate:
+            return 429
+        if chance < self.throttle_rate + self.error_rate:
+            return 500
+
+        return None
+
+    def handle(self, method, path, query, body, content_type):
+        """
+        Answer the request.
+
+        Returns:
+            return: status, headers and JSON payload of the answer.
+
+        Args:
+            method: HTTP method.
+            path: path of the request.
+            query: parsed query string.
+            body: raw request body.
+            content_type: Content-Type header of the request.
+        """
+        raise NotImplementedError
+
+    def handle_error(self, status):
+        """
+        Answer with the injected error.
+
+        Returns:
+            return: status, headers and JSON payload of the answer.
+
+        Args:
+            status: status of the error.
+        """
+        headers = {'Retry-After': '1'} if status == 429 else {}
+
+        return status, headers, {'errors': [{'status': status}]}
+
+    def create_request_handler(self):
+        """
+        Create handler class bound to the service.
+
+        Returns:
+            return: request handler class.
+        """
+        service = self
+
+        class FakeRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.answer('GET')
+
+            def do_POST(self):
+                self.answer('POST')
+
+            def do_PUT(self):
+                self.answer('PUT')
+
+            def do_DELETE(self):
+                self.answer('DELETE')
+
+            def answer(self, method):
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(content_length)
+                url = urlsplit(self.path)
+                time.sleep(service.get_delay())
+
+                injected_error = service.get_injected_error()
+                with service.lock:
+                    service.calls[(method, url.path)] += 1
+                if injected_error:
+                    status, headers, payload = service.handle_error(
+                        injected_error,
+                    )
+                else:
+                    status, headers, payload = service.handle(
+                        method,
+                        url.path,
+                        parse_qs(url.query),
+                        body,
+                        self.headers.get('Content-Type', ''),
+                    )
+
+                serialized_payload = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', len(serialized_payload))
+                for header, header_value in headers.items():
+                    self.send_header(header, header_value)
+                self.end_headers()
+                self.wfile.write(serialized_payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return FakeRequestHandler
+
+
+class FakeMoltin(FakeService):
+    """Moltin endpoints used by app.api with in-memory carts and flows."""
+
+    name = 'moltin'
+
+    def __init__(self, products_count=24, pizzerias=None, **kwargs):
+        """
+        Create the server with generated products and pizzerias.
+
+        Args:
+            products_count: number of products in the catalog.
+            pizzerias: pizzeria entries, generated if not passed.
+            kwargs: latency and error settings of FakeService.
+        """
+        super().__init__(**kwargs)
+        self.products = [
+            create_product(product_number)
+            for product_number in range(products_count)
+        ]
+        self.products_by_id = {
+            product['id']: product for product in self.products
+        }
+        self.flows = defaultdict(dict)
+        for pizzeria in pizzerias or create_pizzerias(30):
+            self.flows['pizzeria'][pizzeria['id']] = pizzeria
+        self.carts = defaultdict(dict)
+        self.routes = [
+            ('POST', r'/oauth/access_token', self.create_token),
+            ('GET', r'/v2/products', self.get_products),
+            ('GET', r'/v2/products/([^/]+)', self.get_product),
+            ('GET', r'/v2/files/([^/]+)', self.get_file),
+            ('GET', r'/v2/carts/([^/]+)', self.get_cart),
+            ('GET', r'/v2/carts/([^/]+)/items', self.get_cart_items),
+            ('POST', r'/v2/carts/([^/]+)/items', self.add_cart_item),
+            ('PUT', r'/v2/carts/([^/]+)/items/([^/]+)', self.update_cart_item),
+            (
+                'DELETE',
+                r'/v2/carts/([^/]+)/items/([^/]+)',
+                self.delete_cart_item,
+            ),
+            ('GET', r'/v2/flows/([^/]+)/entries', self.get_entries),
+            ('GET', r'/v2/flows/([^/]+)/entries/([^/]+)', self.get_entry),
+            ('POST', r'/v2/flows/([^/]+)/entries/?', self.create_entry),
+        ]
+
+    def handle(self, method, path, query, body, content_type):
+        for route_method, pattern, handler in self.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                payload = parse_body(body, content_type)
+                with self.lock:
+                    return 200, {}, handler(query, payload, *match.groups())
+
+        return 404, {}, {'errors': [{'status': 404, 'detail': path}]}
+
+    def create_token(self, query, payload):
+        return {
+            'access_token': uuid.uuid4().hex,
+            'expires': int(time.time()) + 3600,
+            'expires_in': 3600,
+        }
+
+    def get_products(self, query, payload):
+        offset = int(query.get('page[offset]', ['0'])[0])
+        limit = int(query.get('page[limit]', ['100'])[0])
+
+        return {'data': self.products[offset:offset + limit]}
+
+    def get_product(self, query, payload, product_id):
+        return {'data': self.products_by_id[product_id]}
+
+    def get_file(self, query, payload, file_id):
+        return {
+            'data': {
+                'id': file_id,
+                'link': {
+                    'href': '{0}/pictures/{1}.jpg'.format(self.url, file_id),
+                },
+            },
+        }
+
+    def get_cart(self, query, payload, cart_id):
+        return {'data': {'id': cart_id, 'type': 'cart'}}
+
+    def get_cart_items(self, query, payload, cart_id):
+        cart = self.carts[cart_id]
+        cart_items = []
+        total = 0
+        for product_id, quantity in cart.items():
+            product = self.products_by_id[product_id]
+            price = product['price'][0]['amount']
+            total += price * quantity
+            cart_items.append({
+                'id': get_cart_item_id(cart_id, product_id),
+                'type': 'cart_item',
+                'product_id': product_id,
+                'name': product['name'],
+                'quantity': quantity,
+                'meta': {
+                    'display_price': {
+                        'with_tax': {
+                            'unit': format_price(price),
+                            'value': format_price(price * quantity),
+                        },
+                    },
+                },
+            })
+
+        return {
+            'data': cart_items,
+            'meta': {
+                'display_price': {
+                    'with_tax': format_price(total),
+                    'without_tax': format_price(total),
+                },
+            },
+        }
+
+    def add_cart_item(self, query, payload, cart_id):
+        product_id = payload['data']['id']
+        quantity = payload['data']['quantity']
+        cart = self.carts[cart_id]
+        cart[product_id] = cart.get(product_id, 0) + quantity
+
+        return self.get_cart_items(query, payload, cart_id)
+
+    def update_cart_item(self, query, payload, cart_id, item_id):
+        for product_id in self.carts[cart_id]:
+            if get_cart_item_id(cart_id, product_id) == item_id:
+                self.carts[cart_id][product_id] = payload['data']['quantity']
+
+        return self.get_cart_items(query, payload, cart_id)
+
+    def delete_cart_item(self, query, payload, cart_id, item_id):
+        for product_id in list(self.carts[cart_id]):
+            if get_cart_item_id(cart_id, product_id) == item_id:
+                del self.carts[cart_id][product_id]
+
+        return self.get_cart_items(query, payload, cart_id)
+
+    def get_entries(self, query, payload, flow_slug):
+        entries = list(self.flows[flow_slug].values())
+        offset = int(query.get('page[offset]', ['0'])[0])
+        limit = int(query.get('page[limit]', [str(len(entries))])[0])
+
+        return {'data': entries[offset:offset + limit]}
+
+    def get_entry(self, query, payload, flow_slug, entry_id):
+        return {'data': self.flows[flow_slug][entry_id]}
+
+    def create_entry(self, query, payload, flow_slug):
+        # The customer address is posted as a form, so its data is not
+        # a nested object.
+        entry_data = payload.get('data')
+        if not isinstance(entry_data, dict):
+            entry_data = {}
+        entry = dict(entry_data, id=str(uuid.uuid4()))
+        self.flows[flow_slug][entry['id']] = entry
+
+        return {'data': entry}
+
+
+class FakeGeocoder(FakeService):
+    """Yandex geocoder placing every address inside the city."""
+
+    name = 'geocoder'
+
+    def handle(self, method, path, query, body, content_type):
+        address = query.get('geocode', [''])[0]
+        longitude, latitude = get_address_position(address)
+        feature = {
+            'GeoObject': {
+                'Point': {'pos': '{0} {1}'.format(longitude, latitude)},
+            },
+        }
+
+        return 200, {}, {
+            'response': {
+                'GeoObjectCollection': {'featureMember': [feature]},
+            },
+        }
+
+
+class FakeTelegram(FakeService):
+    """Telegram Bot API remembering the last message of every chat."""
+
+    name = 'telegram'
+
+    def __init__(self, **kwargs):
+        """
+        Create the server.
+
+        Args:
+            kwargs: latency and error settings of FakeService.
+        """
+        super().__init__(**kwargs)
+        self.message_ids = Counter()
+        self.last_messages = {}
+
+    def handle(self, method, path, query, body, content_type):
+        bot_method = path.rsplit('/', 1)[-1]
+        payload = parse_body(body, content_type)
+        if bot_method == 'getMe':
+            return 200, {}, {'ok': True, 'result': {
+                'id': 1,
+                'is_bot': True,
+                'first_name': 'Benchmark',
+                'username': 'benchmark_bot',
+            }}
+
+        chat_id = payload.get('chat_id')
+        is_sent = bot_method.startswith('send')
+        is_edited = bot_method.startswith('editMessage')
+        if chat_id is None or not (is_sent or is_edited):
+            return 200, {}, {'ok': True, 'result': True}
+
+        chat_id = int(chat_id)
+        with self.lock:
+            if is_sent:
+                self.message_ids[chat_id] += 1
+                message_id = self.message_ids[chat_id]
+            else:
+                message_id = int(payload.get('message_id', 0))
+                payload = merge_edit(
+                    self.last_messages.get(chat_id),
+                    message_id,
+                    payload,
+                )
+            message = create_message(chat_id, message_id, payload)
+            if is_edited and is_same_message(
+                self.last_messages.get(chat_id),
+                message,
+            ):
+                return 400, {}, {
+                    'ok': False,
+                    'error_code': 400,
+                    'description': 'Bad Request: message is not modified',
+                }
+            self.last_messages[chat_id] = dict(payload, message=message)
+
+        return 200, {}, {'ok': True, 'result': message}
+
+    def handle_error(self, status):
+        payload = {
+            'ok': False,
+            'error_code': status,
+            'description': 'Injected error',
+        }
+        if status == 429:
+            payload['parameters'] = {'retry_after': 1}
+
+        return status, {}, payload
+
+    def get_last_message(self, chat_id):
+        """
+        Get the last message sent or edited in the chat.
+
+        Returns:
+            return: parameters of the Bot API call with the message.
+
+        Args:
+            chat_id: ID of the chat.
+        """
+        with self.lock:
+            return self.last_messages.get(chat_id)
+
+    def get_buttons(self, chat_id):
+        """
+        Get callback data of the inline buttons of the last message.
+
+        Returns:
+            return: callback data by button text.
+
+        Args:
+            chat_id: ID of the chat.
+        """
+        last_message = self.get_last_message(chat_id) or {}
+        reply_markup = last_message.get('reply_markup') or {}
+        if isinstance(reply_markup, str):
+            reply_markup = json.loads(reply_markup)
+
+        return {
+            button['text']: button.get('callback_data')
+            for row in reply_markup.get('inline_keyboard', [])
+            for button in row
+        }
+
+
+def create_product(product_number):
+    """
+    Create product of the fake catalog.
+
+    Returns:
+        return: data about the product.
+
+    Args:
+        product_number: number of the product.
+    """
+    product_id = str(uuid.UUID(int=product_number + 1))
+
+    return {
+        'id': product_id,
+        'type': 'product',
+        'name': 'Pizza {0}'.format(product_number),
+        'sku': str(product_number),
+        'description': 'Benchmark pizza number {0}'.format(product_number),
+        'price': [
+            {'amount': 300 + product_number * 10, 'currency': 'RUB'},
+        ],
+        'relationships': {
+            'main_image': {
+                'data': {'type': 'main_image', 'id': product_id},
+            },
+        },
+        'meta': {'timestamps': {'updated_at': '2021-01-01T00:00:00Z'}},
+    }
+
+
+def create_pizzerias(pizzerias_count):
+    """
+    Create pizzerias spread over the city.
+
+    Returns:
+        return: pizzeria entries.
+
+    Args:
+        pizzerias_count: number of pizzerias.
+    """
+    pizzerias = []
+    for pizzeria_number in range(pizzerias_count):
+        longitude, latitude = get_address_position(
+            'pizzeria {0}'.format(pizzeria_number),
+        )
+        pizzerias.append({
+            'id': str(uuid.UUID(int=10 ** 6 + pizzeria_number)),
+            'type': 'entry',
+            'alias': 'Pizzeria {0}'.format(pizzeria_number),
+            'address': 'Benchmark street {0}'.format(pizzeria_number),
+            'longitude': longitude,
+            'latitude': latitude,
+            'delivery_man_id': 10 ** 8 + pizzeria_number,
+        })
+
+    return pizzerias
+
+
+def create_message(chat_id, message_id, payload):
+    """
+    Create message returned by the Bot API.
+
+    Returns:
+        return: data about the message.
+
+    Args:
+        chat_id: ID of the chat.
+        message_id: ID of the message.
+        payload: parameters of the Bot API call.
+    """
+    message = {
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+    }
+    if 'text' in payload:
+        message['text'] = payload['text'].strip()
+    media = payload.get('media')
+    if isinstance(media, str):
+        media = json.loads(media)
+    if media:
+        payload = dict(payload, photo=media['media'], caption=media.get(
+            'caption',
+        ))
+    if payload.get('caption'):
+        message['caption'] = payload['caption'].strip()
+    if 'photo' in payload:
+        message['photo'] = [{
+            'file_id': get_photo_file_id(payload['photo']),
+            'width': 800,
+            'height': 800,
+        }]
+    reply_markup = payload.get('reply_markup')
+    if isinstance(reply_markup, str):
+        reply_markup = json.loads(reply_markup)
+    if reply_markup:
+        message['reply_markup'] = reply_markup
+
+    return message
+
+
+def merge_edit(last_message, message_id, payload):
+    """
+    Apply the edit to parameters of the last message.
+
+    Returns:
+        return: parameters of the edited message.
+
+    Args:
+        last_message: parameters of the last message in the chat.
+        message_id: ID of the edited message.
+        payload: parameters of the edit.
+    """
+    if not last_message or (
+        last_message['message']['message_id'] != message_id
+    ):
+        return payload
+
+    edited_message = {
+        name: value
+        for name, value in last_message.items()
+        if name not in ('message', 'photo', 'media')
+    }
+    edited_message.update(payload)
+    shown_message = last_message['message']
+    if 'media' not in payload and shown_message.get('photo'):
+        edited_message['media'] = {
+            'media': shown_message['photo'][-1]['file_id'],
+            'caption': payload.get('caption', shown_message.get('caption')),
+        }
+
+    return edited_message
+
+
+def is_same_message(last_message, message):
+    """
+    Check that the edit leaves the last message as it is.
+
+    Returns:
+        return: True if the edited message is the same.
+
+    Args:
+        last_message: parameters of the last message in the chat.
+        message: data about the edited message.
+    """
+    if not last_message:
+        return False
+    shown_message = dict(last_message['message'], date=None)
+
+    return shown_message == dict(message, date=None)
+
+
+def get_photo_file_id(photo):
+    """
+    Get file_id of the photo, the same as Telegram returns for an upload.
+
+    Returns:
+        return: file_id of the photo.
+
+    Args:
+        photo: file_id or URL of the photo.
+    """
+    if photo.startswith('photo-'):
+        return photo
+
+    return 'photo-{0}'.format(hashlib.sha1(photo.encode()).hexdigest())
+
+
+def get_address_position(address):
+    """
+    Place the address at a stable position inside the city.
+
+    Returns:
+        return: longitude and latitude as strings.
+
+    Args:
+        address: address to place.
+    """
+    address_hash = hashlib.sha1(address.encode()).digest()
+    longitude_shift = (address_hash[0] / 255 * 2 - 1) * CITY_RADIUS_DEGREES
+    latitude_shift = (address_hash[1] / 255 * 2 - 1) * CITY_RADIUS_DEGREES
+
+    return (
+        '{0:.6f}'.format(CITY_CENTER[0] + longitude_shift),
+        '{0:.6f}'.format(CITY_CENTER[1] + latitude_shift),
+    )
+
+
+def get_cart_item_id(cart_id, product_id):
+    """
+    Get stable ID of the product in the cart.
+
+    Returns:
+        return: ID of the cart item.
+
+    Args:
+        cart_id: ID of the cart.
+        product_id: ID of the product.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, '{0}/{1}'.format(
+        cart_id,
+        product_id,
+    )))
+
+
+def format_price(amount):
+    """
+    Format price like Moltin display prices.
+
+    Returns:
+        return: amount, currency and formatted price.
+
+    Args:
+        amount: price in roubles.
+    """
+    return {
+        'amount': amount,
+        'currency': 'RUB',
+        'formatted': '{0} руб.'.format(amount),
+    }
+
+
+def parse_body(body, content_type):
+    """
+    Parse JSON or form request body.
+
+    Returns:
+        return: parameters of the request.
+
+    Args:
+        body: raw request body.
+        content_type: Content-Type header of the request.
+    """
+    if not body:
+        return {}
+    if 'json' in content_type:
+        return json.loads(body)
+    if 'form' in content_type:
+        return {
+            name: values[0]
+            for name, values in parse_qs(body.decode()).items()
+        }
+
+    return {}
@@ -0,0 +1,477 @@
+"""Shared setup of the bot against the fake services."""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import wait
+
+from benchmarks.fakes import FakeGeocoder, FakeMoltin, FakeTelegram
+
+BENCHMARK_TOKEN = '123456:BENCHMARK'
+PERCENTILES = (50, 95, 99)
+
+
+class TrackedExecutor:
+    """Executor that lets the benchmark wait for the tasks of an update."""
+
+    def __init__(self, executor):
+        """
+        Wrap the executor.
+
+        Args:
+            executor: executor the bot submits its tasks to.
+        """
+        self.executor = executor
+        self._local = threading.local()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submit the task and remember it if the thread tracks its tasks.
+
+        Returns:
+            return: future of the task.
+
+        Args:
+            fn: function to run.
+            args: positional arguments of the function.
+            kwargs: keyword arguments of the function.
+        """
+        future = self.executor.submit(fn, *args, **kwargs)
+        tasks = getattr(self._local, 'tasks', None)
+        if tasks is not None:
+            tasks.append(future)
+
+        return future
+
+    @contextlib.contextmanager
+    def track(self):
+        """
+        Collect futures of the tasks submitted by the thread in the block.
+
+        Returns:
+            return: list filled with the futures.
+        """
+        self._local.tasks = []
+        try:
+            yield self._local.tasks
+        finally:
+            self._local.tasks = None
+
+
+def start_fakes(args):
+    """
+    Start fake services with the latency and errors from the arguments.
+
+    Returns:
+        return: fake services by name.
+
+    Args:
+        args: parsed arguments of add_fake_arguments.
+    """
+    error_settings = {
+        'jitter': args.jitter_ms / 1000,
+        'error_rate': args.error_rate,
+        'throttle_rate': args.throttle_rate,
+    }
+
+    return {
+        'moltin': FakeMoltin(
+            products_count=args.products,
+            latency=args.moltin_latency_ms / 1000,
+            **error_settings,
+        ).start(),
+        'geocoder': FakeGeocoder(
+            latency=args.geocoder_latency_ms / 1000,
+            **error_settings,
+        ).start(),
+        'telegram': FakeTelegram(
+            latency=args.telegram_latency_ms / 1000,
+            **error_settings,
+        ).start(),
+    }
+
+
+def add_fake_arguments(parser):
+    """
+    Add latency and error injection arguments of the fake services.
+
+    Args:
+        parser: argument parser of the tool.
+    """
+    parser.add_argument('--products', type=int, default=24)
+    parser.add_argument('--moltin-latency-ms', type=float, default=50)
+    parser.add_argument('--geocoder-latency-ms', type=float, default=100)
+    parser.add_argument('--telegram-latency-ms', type=float, default=30)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument(
+        '--error-rate',
+        type=float,
+        default=0,
+        help='share of requests answered with 500',
+    )
+    parser.add_argument(
+        '--throttle-rate',
+        type=float,
+        default=0,
+        help='share of requests answered with 429',
+    )
+    parser.add_argument(
+        '--redis-db',
+        type=int,
+        default=15,
+        help='Redis database for the benchmark, keep it apart from the bot',
+    )
+
+
+def load_bot(fakes, redis_db, pool_size):
+    """
+    Import the bot configured to use the fake services.
+
+    The settings are read on import, so the environment is prepared
+    before the bot modules are imported.
+
+    Returns:
+        return: telegram_bot module and the bot instance.
+
+    Args:
+        fakes: fake services by name.
+        redis_db: Redis database for the benchmark.
+        pool_size: number of connections to the fake Telegram.
+    """
+    os.environ['API_BASE_URL'] = fakes['moltin'].url
+    os.environ['GEOCODER_URL'] = '{0}/1.x'.format(fakes['geocoder'].url)
+    os.environ['TELEGRAM_API_URL'] = '{0}/bot'.format(fakes['telegram'].url)
+    os.environ['TELEGRAM_BOT_TOKEN'] = BENCHMARK_TOKEN
+    for name in ('CLIENT_ID', 'CLIENT_SECRET', 'YA_API_KEY'):
+        os.environ[name] = 'benchmark'
+    os.environ['TRANZZO_PAYMENT'] = 'benchmark'
+    # The fake Telegram has no flood limits, so the outbox doesn't hold
+    # the messages back unless the limits are set explicitly.
+    os.environ.setdefault('TELEGRAM_RATE_LIMIT', '10000')
+    os.environ.setdefault('TELEGRAM_CHAT_RATE_LIMIT', '10000')
+    os.environ.setdefault('TELEGRAM_CHAT_BURST', '100')
+    os.environ.setdefault('OUTBOX_WORKERS', str(pool_size))
+    os.environ.setdefault('REDIS_HOST', 'localhost')
+    os.environ.setdefault('REDIS_PORT', '6379')
+    os.environ.setdefault('REDIS_PASSWORD', '')
+
+    import redis
+    from telegram import Bot
+
+    import telegram_bot
+    from app.bots.request import InstrumentedRequest
+    from app.bots.settings import TELEGRAM_API_URL
+
+    telegram_bot.checkout_executor = TrackedExecutor(
+        telegram_bot.checkout_executor,
+    )
+    telegram_bot._database = redis.Redis(
+        host=telegram_bot.REDIS_HOST,
+        port=telegram_bot.REDIS_PORT,
+        password=telegram_bot.REDIS_PASSWORD,
+        db=redis_db,
+        decode_responses=True,
+    )
+    bot = Bot(
+        BENCHMARK_TOKEN,
+        base_url=TELEGRAM_API_URL,
+        request=InstrumentedRequest(con_pool_size=pool_size),
+    )
+
+    return telegram_bot, bot
+
+
+def create_message_update(bot, update_id, chat_id, text):
+    """
+    Create update with the text message of the customer.
+
+    Returns:
+        return: Update instance.
+
+    Args:
+        bot: a pre-initialized bot instance.
+        update_id: ID of the update.
+        chat_id: ID of the chat.
+        text: text of the message.
+    """
+    from telegram import Update
+
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': text,
+        },
+    }, bot)
+
+
+def create_location_update(bot, update_id, chat_id, longitude, latitude):
+    """
+    Create update with the location shared by the customer.
+
+    Returns:
+        return: Update instance.
+
+    Args:
+        bot: a pre-initialized bot instance.
+        update_id: ID of the update.
+        chat_id: ID of the chat.
+        longitude: longitude of the customer.
+        latitude: latitude of the customer.
+    """
+    from telegram import Update
+
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+            'location': {'longitude': longitude, 'latitude': latitude},
+        },
+    }, bot)
+
+
+def create_callback_update(bot, update_id, chat_id, message, data):
+    """
+    Create update with the button tap of the customer.
+
+    Returns:
+        return: Update instance.
+
+    Args:
+        bot: a pre-initialized bot instance.
+        update_id: ID of the update.
+        chat_id: ID of the chat.
+        message: data about the message with the button.
+        data: callback data of the button.
+    """
+    from telegram import Update
+
+    return Update.de_json({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'chat_instance': str(chat_id),
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+            'data': data,
+            'message': message,
+        },
+    }, bot)
+
+
+def wait_for_replies(chat_id, tasks, timeout=10):
+    """
+    Wait until the tasks of the update and the replies to the chat are done.
+
+    Returns:
+        return: False if the timeout expired.
+
+    Args:
+        chat_id: ID of the chat.
+        tasks: futures of the tasks submitted by the handler, like the
+            checkout.
+        timeout: seconds to wait.
+    """
+    from app.bots.outbox import outbox
+
+    wait(tasks, timeout)
+
+    return outbox.wait_sent(chat_id, timeout)
+
+
+def get_handler_errors(telegram_bot):
+    """
+    Get number of failed handlers by state.
+
+    Returns:
+        return: errors by state.
+
+    Args:
+        telegram_bot: telegram_bot module.
+    """
+    return {
+        labels['state']: value
+        for _, labels, value in telegram_bot.HANDLER_ERRORS.collect()
+    }
+
+
+def clean_chats(telegram_bot, chat_ids):
+    """
+    Remove sessions, carts and jobs of the benchmark chats.
+
+    Args:
+        telegram_bot: telegram_bot module.
+        chat_ids: IDs of the benchmark chats.
+    """
+    from app.bots.scheduler import cancel_job
+
+    db = telegram_bot._database
+    for chat_id in chat_ids:
+        db.delete(
+            chat_id,
+            'session:{0}'.format(chat_id),
+            'cart:{0}'.format(chat_id),
+            'cart:{0}:pending'.format(chat_id),
+        )
+        cancel_job(db, 'cart_flush:{0}'.format(chat_id))
+        cancel_job(db, 'late_delivery:{0}'.format(chat_id))
+
+
+def percentile(sorted_values, rank):
+    """
+    Get percentile by the nearest rank.
+
+    Returns:
+        return: value of the percentile.
+
+    Args:
+        sorted_values: sorted values.
+        rank: percentile from 0 to 100.
+    """
+    if not sorted_values:
+        return 0
+
+    position = max(round(rank / 100 * len(sorted_values)) - 1, 0)
+
+    return sorted_values[min(position, len(sorted_values) - 1)]
+
+
+def summarize(durations_by_state, elapsed, errors_by_state, fakes):
+    """
+    Summarize the run.
+
+    Returns:
+        return: latency percentiles by state, throughput and call counts.
+
+    Args:
+        durations_by_state: seconds until the replies are sent by state.
+        elapsed: duration of the run in seconds.
+        errors_by_state: failed handlers by state.
+        fakes: fake services by name.
+    """
+    updates_count = sum(
+        len(durations) for durations in durations_by_state.values()
+    )
+    states = {}
+    for state, durations in durations_by_state.items():
+        durations = sorted(durations)
+        states[state] = {
+            'count': len(durations),
+            'errors': errors_by_state.get(state, 0),
+        }
+        for rank in PERCENTILES:
+            states[state]['p{0}_ms'.format(rank)] = round(
+                percentile(durations, rank) * 1000,
+                1,
+            )
+
+    return {
+        'states': states,
+        'updates': updates_count,
+        'errors': sum(errors_by_state.values()),
+        'elapsed_s': round(elapsed, 2),
+        'updates_per_s': round(updates_count / elapsed, 1) if elapsed else 0,
+        'calls_per_update': {
+            name: round(sum(fake.calls.values()) / updates_count, 2)
+            for name, fake in fakes.items()
+        } if updates_count else {},
+    }
+
+
+def print_summary(summary):
+    """
+    Print the summary as a table.
+
+    Args:
+        summary: summary of the run.
+    """
+    print('{0:<20} {1:>7} {2:>7} {3:>9} {4:>9} {5:>9}'.format(
+        'state', 'updates', 'errors', 'p50 ms', 'p95 ms', 'p99 ms',
+    ))
+    for state, stats in summary['states'].items():
+        print('{0:<20} {1:>7} {2:>7} {3:>9} {4:>9} {5:>9}'.format(
+            state,
+            stats['count'],
+            stats['errors'],
+            stats['p50_ms'],
+            stats['p95_ms'],
+            stats['p99_ms'],
+        ))
+    print()
+    print('{0} updates in {1} s, {2} updates/s, {3} errors'.format(
+        summary['updates'],
+        summary['elapsed_s'],
+        summary['updates_per_s'],
+        summary['errors'],
+    ))
+    print('Calls per update: {0}'.format(', '.join(
+        '{0} {1}'.format(name, calls)
+        for name, calls in summary['calls_per_update'].items()
+    )))
+
+
+def check_regressions(summary, baseline_path, tolerance, max_error_rate):
+    """
+    Compare the run with the baseline.
+
+    Returns:
+        return: descriptions of the regressions.
+
+    Args:
+        summary: summary of the run.
+        baseline_path: path of the saved baseline summary, can be None.
+        tolerance: allowed share of slowdown.
+        max_error_rate: allowed share of failed updates and of customers
+            that didn't reach the delivery.
+    """
+    regressions = []
+    if summary['updates']:
+        error_rate = summary['errors'] / summary['updates']
+        if error_rate > max_error_rate:
+            regressions.append('error rate {0:.3f} > {1}'.format(
+                error_rate,
+                max_error_rate,
+            ))
+    # A change that stops customers halfway without an error would look
+    # faster, so the customers that didn't reach the delivery count too.
+    if 'customers' in summary:
+        min_completed = summary['customers'] * (1 - max_error_rate)
+        if summary['completed_customers'] < min_completed:
+            regressions.append('{0} of {1} customers completed'.format(
+                summary['completed_customers'],
+                summary['customers'],
+            ))
+
+    if not baseline_path:
+        return regressions
+
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    min_throughput = baseline['updates_per_s'] * (1 - tolerance)
+    if summary['updates_per_s'] < min_throughput:
+        regressions.append('throughput {0} < {1:.1f} updates/s'.format(
+            summary['updates_per_s'],
+            min_throughput,
+        ))
+    for state, baseline_stats in baseline['states'].items():
+        stats = summary['states'].get(state)
+        if stats is None:
+            regressions.append('{0} has no updates'.format(state))
+            continue
+        max_p95 = baseline_stats['p95_ms'] * (1 + tolerance)
+        if stats['p95_ms'] > max_p95:
+            regressions.append('{0} p95 {1} > {2:.1f} ms'.format(
+                state,
+                stats['p95_ms'],
+                max_p95,
+            ))
+
+    return regressions
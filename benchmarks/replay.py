@@ -0,0 +1,375 @@
+"""
+Replay a recorded update log against the fake services.
+
+Record the log with UPDATE_LOG_PATH, then run from the project root:
+
+    python -m benchmarks.replay updates.log --speed 10
+"""
+
+import argparse
+import functools
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+
+from benchmarks.fakes import create_message, get_address_position
+from benchmarks.harness import (
+    add_fake_arguments,
+    check_regressions,
+    clean_chats,
+    create_callback_update,
+    create_location_update,
+    create_message_update,
+    get_handler_errors,
+    load_bot,
+    percentile,
+    print_summary,
+    start_fakes,
+    summarize,
+    wait_for_replies,
+)
+
+FIRST_CHAT_ID = 2 * 10 ** 9
+ADDRESSES_COUNT = 500
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSerialExecutor:
+    """Run updates of a chat one by one and different chats in parallel."""
+
+    def __init__(self, workers):
+        """
+        Create the executor.
+
+        Args:
+            workers: number of threads.
+        """
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._queues = {}
+
+    def submit(self, chat_id, task):
+        """
+        Run the task after the earlier tasks of the chat.
+
+        Args:
+            chat_id: ID of the chat.
+            task: function without arguments.
+        """
+        with self._lock:
+            if chat_id in self._queues:
+                self._queues[chat_id].append(task)
+                return
+            self._queues[chat_id] = deque([task])
+        self._pool.submit(self._run_chat_tasks, chat_id)
+
+    def shutdown(self):
+        """Wait for all tasks."""
+        self._pool.shutdown(wait=True)
+
+    def _run_chat_tasks(self, chat_id):
+        while True:
+            with self._lock:
+                chat_tasks = self._queues[chat_id]
+                if not chat_tasks:
+                    del self._queues[chat_id]
+                    return
+                task = chat_tasks.popleft()
+            try:
+                task()
+            except Exception as err:
+                logger.error('Replay of chat {0} failed: {1}'.format(
+                    chat_id,
+                    err,
+                ))
+
+
+class Replay:
+    """Recorded updates fed to the dispatcher with the original timing."""
+
+    def __init__(self, args, fakes, telegram_bot, bot, dispatcher):
+        """
+        Create the replay.
+
+        Args:
+            args: parsed arguments.
+            fakes: fake services by name.
+            telegram_bot: telegram_bot module.
+            bot: a pre-initialized bot instance.
+            dispatcher: dispatcher with the bot handlers.
+        """
+        self.args = args
+        self.fakes = fakes
+        self.telegram_bot = telegram_bot
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.rng = random.Random(args.seed)
+        self.chat_ids = {}
+        self.durations_by_state = defaultdict(list)
+        self.lags = []
+        self._lock = threading.Lock()
+        self._update_id = 0
+
+    def run(self, records):
+        """
+        Replay the records.
+
+        Args:
+            records: records of the update log in the order of arrival.
+        """
+        executor = ChatSerialExecutor(self.args.workers)
+        first_record_at = records[0]['t']
+        started_at = time.monotonic()
+        try:
+            for record in records:
+                scheduled_at = started_at
+                if self.args.speed:
+                    scheduled_at += (
+                        record['t'] - first_record_at
+                    ) / self.args.speed
+                    time.sleep(max(scheduled_at - time.monotonic(), 0))
+
+                chat_id = self.get_chat_id(record['c'])
+                executor.submit(chat_id, functools.partial(
+                    self.replay_record,
+                    record,
+                    chat_id,
+                    scheduled_at,
+                ))
+        finally:
+            executor.shutdown()
+
+    def get_chat_id(self, chat_alias):
+        """
+        Get chat ID of the replayed chat.
+
+        Returns:
+            return: ID of the chat.
+
+        Args:
+            chat_alias: anonymous alias of the recorded chat.
+        """
+        if chat_alias not in self.chat_ids:
+            self.chat_ids[chat_alias] = FIRST_CHAT_ID + len(self.chat_ids)
+
+        return self.chat_ids[chat_alias]
+
+    def replay_record(self, record, chat_id, scheduled_at):
+        """
+        Pass the recorded update to the dispatcher and record the time
+        until the replies are sent.
+
+        Args:
+            record: record of the update log.
+            chat_id: ID of the replayed chat.
+            scheduled_at: time.monotonic() the update is due.
+        """
+        lag = time.monotonic() - scheduled_at
+        update = self.create_update(record, chat_id)
+
+        started_at = time.monotonic()
+        with self.telegram_bot.checkout_executor.track() as tasks:
+            self.dispatcher.process_update(update)
+        wait_for_replies(chat_id, tasks)
+        duration = time.monotonic() - started_at
+
+        with self._lock:
+            self.lags.append(lag)
+            self.durations_by_state[record['s']].append(duration)
+
+    def create_update(self, record, chat_id):
+        """
+        Create update of the shape written in the record.
+
+        Returns:
+            return: Update instance.
+
+        Args:
+            record: record of the update log.
+            chat_id: ID of the replayed chat.
+        """
+        with self._lock:
+            self._update_id += 1
+            update_id = self._update_id
+
+        if record['k'] == 'location':
+            longitude, latitude = get_address_position(str(update_id))
+            return create_location_update(
+                self.bot,
+                update_id,
+                chat_id,
+                float(longitude),
+                float(latitude),
+            )
+
+        if record['k'] == 'text':
+            text = record['d'] or 'Benchmark street {0}'.format(
+                self.rng.randrange(ADDRESSES_COUNT),
+            )
+            return create_message_update(self.bot, update_id, chat_id, text)
+
+        last_message = self.fakes['telegram'].get_last_message(chat_id)
+        if last_message is None:
+            message = create_message(chat_id, 1, {'text': 'Recorded'})
+        else:
+            message = last_message['message']
+
+        return create_callback_update(
+            self.bot,
+            update_id,
+            chat_id,
+            message,
+            self.get_callback_data(chat_id, record['d']),
+        )
+
+    def get_callback_data(self, chat_id, shape):
+        """
+        Pick the button of the last message with the recorded shape.
+
+        When the bot shows no such button, for example because an earlier
+        update failed, the data is made up from the shape.
+
+        Returns:
+            return: callback data.
+
+        Args:
+            chat_id: ID of the replayed chat.
+            shape: recorded shape of the callback data.
+        """
+        from app.bots.update_log import get_callback_shape
+
+        buttons = [
+            data
+            for data in self.fakes['telegram'].get_buttons(chat_id).values()
+            if data and get_callback_shape(data) == shape
+        ]
+        if buttons:
+            return self.rng.choice(buttons)
+
+        if shape == 'delivery':
+            return json.dumps([
+                FIRST_CHAT_ID - 1,
+                get_address_position(str(chat_id)),
+            ])
+        product_id = self.rng.choice(self.fakes['moltin'].products)['id']
+
+        return shape.replace(':id', product_id).replace(':n', '0')
+
+
+def parse_speed(value):
+    """
+    Parse replay speed.
+
+    Returns:
+        return: speed factor, 0 for the maximum speed.
+
+    Args:
+        value: 'max' or speed factor like 1 or 10.
+    """
+    if value == 'max':
+        return 0
+
+    return float(value)
+
+
+def main():
+    logging.basicConfig(level=logging.CRITICAL)
+    parser = argparse.ArgumentParser(
+        description='Replay the update log against local fake services',
+    )
+    parser.add_argument('update_log')
+    parser.add_argument(
+        '--speed',
+        type=parse_speed,
+        default=1,
+        help='1, 10 or any other factor, max to send without pauses',
+    )
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='save the summary to the file')
+    parser.add_argument('--baseline', help='summary of the baseline run')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument(
+        '--max-error-rate',
+        type=float,
+        default=0,
+        help='allowed share of failed updates, raise it for logs with '
+        'updates the bot rejects, like taps on long gone messages',
+    )
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    from app.bots.update_log import read_update_log
+
+    records = read_update_log(args.update_log)
+    if not records:
+        sys.exit('The update log is empty')
+
+    fakes = start_fakes(args)
+    telegram_bot, bot = load_bot(fakes, args.redis_db, args.workers + 4)
+
+    from telegram.ext import Dispatcher
+
+    dispatcher = Dispatcher(bot, Queue(), workers=1)
+    telegram_bot.add_handlers(dispatcher)
+    replay = Replay(args, fakes, telegram_bot, bot, dispatcher)
+    errors_before = get_handler_errors(telegram_bot)
+
+    started_at = time.monotonic()
+    try:
+        replay.run(records)
+    finally:
+        dispatcher.stop()
+        clean_chats(telegram_bot, replay.chat_ids.values())
+    elapsed = time.monotonic() - started_at
+
+    errors_by_state = {
+        state: errors - errors_before.get(state, 0)
+        for state, errors in get_handler_errors(telegram_bot).items()
+    }
+    summary = summarize(
+        replay.durations_by_state,
+        elapsed,
+        errors_by_state,
+        fakes,
+    )
+    lags = sorted(replay.lags)
+    summary['recorded_s'] = round(records[-1]['t'] - records[0]['t'], 2)
+    summary['lag_p95_ms'] = round(percentile(lags, 95) * 1000, 1)
+    summary['lag_max_ms'] = round(lags[-1] * 1000, 1)
+    print_summary(summary)
+    print(
+        'Recorded in {0} s, replayed in {1} s, '
+        'schedule lag p95 {2} ms, max {3} ms'.format(
+            summary['recorded_s'],
+            summary['elapsed_s'],
+            summary['lag_p95_ms'],
+            summary['lag_max_ms'],
+        ),
+    )
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(summary, output_file, indent=2)
+
+    regressions = check_regressions(
+        summary,
+        args.baseline,
+        args.tolerance,
+        args.max_error_rate,
+    )
+    for regression in regressions:
+        print('REGRESSION: {0}'.format(regression))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""
+Drive simulated customers through the bot against the fake services.
+
+Run from the project root:
+
+    python -m benchmarks.run --customers 200 --concurrency 8
+"""
+
+import argparse
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.harness import (
+    add_fake_arguments,
+    check_regressions,
+    clean_chats,
+    create_callback_update,
+    create_message_update,
+    get_handler_errors,
+    load_bot,
+    print_summary,
+    start_fakes,
+    summarize,
+    wait_for_replies,
+)
+
+FIRST_CHAT_ID = 10 ** 9
+ADDRESSES_COUNT = 500
+
+
+class CustomerJourney:
+    """One customer going from /start to the delivery."""
+
+    def __init__(self, benchmark, chat_id, rng):
+        """
+        Create the customer.
+
+        Args:
+            benchmark: running benchmark.
+            chat_id: ID of the customer chat.
+            rng: random generator of the customer.
+        """
+        self.benchmark = benchmark
+        self.chat_id = chat_id
+        self.rng = rng
+
+    def run(self):
+        """
+        Go through the whole order.
+
+        Returns:
+            return: True if the customer reached the delivery.
+        """
+        telegram = self.benchmark.fakes['telegram']
+        products = self.benchmark.fakes['moltin'].products_by_id
+        steps = [('HANDLE_MENU', is_page_button)] * self.benchmark.args.pages
+        steps.append(('HANDLE_MENU', lambda data: data in products))
+        steps.extend(
+            [('HANDLE_DESCRIPTION', is_add_button)] * self.benchmark.args.taps,
+        )
+        steps.append(('HANDLE_DESCRIPTION', lambda data: data == 'cart'))
+        steps.append(('HANDLE_CART', lambda data: data == 'payment'))
+
+        self.send_text('START', '/start')
+        for state, is_wanted in steps:
+            if not self.tap(state, is_wanted):
+                return False
+
+        self.send_text('HANDLE_WAITING', 'Benchmark street {0}'.format(
+            self.rng.randrange(ADDRESSES_COUNT),
+        ))
+        delivery_data = telegram.get_buttons(self.chat_id).get('Delivery')
+        if delivery_data is None:
+            return False
+
+        return self.tap('HANDLE_DELIVERY', lambda data: data == delivery_data)
+
+    def send_text(self, state, text):
+        """
+        Send the text message.
+
+        Args:
+            state: state expected to handle the message.
+            text: text of the message.
+        """
+        update = create_message_update(
+            self.benchmark.bot,
+            self.benchmark.get_update_id(),
+            self.chat_id,
+            text,
+        )
+        self.benchmark.handle(state, update)
+
+    def tap(self, state, is_wanted):
+        """
+        Tap a random button of the last message.
+
+        Returns:
+            return: True if a wanted button was found.
+
+        Args:
+            state: state expected to handle the tap.
+            is_wanted: check of the button callback data.
+        """
+        telegram = self.benchmark.fakes['telegram']
+        buttons = [
+            data
+            for data in telegram.get_buttons(self.chat_id).values()
+            if data and is_wanted(data)
+        ]
+        if not buttons:
+            return False
+
+        last_message = telegram.get_last_message(self.chat_id)
+        update = create_callback_update(
+            self.benchmark.bot,
+            self.benchmark.get_update_id(),
+            self.chat_id,
+            last_message['message'],
+            self.rng.choice(buttons),
+        )
+        self.benchmark.handle(state, update)
+
+        return True
+
+
+class Benchmark:
+    """Customers sharing the bot and the fake services."""
+
+    def __init__(self, args, fakes, telegram_bot, bot):
+        """
+        Create the benchmark.
+
+        Args:
+            args: parsed arguments.
+            fakes: fake services by name.
+            telegram_bot: telegram_bot module.
+            bot: a pre-initialized bot instance.
+        """
+        self.args = args
+        self.fakes = fakes
+        self.telegram_bot = telegram_bot
+        self.bot = bot
+        self.durations_by_state = defaultdict(list)
+        self.chat_ids = []
+        self._lock = threading.Lock()
+        self._update_id = 0
+
+    def get_update_id(self):
+        """
+        Get ID for the next update.
+
+        Returns:
+            return: ID of the update.
+        """
+        with self._lock:
+            self._update_id += 1
+            return self._update_id
+
+    def handle(self, state, update):
+        """
+        Pass the update to the bot and record the time until the replies
+        are sent.
+
+        The checkout and the outbox finish after the handler returns, so
+        the time includes them.
+
+        Args:
+            state: state expected to handle the update.
+            update: Update instance.
+        """
+        started_at = time.monotonic()
+        with self.telegram_bot.checkout_executor.track() as tasks:
+            self.telegram_bot.handle_users_reply(self.bot, update, None)
+        wait_for_replies(update.effective_chat.id, tasks)
+        duration = time.monotonic() - started_at
+        with self._lock:
+            self.durations_by_state[state].append(duration)
+        if self.args.think_ms:
+            time.sleep(self.args.think_ms / 1000)
+
+    def run_customers(self, customers_count, first_chat_id):
+        """
+        Run customers concurrently.
+
+        Returns:
+            return: number of customers that reached the delivery.
+
+        Args:
+            customers_count: number of customers.
+            first_chat_id: chat ID of the first customer.
+        """
+        chat_ids = list(range(first_chat_id, first_chat_id + customers_count))
+        self.chat_ids.extend(chat_ids)
+        journeys = [
+            CustomerJourney(
+                self,
+                chat_id,
+                random.Random(self.args.seed + chat_id),
+            )
+            for chat_id in chat_ids
+        ]
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            results = pool.map(lambda journey: journey.run(), journeys)
+
+        return sum(results)
+
+    def reset(self):
+        """Forget measurements of the warmup."""
+        self.durations_by_state.clear()
+        for fake in self.fakes.values():
+            with fake.lock:
+                fake.calls.clear()
+
+
+def is_page_button(data):
+    return data.startswith('page, ')
+
+
+def is_add_button(data):
+    return data.startswith(('add, ', 'inc, '))
+
+
+def main():
+    logging.basicConfig(level=logging.CRITICAL)
+    parser = argparse.ArgumentParser(
+        description='Benchmark the bot against local fake services',
+    )
+    parser.add_argument('--customers', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--pages', type=int, default=1)
+    parser.add_argument('--taps', type=int, default=2)
+    parser.add_argument('--think-ms', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='save the summary to the file')
+    parser.add_argument('--baseline', help='summary of the baseline run')
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.2,
+        help='allowed slowdown against the baseline',
+    )
+    parser.add_argument(
+        '--max-error-rate',
+        type=float,
+        default=0,
+        help='allowed share of failed updates',
+    )
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    fakes = start_fakes(args)
+    telegram_bot, bot = load_bot(fakes, args.redis_db, args.concurrency + 4)
+    benchmark = Benchmark(args, fakes, telegram_bot, bot)
+    first_chat_id = FIRST_CHAT_ID + int(time.time()) % 10 ** 6 * 1000
+
+    try:
+        benchmark.run_customers(args.warmup, first_chat_id)
+        benchmark.reset()
+        errors_before = get_handler_errors(telegram_bot)
+
+        started_at = time.monotonic()
+        completed_count = benchmark.run_customers(
+            args.customers,
+            first_chat_id + args.warmup,
+        )
+        elapsed = time.monotonic() - started_at
+
+        errors_by_state = {
+            state: errors - errors_before.get(state, 0)
+            for state, errors in get_handler_errors(telegram_bot).items()
+        }
+    finally:
+        clean_chats(telegram_bot, benchmark.chat_ids)
+
+    summary = summarize(
+        benchmark.durations_by_state,
+        elapsed,
+        errors_by_state,
+        fakes,
+    )
+    summary['customers'] = args.customers
+    summary['completed_customers'] = completed_count
+    print_summary(summary)
+    print('{0} of {1} customers reached the delivery'.format(
+        completed_count,
+        args.customers,
+    ))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(summary, output_file, indent=2)
+
+    regressions = check_regressions(
+        summary,
+        args.baseline,
+        args.tolerance,
+        args.max_error_rate,
+    )
+    for regression in regressions:
+        print('REGRESSION: {0}'.format(regression))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+import argparse
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from slugify import slugify
+
+from app.api.authentication import get_auth_data
+from app.api.client import moltin
+from app.api.flow import (
+    create_entry,
+    create_flow,
+    create_flow_field,
+    delete_entry,
+    get_entries,
+    get_flow_fields,
+    get_flows,
+    update_entry,
+)
+from app.api.ratelimit import BACKGROUND, set_default_priority
+
+
+logger = logging.getLogger(__name__)
+
+PIZZERIA_FIELDS = {
+    'address': 'Address of the pizzeria',
+    'alias': 'Name of the pizzeria',
+    'longitude': 'Longitude of the pizzeria',
+    'latitude': 'Latitude of the pizzeria',
+}
+
+
+def prepare_flow(access_token, name, description):
+    """
+    Create the flow and its fields if they are missing.
+
+    Args:
+        access_token: required to get access to the API.
+        name: specifies the name of the flow.
+        description: specifies the description for the flow.
+    """
+    flow_slug = slugify(name)
+    flows = {flow['slug']: flow for flow in get_flows(access_token)}
+    if flow_slug in flows:
+        flow_id = flows[flow_slug]['id']
+        existing_fields = {
+            field['slug'] for field in get_flow_fields(access_token, flow_slug)
+        }
+    else:
+        flow_id = create_flow(access_token, name, description)
+        existing_fields = set()
+
+    for field_name, field_description in PIZZERIA_FIELDS.items():
+        if field_name not in existing_fields:
+            create_flow_field(
+                access_token,
+                field_name,
+                field_description,
+                flow_id,
+            )
+
+
+def get_changes(entries, addresses):
+    """
+    Compare flow entries with addresses by their aliases.
+
+    Entries duplicating an alias are removed.
+
+    Returns:
+        return: addresses to create, entry IDs with addresses to update
+            and entry IDs to delete.
+
+    Args:
+        entries: entries of the flow.
+        addresses: pizzerias from the addresses file.
+    """
+    addresses_by_alias = {address['alias']: address for address in addresses}
+
+    entries_by_alias = {}
+    removed_entry_ids = []
+    for entry in entries:
+        alias = entry.get('alias')
+        if alias in entries_by_alias or alias not in addresses_by_alias:
+            removed_entry_ids.append(entry['id'])
+        else:
+            entries_by_alias[alias] = entry
+
+    new_addresses = []
+    changed_addresses = []
+    for alias, address in addresses_by_alias.items():
+        entry = entries_by_alias.get(alias)
+        if entry is None:
+            new_addresses.append(address)
+        elif is_changed(entry, address):
+            changed_addresses.append((entry['id'], address))
+
+    return new_addresses, changed_addresses, removed_entry_ids
+
+
+def is_changed(entry, address):
+    """
+    Check whether the address differs from the flow entry.
+
+    Returns:
+        return: True if the address or coordinates have changed.
+
+    Args:
+        entry: entry of the flow.
+        address: pizzeria from the addresses file.
+    """
+    return (
+        entry.get('address') != address['address']['full']
+        or str(entry.get('longitude')) != str(address['coordinates']['lon'])
+        or str(entry.get('latitude')) != str(address['coordinates']['lat'])
+    )
+
+
+def apply_changes(access_token, flow_slug, changes, workers, batch_size):
+    """
+    Apply changes to the flow concurrently.
+
+    Changes are sent in batches, each batch is applied by a bounded pool.
+
+    Returns:
+        return: number of failed changes.
+
+    Args:
+        access_token: required to get access to the API.
+        flow_slug: slug of the flow.
+        changes: addresses to create, to update and entries to delete.
+        workers: number of requests sent at the same time.
+        batch_size: number of changes in a batch.
+    """
+    new_addresses, changed_addresses, removed_entry_ids = changes
+    operations = [
+        (create_entry, (access_token, address, flow_slug))
+        for address in new_addresses
+    ]
+    operations.extend(
+        (update_entry, (access_token, entry_id, address, flow_slug))
+        for entry_id, address in changed_addresses
+    )
+    operations.extend(
+        (delete_entry, (access_token, entry_id, flow_slug))
+        for entry_id in removed_entry_ids
+    )
+
+    failed_count = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(operations), batch_size):
+            batch = operations[start:start + batch_size]
+            futures = [
+                executor.submit(operation, *arguments)
+                for operation, arguments in batch
+            ]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as err:
+                    failed_count += 1
+                    logger.error('Change failed: {0}'.format(err))
+            logger.info('Applied {0} of {1} changes'.format(
+                start + len(batch),
+                len(operations),
+            ))
+
+    return failed_count
+
+
+def main():
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO,
+    )
+    parser = argparse.ArgumentParser(
+        description='Sync pizzerias from the addresses file to Moltin flow',
+    )
+    parser.add_argument('addresses', nargs='?', default='address.json')
+    parser.add_argument('--flow', default='Pizzeria')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+    set_default_priority(BACKGROUND)
+
+    with open(args.addresses) as addresses_file:
+        addresses = json.load(addresses_file)
+
+    started_at = time.monotonic()
+    access_token, _ = get_auth_data()
+    flow_slug = slugify(args.flow)
+    prepare_flow(access_token, args.flow, 'Pizzerias of the delivery')
+
+    changes = get_changes(get_entries(access_token, flow_slug), addresses)
+    new_addresses, changed_addresses, removed_entry_ids = changes
+    logger.info('{0} new, {1} changed, {2} removed pizzerias'.format(
+        len(new_addresses),
+        len(changed_addresses),
+        len(removed_entry_ids),
+    ))
+
+    failed_count = apply_changes(
+        access_token,
+        flow_slug,
+        changes,
+        args.workers,
+        args.batch_size,
+    )
+    logger.info('Synced in {0:.1f} s'.format(time.monotonic() - started_at))
+    logger.info('Moltin requests: {0}'.format(moltin.scheduler.get_stats()))
+
+    if failed_count:
+        raise SystemExit('{0} changes failed'.format(failed_count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import redis
+from environs import Env
+
+from app.api.authentication import get_access_token
+from app.api.client import moltin
+from app.api.files import upload_picture
+from app.api.product import (
+    create_product,
+    get_all_products,
+    invalidate_catalog,
+    link_picture_to_product,
+    update_product,
+)
+from app.api.ratelimit import BACKGROUND, set_default_priority
+
+
+env = Env()
+env.read_env()
+
+logger = logging.getLogger(__name__)
+
+_checkpoint_lock = threading.Lock()
+
+
+def load_checkpoint(checkpoint_path):
+    """
+    Load skus of already imported products.
+
+    Returns:
+        return: product IDs by sku.
+
+    Args:
+        checkpoint_path: path of the checkpoint file.
+    """
+    if not os.path.exists(checkpoint_path):
+        return {}
+
+    with open(checkpoint_path) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """
+    Save skus of imported products.
+
+    The file is replaced atomically, so a crash never leaves it broken.
+
+    Args:
+        checkpoint_path: path of the checkpoint file.
+        checkpoint: product IDs by sku.
+    """
+    temporary_path = '{0}.tmp'.format(checkpoint_path)
+    with open(temporary_path, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(temporary_path, checkpoint_path)
+
+
+def import_product(redis_db, product, existing_product, update):
+    """
+    Create or update the product with its picture.
+
+    The shared access token is taken before every request, so a long
+    import outlives the token it started with.
+
+    Returns:
+        return: ID of the product.
+
+    Args:
+        redis_db: database for the shared access token.
+        product: piece of information about for the product.
+        existing_product: the product with the same sku in the catalog.
+        update: whether to update existing products.
+    """
+    if existing_product is None:
+        product_id = create_product(get_access_token(redis_db), product)
+    else:
+        product_id = existing_product['id']
+        relationships = existing_product.get('relationships', {})
+        if not update and relationships.get('main_image'):
+            return product_id
+        if update:
+            update_product(get_access_token(redis_db), product_id, product)
+
+    picture_id = upload_picture(get_access_token(redis_db), product)
+    link_picture_to_product(
+        get_access_token(redis_db),
+        product_id,
+        picture_id,
+    )
+
+    return product_id
+
+
+def import_menu(redis_db, menu, checkpoint_path, workers, update):
+    """
+    Import menu products concurrently.
+
+    Products are matched to the catalog by sku, so the import can be
+    safely run again. Finished products are recorded in the checkpoint
+    until the whole menu is imported, so an interrupted import resumes
+    where it stopped.
+
+    Returns:
+        return: number of imported products.
+
+    Args:
+        redis_db: database for the shared access token.
+        menu: products from the menu file.
+        checkpoint_path: path of the checkpoint file.
+        workers: number of products imported at the same time.
+        update: whether to update existing products.
+    """
+    checkpoint = load_checkpoint(checkpoint_path)
+    existing_products = {
+        product.get('sku'): product
+        for product in get_all_products(get_access_token(redis_db))
+    }
+
+    pending_products = [
+        product for product in menu
+        if str(product['id']) not in checkpoint
+    ]
+    logger.info('{0} of {1} products left to import'.format(
+        len(pending_products),
+        len(menu),
+    ))
+
+    imported_count = 0
+    failed_count = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                import_product,
+                redis_db,
+                product,
+                existing_products.get(str(product['id'])),
+                update,
+            ): str(product['id'])
+            for product in pending_products
+        }
+        for future in as_completed(futures):
+            sku = futures[future]
+            try:
+                product_id = future.result()
+            except Exception as err:
+                failed_count += 1
+                logger.error('Product {0} failed: {1}'.format(sku, err))
+                continue
+
+            imported_count += 1
+            with _checkpoint_lock:
+                checkpoint[sku] = product_id
+                save_checkpoint(checkpoint_path, checkpoint)
+
+    if not failed_count and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    return imported_count
+
+
+def main():
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO,
+    )
+    parser = argparse.ArgumentParser(
+        description='Load products from the menu file to Moltin',
+    )
+    parser.add_argument('menu', nargs='?', default='menu.json')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--checkpoint', default='menu_checkpoint.json')
+    parser.add_argument(
+        '--update',
+        action='store_true',
+        help='update products that already exist',
+    )
+    args = parser.parse_args()
+    set_default_priority(BACKGROUND)
+
+    with open(args.menu) as menu_file:
+        menu = json.load(menu_file)
+
+    redis_db = redis.Redis(
+        host=env.str('REDIS_HOST'),
+        port=env.int('REDIS_PORT'),
+        password=env.str('REDIS_PASSWORD'),
+        decode_responses=True,
+    )
+
+    started_at = time.monotonic()
+    imported_count = import_menu(
+        redis_db,
+        menu,
+        args.checkpoint,
+        args.workers,
+        args.update,
+    )
+    elapsed = time.monotonic() - started_at
+    logger.info('Imported {0} products in {1:.1f} s, {2:.2f} products/s'.format(
+        imported_count,
+        elapsed,
+        imported_count / elapsed if elapsed else 0,
+    ))
+    logger.info('Moltin requests: {0}'.format(moltin.scheduler.get_stats()))
+
+    invalidate_catalog(redis_db)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,67 @@
+import contextvars
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
 
 import logging
 import redis
 from environs import Env
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Message, Update
 from telegram.ext import Filters, Updater
-from telegram.ext import CallbackQueryHandler, CommandHandler, MessageHandler, PreCheckoutQueryHandler
-
-from app.bots.cart import generate_cart
+from telegram.ext import CallbackQueryHandler, CommandHandler, MessageHandler, PreCheckoutQueryHandler, TypeHandler
+
+from app.bots.cart import (
+    build_cart_message,
+    change_cart_quantity,
+    flush_cart_changes,
+    generate_cart,
+    get_cart,
+    store_cart_mirror,
+)
 from app.bots.keyboard import create_menu_markup, create_delivery_menu
-from app.bots.geocoder import fetch_coordinates, get_closest_entry
+from app.bots.geocoder import get_coordinates
+from app.bots.pizzerias import find_closest_pizzeria, get_pizzerias, refresh_pizzerias
+from app.bots.outbox import send
+from app.bots.photo import show_product_photo
+from app.bots.render import render_text
+from app.bots.request import InstrumentedRequest
 from app.bots.payment import start_without_shipping, precheckout_callback, successful_payment_callback
+from app.bots.settings import (
+    BOT_MODE,
+    CART_DEBOUNCE_DELAY,
+    CHECKOUT_EXECUTOR_SIZE,
+    LATE_DELIVERY_DELAY,
+    METRICS_LISTEN,
+    METRICS_PORT,
+    PIZZERIA_REFRESH_INTERVAL,
+    SCHEDULER_POLL_INTERVAL,
+    SHARD_ID,
+    SHARD_REPORT_INTERVAL,
+    SHARD_ROLE,
+    SHARDS_COUNT,
+    TELEGRAM_API_URL,
+    UPDATE_LOG_PATH,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    WEBHOOK_WORKERS,
+)
+from app.bots.scheduler import cancel_job, poll_scheduled_jobs, register_job, schedule_job
+from app.bots.session import load_session, save_session
+from app.bots.update_log import open_update_log, record_update
+from app.bots.sharding import ShardRing, create_router, report_shard_queue_depths, run_shard_worker
+from app.bots.webhook import run_webhook
 from app.api.authentication import get_access_token
-from app.api.customer import create_customer_address
-from app.api.flow import get_entries, get_entry
-from app.api.product import get_product_by_id, get_product_photo_by_id
-from app.api.cart import delete_product_from_cart, get_or_create_cart, add_product_to_cart
+from app.api.address_writer.writer import write_customer_address
+from app.api.product import get_cached_product
+from app.api.ratelimit import BACKGROUND, request_priority
+from app.api.cart import delete_product_from_cart, get_or_create_cart
+from app.metrics import Counter, Histogram, measure_io_wait, start_metrics_server
 
 
 env = Env()
@@ -25,6 +69,28 @@ env.read_env()
 
 logger = logging.getLogger(__name__)
 
+UPDATES = Counter(
+    'bot_updates_total',
+    'Updates received by the bot.',
+    ('type',),
+)
+HANDLER_DURATION = Histogram(
+    'bot_handler_duration_seconds',
+    'Duration of the state handlers.',
+    ('state',),
+)
+HANDLER_ERRORS = Counter(
+    'bot_handler_errors_total',
+    'Failed state handlers.',
+    ('state',),
+)
+HANDLER_IO_WAIT = Histogram(
+    'bot_handler_io_wait_seconds',
+    'Time the state handlers spent in Moltin, Yandex and direct Telegram '
+    'calls, without messages sent later by the outbox.',
+    ('state',),
+)
+
 TELEGRAM_TOKEN = env.str('TELEGRAM_BOT_TOKEN')
 REDIS_PASSWORD = env.str('REDIS_PASSWORD')
 REDIS_HOST = env.str('REDIS_HOST')
@@ -32,56 +98,85 @@ REDIS_PORT = env.int('REDIS_PORT')
 YA_API_KEY = env.str('YA_API_KEY')
 
 _database = None
+# Debounced cart flushes of a shard worker's chats are claimed only by
+# that worker, and the locks keep its job thread and its handlers from
+# flushing the same cart at once.
+_shard_id = SHARD_ID if SHARD_ROLE == 'worker' else None
+_cart_flush_locks = [threading.Lock() for _ in range(64)]
+
+checkout_executor = ThreadPoolExecutor(
+    max_workers=CHECKOUT_EXECUTOR_SIZE,
+    thread_name_prefix='checkout',
+)
 
 
-def start(bot, update, job_queue):
+def start(bot, update, job_queue, session):
     logger.info('User started bot')
     access_token = get_access_token(_database)
     get_or_create_cart(access_token, update.message.chat_id)
-    reply_markup = create_menu_markup(access_token)
-    update.message.reply_text(
+    session['page'] = 0
+    reply_markup = create_menu_markup(_database, access_token)
+    send(
+        bot,
+        'send_message',
+        update.message.chat_id,
         reply_markup=reply_markup,
         text='Welcome! Please, choose a pizza:',
     )
     return 'HANDLE_MENU'
 
 
-def handle_menu(bot, update, job_queue):
+def show_menu(bot, query, access_token, page):
+    reply_markup = create_menu_markup(_database, access_token, page)
+    render_text(
+        bot,
+        query.message.chat_id,
+        query.message,
+        'Welcome! Please, choose a pizza:',
+        reply_markup,
+    )
+
+
+def handle_menu(bot, update, job_queue, session):
     access_token = get_access_token(_database)
     query = update.callback_query
     
     if query.data == 'cart':
+        flush_pending_cart(access_token, query.message.chat_id)
         generate_cart(_database, bot, update)
         return 'HANDLE_CART'
     elif 'page' in query.data:
-        page = query.data.split(',')[1]
-        reply_markup = create_menu_markup(access_token, int(page))
+        page = int(query.data.split(',')[1])
+        session['page'] = page
+        show_menu(bot, query, access_token, page)
 
-        bot.edit_message_text(
-            text='Welcome! Please, choose a pizza:',
-            chat_id=query.message.chat_id,
-            message_id=query.message.message_id,
-            reply_markup=reply_markup,
-        )
+        return 'HANDLE_MENU'
     elif query.data == 'menu':
-        reply_markup = create_menu_markup(access_token)
-        bot.send_message(
-            reply_markup=reply_markup,
-            chat_id=query.message.chat_id,
-            text='Welcome! Please, choose a pizza:',
-        )
-        bot.delete_message(
-            chat_id=query.message.chat_id,
-            message_id=query.message.message_id,
-        )
+        show_menu(bot, query, access_token, int(session.get('page', 0)))
 
         return 'HANDLE_MENU'
 
+    query_data = query.data.split(', ')
+    if len(query_data) > 1:
+        product_id = query_data[1]
+    else:
+        product_id = query.data
+
     keyboard = [
         [
             InlineKeyboardButton(
                 'Add to cart',
-                callback_data='add, {0}'.format(query.data)
+                callback_data='add, {0}'.format(product_id)
+            ),
+        ],
+        [
+            InlineKeyboardButton(
+                '➖',
+                callback_data='dec, {0}'.format(product_id),
+            ),
+            InlineKeyboardButton(
+                '➕',
+                callback_data='inc, {0}'.format(product_id),
             ),
         ],
         [InlineKeyboardButton('Cart 🛒', callback_data='cart')],
@@ -89,21 +184,18 @@ def handle_menu(bot, update, job_queue):
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    query_data = query.data.split(', ')
-    if len(query_data) > 1:
-        product_id = query_data[1]
-    else:
-        product_id = query.data
-    product = get_product_by_id(access_token, product_id)
-    product_photo_id = product['relationships']['main_image']['data']['id']
-    product_photo = get_product_photo_by_id(access_token, product_photo_id)
+    product = get_cached_product(_database, access_token, product_id)
     product_name = product['name']
     product_description = product['description']
     product_price = product['price'][0]['amount']
 
-    bot.send_photo(
-        chat_id=query.message.chat_id,
-        photo=product_photo,
+    show_product_photo(
+        _database,
+        bot,
+        access_token,
+        product,
+        query.message.chat_id,
+        message=query.message,
         reply_markup=reply_markup,
         caption='{0}\n\n{1} руб.\n{2}'.format(
             product_name,
@@ -112,111 +204,193 @@ def handle_menu(bot, update, job_queue):
         ),
     )
 
-    bot.delete_message(
-        chat_id=query.message.chat_id,
-        message_id=query.message.message_id,
-    )
-
     return 'HANDLE_DESCRIPTION'
 
 
-def handle_description(bot, update, job_queue):
+def handle_description(bot, update, job_queue, session):
     access_token = get_access_token(_database)
     query = update.callback_query
 
     if query.data == 'menu':
-        reply_markup = create_menu_markup(access_token)
-        bot.send_message(
-            reply_markup=reply_markup,
-            chat_id=query.message.chat_id,
-            text='Welcome! Please, choose a pizza:',
-        )
-        bot.delete_message(
-            chat_id=query.message.chat_id,
-            message_id=query.message.message_id,
-        )
+        show_menu(bot, query, access_token, int(session.get('page', 0)))
 
         return 'HANDLE_MENU'
     elif query.data == 'cart':
+        flush_pending_cart(access_token, query.message.chat_id)
         generate_cart(_database, bot, update)
         return 'HANDLE_CART'
 
-    product_id = query.data.split(', ')[1]
-
-    add_product_to_cart(
-        access_token,
-        query.message.chat_id,
-        product_id,
-        1,
-    )
+    change_product_quantity(bot, query, access_token)
 
-    return 'HANDLE_MENU'
+    return 'HANDLE_DESCRIPTION'
 
 
-def handle_cart(bot, update, job_queue):
+def handle_cart(bot, update, job_queue, session):
     access_token = get_access_token(_database)
     query = update.callback_query
-    payment, price = query.data.split(', ')
     if query.data == 'menu':
-        reply_markup = create_menu_markup(access_token)
-        bot.send_message(
-            reply_markup=reply_markup,
-            chat_id=query.message.chat_id,
-            text='Welcome! Please, choose a pizza:',
-        )
-        bot.delete_message(
-            chat_id=query.message.chat_id,
-            message_id=query.message.message_id,
-        )
+        show_menu(bot, query, access_token, int(session.get('page', 0)))
 
         return 'HANDLE_MENU'
 
-    elif payment == 'payment':
+    elif query.data.startswith(('inc, ', 'dec, ')):
+        change_product_quantity(
+            bot,
+            query,
+            access_token,
+            message=query.message,
+        )
+
+        return 'HANDLE_CART'
+
+    elif query.data == 'payment':
+        flush_pending_cart(access_token, query.message.chat_id)
+        cart_items = get_cart(
+            _database,
+            access_token,
+            query.message.chat_id,
+            reconcile=True,
+        )
+        price = cart_items['meta']['display_price']['with_tax']['amount']
         start_without_shipping(bot, update, int(price))
 
         return 'HANDLE_WAITING'
-    
-    delete_product_from_cart(
+
+    flush_pending_cart(access_token, query.message.chat_id)
+    cart_items = delete_product_from_cart(
         access_token,
         query.message.chat_id,
         query.data,
     )
-    generate_cart(_database, bot, update)
+    store_cart_mirror(_database, query.message.chat_id, cart_items)
+    generate_cart(_database, bot, update, cart_items)
 
     return 'HANDLE_CART'
 
 
-def handle_waiting(bot, update, job_queue):
+def change_product_quantity(bot, query, access_token, message=None):
+    action, product_id = query.data.split(', ')
+    chat_id = query.message.chat_id
+    quantity = change_cart_quantity(
+        _database,
+        access_token,
+        chat_id,
+        product_id,
+        -1 if action == 'dec' else 1,
+    )
+    schedule_job(
+        _database,
+        'cart_flush:{0}'.format(chat_id),
+        'cart_flush',
+        CART_DEBOUNCE_DELAY,
+        {
+            'chat_id': chat_id,
+            'message': message.to_dict() if message else None,
+        },
+        shard_id=_shard_id,
+    )
+    send(
+        bot,
+        'answer_callback_query',
+        chat_id,
+        callback_query_id=query.id,
+        text='В корзине: {0}'.format(quantity),
+    )
+
+
+def flush_pending_cart(access_token, chat_id):
+    cancel_job(_database, 'cart_flush:{0}'.format(chat_id), _shard_id)
+    flush_chat_cart(access_token, chat_id)
+
+
+def flush_chat_cart(access_token, chat_id):
+    with _cart_flush_locks[hash(chat_id) % len(_cart_flush_locks)]:
+        return flush_cart_changes(_database, access_token, chat_id)
+
+
+def flush_cart(bot, payload):
+    cart_items = flush_chat_cart(
+        get_access_token(_database),
+        payload['chat_id'],
+    )
+    if cart_items is None or not payload.get('message'):
+        return
+
+    cart_recipe, reply_markup = build_cart_message(cart_items)
+    render_text(
+        bot,
+        payload['chat_id'],
+        Message.de_json(payload['message'], bot),
+        cart_recipe,
+        reply_markup,
+    )
+
+
+def handle_waiting(bot, update, job_queue, session):
+    # Geocoding and the pizzeria lookup run on the checkout executor, so
+    # the dispatcher worker is free for other chats. The checkout saves
+    # the next state itself before it replies, so it is left out here.
+    chat_id = update.message.chat_id
     access_token = get_access_token(_database)
+    pizzerias_loading = checkout_executor.submit(get_pizzerias, access_token)
+    checkout_executor.submit(
+        contextvars.copy_context().run,
+        check_out,
+        bot,
+        chat_id,
+        update.message.location,
+        update.message.text,
+        pizzerias_loading,
+    )
+    session.pop('state', None)
+
 
-    if location := update.message.location:
-        current_position = (location.latitude, location.longitude)
-    elif not (current_position := fetch_coordinates(
+def check_out(bot, chat_id, location, address, pizzerias_loading):
+    started_at = time.monotonic()
+    try:
+        with measure_io_wait(HANDLER_IO_WAIT, 'CHECKOUT'):
+            offer_delivery(bot, chat_id, location, address, pizzerias_loading)
+    except Exception as err:
+        HANDLER_ERRORS.inc('CHECKOUT')
+        logger.error(err)
+    HANDLER_DURATION.observe(time.monotonic() - started_at, 'CHECKOUT')
+
+
+def offer_delivery(bot, chat_id, location, address, pizzerias_loading):
+    access_token = get_access_token(_database)
+
+    if location:
+        current_position = (location.longitude, location.latitude)
+    elif not (current_position := get_coordinates(
+        _database,
         YA_API_KEY,
-        update.message.text,
+        address,
     )):
-            bot.send_message(
+            reply_to_checkout(
+                bot,
+                chat_id,
+                'HANDLE_WAITING',
                 text='I can\'t recognize the address',
-                chat_id=update.message.chat_id,
             )
 
-            return 'HANDLE_WAITING'
-
-    flow_slug = 'pizzeria'
-
-    create_customer_address(access_token, current_position, str(update.message.chat_id))
+            return
 
-    flow_pizzerias = get_entries(access_token, flow_slug)
-    closest_pizzeria = get_closest_entry(current_position, flow_pizzerias)
-    pizzeria = get_entry(access_token, flow_slug, closest_pizzeria['id'])
+    address_creation = write_customer_address(
+        access_token,
+        current_position,
+        str(chat_id),
+    )
+    address_creation.add_done_callback(log_address_creation)
+    pizzerias_loading.result()
+    pizzeria, pizzeria_distance = find_closest_pizzeria(
+        access_token,
+        current_position,
+    )
 
     delivery_man_id = pizzeria['delivery_man_id']
-    distance_between_pizzeria_and_customer = round(
-        closest_pizzeria['distance'],
-        1,
-    )
+    distance_between_pizzeria_and_customer = round(pizzeria_distance, 1)
 
-    if closest_pizzeria['distance'] < 0.5:
+    if pizzeria_distance < 0.5:
         reply = dedent('''\n
         Неподалеку есть пиццерия, около {0} км. от Вас.
         Мы можем ее доставить бесплатно, либо можете забрать сами :)
@@ -229,7 +403,7 @@ def handle_waiting(bot, update, job_queue):
     )
         reply_markup = create_delivery_menu(delivery_man_id, current_position)
 
-    elif closest_pizzeria['distance'] < 5:
+    elif pizzeria_distance < 5:
         reply = dedent('''\n
         Ближайшая пиццерия – {0}.
 
@@ -239,7 +413,7 @@ def handle_waiting(bot, update, job_queue):
     )
         reply_markup = create_delivery_menu(delivery_man_id, current_position)
     
-    elif closest_pizzeria['distance'] < 20:
+    elif pizzeria_distance < 20:
         reply = dedent('''\n
         Ближайшая пиццерия – {0}.
 
@@ -257,55 +431,106 @@ def handle_waiting(bot, update, job_queue):
     )
         keyboard = [InlineKeyboardButton('Menu', callback_data='menu')]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        bot.send_message(
-            text=reply,
-            chat_id=update.message.chat_id,
-        )
+        reply_to_checkout(bot, chat_id, 'HANDLE_MENU', text=reply)
 
-        return 'HANDLE_MENU'
+        return
     
     if reply_markup:
-        bot.send_message(
+        reply_to_checkout(
+            bot,
+            chat_id,
+            'HANDLE_DELIVERY',
             text=reply,
-            chat_id=update.message.chat_id,
             reply_markup=reply_markup,
         )
-    
-        return 'HANDLE_DELIVERY'
 
 
-def handle_delivery(bot, update, job_queue):
+def reply_to_checkout(bot, chat_id, next_state, **kwargs):
+    # The state is saved first, so the customer can't tap the reply
+    # before the bot is ready for it.
+    save_session(_database, chat_id, {'state': next_state})
+    send(bot, 'send_message', chat_id, **kwargs)
+
+
+def log_address_creation(address_creation):
+    err = address_creation.exception()
+    if err is not None:
+        logger.error('Customer address is not saved: {0}'.format(err))
+
+
+def handle_delivery(bot, update, job_queue, session):
     query = update.callback_query
     if query.data == 'pickup':
-        bot.send_message(
+        send(
+            bot,
+            'send_message',
+            query.message.chat.id,
             text='Забирай сам тогда 😡',
-            chat_id=update.message.chat.id,
         )
     else:
         telegram_id, (lon, lat) = json.loads(query.data)
+        customer_chat_id = query.message.chat.id
         reply = 'Заказ под номером {0} ожидает доставки'.format(
             telegram_id,
         )
-        bot.send_message(
-            text=reply,
-            chat_id=telegram_id,
-        )
-        bot.send_location(
-            chat_id=telegram_id,
+        send(bot, 'send_message', telegram_id, text=reply)
+        keyboard = [
+            [
+                InlineKeyboardButton(
+                    'Доставлено',
+                    callback_data='delivered, {0}'.format(customer_chat_id),
+                ),
+            ],
+        ]
+        send(
+            bot,
+            'send_location',
+            telegram_id,
             longitude=lon,
             latitude=lat,
+            reply_markup=InlineKeyboardMarkup(keyboard),
         )
 
-        job_queue.run_once(late_delivery_pizza, 60*60, context=query.message.chat.id)
+        schedule_job(
+            _database,
+            'late_delivery:{0}'.format(customer_chat_id),
+            'late_delivery',
+            LATE_DELIVERY_DELAY,
+            {'chat_id': customer_chat_id},
+        )
 
 
-def late_delivery_pizza(bot, job_queue):
-    bot.send_message(
-        chat_id=job_queue.context,
-        text='Приятного аппетита, эта пицца достается вам бесплатно :)',
+def handle_delivered(bot, update):
+    query = update.callback_query
+    customer_chat_id = query.data.split(', ')[1]
+    cancel_job(_database, 'late_delivery:{0}'.format(customer_chat_id))
+    send(
+        bot,
+        'answer_callback_query',
+        query.message.chat_id,
+        callback_query_id=query.id,
+        text='Доставка подтверждена',
     )
 
 
+def late_delivery_pizza(bot, payload):
+    with request_priority(BACKGROUND):
+        send(
+            bot,
+            'send_message',
+            payload['chat_id'],
+            text='Приятного аппетита, эта пицца достается вам бесплатно :)',
+        )
+
+
+def update_pizzerias(bot, job):
+    try:
+        with request_priority(BACKGROUND):
+            refresh_pizzerias(get_access_token(_database))
+    except Exception as err:
+        logger.error(err)
+
+
 def handle_users_reply(bot, update, job_queue):
     if update.message:
         user_reply = update.message.text
@@ -315,10 +540,11 @@ def handle_users_reply(bot, update, job_queue):
         chat_id = update.callback_query.message.chat_id
     else:
         return
+    session = load_session(_database, chat_id)
     if user_reply == '/start':
         user_state = 'START'
     else:
-        user_state = _database.get(chat_id)
+        user_state = session.get('state', 'START')
 
     states_functions = {
         'START': start,
@@ -329,33 +555,39 @@ def handle_users_reply(bot, update, job_queue):
         'HANDLE_DELIVERY': handle_delivery,
     }
     state_handler = states_functions[user_state]
+    received_at = time.time()
+    started_at = time.monotonic()
     try:
-        next_state = state_handler(bot, update, job_queue)
-        _database.set(chat_id, next_state)
+        with measure_io_wait(HANDLER_IO_WAIT, user_state):
+            next_state = state_handler(bot, update, job_queue, session)
+        if next_state:
+            session['state'] = next_state
+        if update.callback_query:
+            session['message_id'] = update.callback_query.message.message_id
+        save_session(_database, chat_id, session)
     except Exception as err:
+        HANDLER_ERRORS.inc(user_state)
         logger.error(err)
+    duration = time.monotonic() - started_at
+    HANDLER_DURATION.observe(duration, user_state)
+    record_update(chat_id, user_state, update, received_at, duration)
 
 
-def get_database_connection():
-    global _database
-    if _database is None:
-        _database = redis.Redis(
-            host=REDIS_HOST,
-            port=REDIS_PORT,
-            password=REDIS_PASSWORD,
-            decode_responses=True,
-        )
-    return _database
+def count_update(bot, update):
+    if update.message:
+        UPDATES.inc('message')
+    elif update.callback_query:
+        UPDATES.inc('callback_query')
+    else:
+        UPDATES.inc('other')
 
 
-def main():
-    logging.basicConfig(
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        level=logging.INFO,
-    )
-    get_database_connection()
-    updater = Updater(TELEGRAM_TOKEN)
-    dispatcher = updater.dispatcher
+def add_handlers(dispatcher):
+    dispatcher.add_handler(TypeHandler(Update, count_update), group=-2)
+    dispatcher.add_handler(CallbackQueryHandler(
+        handle_delivered,
+        pattern='^delivered, ',
+    ))
     dispatcher.add_handler(CallbackQueryHandler(
         handle_users_reply,
         pass_job_queue=True,
@@ -376,7 +608,82 @@ def main():
         Filters.successful_payment,
         successful_payment_callback,
     ))
-    updater.start_polling()
+
+
+def get_database_connection():
+    global _database
+    if _database is None:
+        _database = redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            password=REDIS_PASSWORD,
+            decode_responses=True,
+        )
+    return _database
+
+
+def main():
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO,
+    )
+    get_database_connection()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_LISTEN, METRICS_PORT)
+    bot = Bot(
+        TELEGRAM_TOKEN,
+        base_url=TELEGRAM_API_URL,
+        request=InstrumentedRequest(con_pool_size=8),
+    )
+    if UPDATE_LOG_PATH:
+        open_update_log(UPDATE_LOG_PATH)
+    updater = Updater(bot=bot)
+    dispatcher = updater.dispatcher
+    add_handlers(dispatcher)
+    updater.job_queue.run_repeating(
+        update_pizzerias,
+        interval=PIZZERIA_REFRESH_INTERVAL,
+        first=0,
+    )
+    register_job('late_delivery', late_delivery_pizza)
+    register_job('cart_flush', flush_cart)
+    updater.job_queue.run_repeating(
+        poll_scheduled_jobs,
+        interval=SCHEDULER_POLL_INTERVAL,
+        context=(_database, _shard_id),
+    )
+
+    if SHARD_ROLE == 'worker':
+        updater.job_queue.start()
+        run_shard_worker(_database, dispatcher, SHARD_ID)
+        return
+
+    if SHARD_ROLE == 'router':
+        dispatcher.add_handler(
+            TypeHandler(
+                Update,
+                create_router(_database, ShardRing(SHARDS_COUNT)),
+            ),
+            group=-1,
+        )
+        updater.job_queue.run_repeating(
+            report_shard_queue_depths,
+            interval=SHARD_REPORT_INTERVAL,
+            context=(_database, SHARDS_COUNT),
+        )
+
+    if BOT_MODE == 'webhook':
+        run_webhook(
+            updater,
+            url=WEBHOOK_URL,
+            secret=WEBHOOK_SECRET,
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            workers=WEBHOOK_WORKERS,
+            queue_size=WEBHOOK_QUEUE_SIZE,
+        )
+    else:
+        updater.start_polling()
 
 
 if __name__ == '__main__':
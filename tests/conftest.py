@@ -0,0 +1,42 @@
+import os
+
+import fakeredis
+import pytest
+
+# The settings are read on import, so the required ones are set before
+# the app is imported by the tests.
+os.environ.setdefault('CLIENT_ID', 'test')
+os.environ.setdefault('CLIENT_SECRET', 'test')
+
+
+@pytest.fixture
+def redis_db():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+class FakeBot:
+    """Bot recording the calls of its methods."""
+
+    def __init__(self, answers=None):
+        self.calls = []
+        self.answers = answers or {}
+
+    def __getattr__(self, method):
+        def call(**kwargs):
+            self.calls.append((method, kwargs))
+            answer = self.answers.get(method)
+            if callable(answer):
+                return answer(**kwargs)
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        return call
+
+    def get_methods(self):
+        return [method for method, _ in self.calls]
+
+
+@pytest.fixture
+def bot():
+    return FakeBot()
@@ -0,0 +1,137 @@
+import pytest
+
+from app.bots import cart
+from app.bots.cart import (
+    CART_MIRROR_KEY,
+    CART_PENDING_KEY,
+    change_cart_quantity,
+    flush_cart_changes,
+    store_cart_mirror,
+)
+
+
+def create_cart_items(*quantities):
+    return {
+        'data': [
+            {
+                'id': 'item{0}'.format(product_id),
+                'product_id': product_id,
+                'name': product_id,
+                'quantity': quantity,
+            }
+            for product_id, quantity in quantities
+        ],
+    }
+
+
+class FakeMoltin:
+    """Moltin cart keeping quantities of the products."""
+
+    def __init__(self, **quantities):
+        self.quantities = quantities
+        self.calls = []
+
+    def get_cart_items(self, access_token, chat_id):
+        self.calls.append(('get',))
+        return self.get_items()
+
+    def add_product_to_cart(
+        self,
+        access_token,
+        chat_id,
+        product_id,
+        quantity,
+    ):
+        self.calls.append(('add', product_id, quantity))
+        self.quantities[product_id] = quantity
+        return self.get_items()
+
+    def update_cart_item_quantity(
+        self,
+        access_token,
+        chat_id,
+        item_id,
+        quantity,
+    ):
+        self.calls.append(('update', item_id, quantity))
+        self.quantities[item_id[len('item'):]] = quantity
+        return self.get_items()
+
+    def delete_product_from_cart(self, access_token, chat_id, item_id):
+        self.calls.append(('delete', item_id))
+        del self.quantities[item_id[len('item'):]]
+        return self.get_items()
+
+    def get_items(self):
+        return create_cart_items(*self.quantities.items())
+
+
+@pytest.fixture
+def moltin(monkeypatch):
+    moltin = FakeMoltin(p1=2, p2=1)
+    for method in (
+        'get_cart_items',
+        'add_product_to_cart',
+        'update_cart_item_quantity',
+        'delete_product_from_cart',
+    ):
+        monkeypatch.setattr(cart, method, getattr(moltin, method))
+
+    return moltin
+
+
+def test_changes_are_buffered(redis_db, moltin):
+    store_cart_mirror(redis_db, 1, moltin.get_items())
+
+    assert change_cart_quantity(redis_db, 'token', 1, 'p1', 1) == 3
+    assert change_cart_quantity(redis_db, 'token', 1, 'p1', 1) == 4
+    assert change_cart_quantity(redis_db, 'token', 1, 'p1', -5) == 0
+    assert redis_db.hgetall(CART_PENDING_KEY.format(1)) == {'p1': '2'}
+    assert moltin.calls == []
+
+
+def test_flush_sends_one_request_per_product(redis_db, moltin):
+    store_cart_mirror(redis_db, 1, moltin.get_items())
+    for product_id, quantity_change in (
+        ('p1', 1), ('p1', 1), ('p2', -1), ('p3', 2),
+    ):
+        change_cart_quantity(redis_db, 'token', 1, product_id, quantity_change)
+
+    flush_cart_changes(redis_db, 'token', 1)
+
+    assert moltin.calls == [
+        ('update', 'itemp1', 4),
+        ('delete', 'itemp2'),
+        ('add', 'p3', 2),
+    ]
+    assert not redis_db.exists(CART_PENDING_KEY.format(1))
+
+
+def test_flush_without_changes_does_nothing(redis_db, moltin):
+    assert flush_cart_changes(redis_db, 'token', 1) is None
+    assert moltin.calls == []
+
+
+def test_unsent_changes_are_buffered_again(
+    redis_db,
+    moltin,
+    monkeypatch,
+):
+    def fail(access_token, chat_id, product_id, quantity):
+        raise RuntimeError('Moltin is down')
+
+    monkeypatch.setattr(cart, 'add_product_to_cart', fail)
+    store_cart_mirror(redis_db, 1, moltin.get_items())
+    change_cart_quantity(redis_db, 'token', 1, 'p1', 1)
+    change_cart_quantity(redis_db, 'token', 1, 'p3', 4)
+    change_cart_quantity(redis_db, 'token', 1, 'p2', 1)
+
+    with pytest.raises(RuntimeError):
+        flush_cart_changes(redis_db, 'token', 1)
+
+    assert moltin.calls == [('update', 'itemp1', 3)]
+    assert redis_db.hgetall(CART_PENDING_KEY.format(1)) == {
+        'p3': '4',
+        'p2': '1',
+    }
+    assert not redis_db.exists(CART_MIRROR_KEY.format(1))
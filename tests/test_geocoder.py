@@ -0,0 +1,80 @@
+import random
+
+import pytest
+from geopy.distance import distance
+
+from app.bots.geocoder import SpatialIndex, normalize_address
+
+
+@pytest.mark.parametrize('address, normalized_address', [
+    ('Москва, ул. Тверская, д.1', 'москва улица тверская дом 1'),
+    ('г. Москва, пр-т Мира 5 к 2', 'город москва проспект мира 5 корпус 2'),
+    ('Ёлкин б-р, 3', 'елкин бульвар 3'),
+    ('пр Вернадского', 'пр вернадского'),
+])
+def test_normalize_address(address, normalized_address):
+    assert normalize_address(address) == normalized_address
+
+
+def test_same_address_written_differently_is_normalized_equally():
+    assert normalize_address('ул.Тверская,  д. 1') == normalize_address(
+        'УЛ ТВЕРСКАЯ Д 1',
+    )
+
+
+def create_entries(count, seed):
+    generator = random.Random(seed)
+
+    return [
+        {
+            'id': entry_index,
+            'longitude': str(generator.uniform(37, 38.5)),
+            'latitude': str(generator.uniform(55.3, 56.2)),
+        }
+        for entry_index in range(count)
+    ]
+
+
+def find_closest_directly(entries, position):
+    lon, lat = position
+
+    return min(
+        (
+            distance(
+                (lat, lon),
+                (float(entry['latitude']), float(entry['longitude'])),
+            ).km,
+            entry['id'],
+        )
+        for entry in entries
+    )
+
+
+@pytest.mark.parametrize('position', [
+    (37.62, 55.75),
+    (37.01, 55.31),
+    (39.5, 57.0),
+    (30.3, 59.9),
+])
+def test_closest_entry_matches_direct_scan(position):
+    entries = create_entries(200, seed=1)
+    index = SpatialIndex(entries)
+
+    closest_entry, closest_distance = index.find_closest(position)
+
+    expected_distance, expected_id = find_closest_directly(entries, position)
+    assert closest_entry['id'] == expected_id
+    assert closest_distance == pytest.approx(expected_distance)
+
+
+def test_single_entry_is_found_from_far_away():
+    entries = create_entries(1, seed=2)
+
+    closest_entry, _ = SpatialIndex(entries).find_closest((-70.6, -33.4))
+
+    assert closest_entry is entries[0]
+
+
+def test_empty_index_raises():
+    with pytest.raises(ValueError):
+        SpatialIndex([]).find_closest((37.62, 55.75))
@@ -0,0 +1,117 @@
+import threading
+import time
+
+from telegram.error import RetryAfter
+
+from app.api.ratelimit import BACKGROUND, INTERACTIVE
+from app.bots.outbox import Outbox
+
+from conftest import FakeBot
+
+
+def create_outbox(rate=100, chat_rate=100, chat_burst=10, workers=1):
+    return Outbox(
+        rate=rate,
+        chat_rate=chat_rate,
+        chat_burst=chat_burst,
+        workers=workers,
+        retries=2,
+    )
+
+
+def test_messages_of_chat_are_sent_in_order(bot):
+    outbox = create_outbox(workers=4)
+    futures = [
+        outbox.send(bot, 'send_message', 1, text=str(number))
+        for number in range(5)
+    ]
+
+    for future in futures:
+        future.result(timeout=5)
+    assert [kwargs for _, kwargs in bot.calls] == [
+        {'chat_id': 1, 'text': str(number)} for number in range(5)
+    ]
+    assert outbox.wait_sent(1, timeout=1)
+
+
+def test_chat_bucket_spaces_messages_of_chat(bot):
+    outbox = create_outbox(chat_rate=10, chat_burst=1, workers=2)
+    started_at = time.monotonic()
+    futures = [outbox.send(bot, 'send_message', 1, text='hi')]
+    futures.append(outbox.send(bot, 'send_message', 2, text='hi'))
+    futures.append(outbox.send(bot, 'send_message', 1, text='hi'))
+    futures.append(outbox.send(bot, 'send_message', 1, text='hi'))
+
+    futures[1].result(timeout=5)
+    assert time.monotonic() - started_at < 0.1
+    futures[-1].result(timeout=5)
+    assert time.monotonic() - started_at >= 0.15
+
+
+def test_interactive_messages_go_ahead_of_background():
+    is_released = threading.Event()
+    bot = FakeBot({'send_message': lambda **kwargs: is_released.wait(5)})
+    outbox = create_outbox()
+    futures = [
+        outbox.send(bot, 'send_message', 1, priority=INTERACTIVE),
+        outbox.send(bot, 'send_message', 2, priority=BACKGROUND),
+        outbox.send(bot, 'send_message', 3, priority=INTERACTIVE),
+    ]
+    time.sleep(0.05)
+    is_released.set()
+
+    for future in futures:
+        future.result(timeout=5)
+    assert [kwargs['chat_id'] for _, kwargs in bot.calls] == [1, 3, 2]
+
+
+def test_message_is_sent_again_after_flood_wait(bot):
+    bot.answers['send_message'] = _raise_first(RetryAfter(0.05), 'sent')
+    outbox = create_outbox()
+
+    started_at = time.monotonic()
+    assert outbox.send(bot, 'send_message', 1).result(timeout=5) == 'sent'
+    assert time.monotonic() - started_at >= 0.05
+    assert len(bot.calls) == 2
+    assert outbox.get_stats()['rate_limited_count'] == 1
+
+
+def test_message_fails_after_retries(bot):
+    bot.answers['send_message'] = RetryAfter(0.01)
+    outbox = create_outbox()
+
+    error = outbox.send(bot, 'send_message', 1).exception(timeout=5)
+    assert isinstance(error, RetryAfter)
+    assert len(bot.calls) == 3
+    assert outbox.wait_sent(1, timeout=1)
+
+
+def test_chatless_call_skips_chat_queue(bot):
+    outbox = create_outbox(chat_rate=1, chat_burst=1)
+    outbox.send(bot, 'send_message', 1).result(timeout=5)
+    delayed_message = outbox.send(bot, 'send_message', 1)
+    callback_answer = outbox.send(
+        bot,
+        'answer_callback_query',
+        1,
+        callback_query_id='query',
+    )
+
+    callback_answer.result(timeout=0.5)
+    assert not delayed_message.done()
+    assert bot.calls[-1] == (
+        'answer_callback_query',
+        {'callback_query_id': 'query'},
+    )
+    delayed_message.result(timeout=5)
+
+
+def _raise_first(error, result):
+    errors = [error]
+
+    def answer(**kwargs):
+        if errors:
+            raise errors.pop()
+        return result
+
+    return answer
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import time
+
+from app.api.ratelimit import BACKGROUND, INTERACTIVE, RequestScheduler
+
+
+def start_acquire(acquire, priority, order):
+    def run():
+        acquire(priority)
+        order.append(priority)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.05)
+
+    return thread
+
+
+def test_interactive_requests_go_ahead_of_background():
+    scheduler = RequestScheduler(rate=5, burst=1)
+    scheduler.acquire()
+    order = []
+
+    threads = [
+        start_acquire(scheduler.acquire, BACKGROUND, order),
+        start_acquire(scheduler.acquire, INTERACTIVE, order),
+    ]
+    assert scheduler.get_stats()['background_queue_depth'] == 1
+    assert scheduler.get_stats()['interactive_queue_depth'] == 1
+    for thread in threads:
+        thread.join(5)
+
+    assert order == [INTERACTIVE, BACKGROUND]
+    assert scheduler.get_stats()['throttled_count'] == 2
+
+
+def test_async_requests_share_queue_with_threads():
+    scheduler = RequestScheduler(rate=5, burst=1)
+    scheduler.acquire()
+    order = []
+
+    def acquire_async(priority):
+        asyncio.run(scheduler.acquire_async(priority))
+
+    threads = [
+        start_acquire(scheduler.acquire, BACKGROUND, order),
+        start_acquire(acquire_async, INTERACTIVE, order),
+    ]
+    for thread in threads:
+        thread.join(5)
+
+    assert order == [INTERACTIVE, BACKGROUND]
+    assert scheduler.get_stats()['interactive_queue_depth'] == 0
+
+
+def test_pause_holds_requests_back():
+    scheduler = RequestScheduler(rate=1000, burst=10)
+    scheduler.pause(0.1)
+
+    started_at = time.monotonic()
+    scheduler.acquire()
+    assert time.monotonic() - started_at >= 0.09
+    assert scheduler.get_stats()['rate_limited_count'] == 1
@@ -0,0 +1,109 @@
+import pytest
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Message
+from telegram.error import BadRequest, RetryAfter
+
+from app.bots import render
+from app.bots.render import render_text
+
+REPLY_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton('Menu', callback_data='menu')],
+])
+
+
+def create_message(bot, **fields):
+    return Message.de_json(
+        dict(
+            {
+                'message_id': 10,
+                'date': 1500000000,
+                'chat': {'id': 1, 'type': 'private'},
+            },
+            **fields,
+        ),
+        bot,
+    )
+
+
+@pytest.fixture
+def outbox_calls(monkeypatch):
+    outbox_calls = []
+
+    def send(bot, method, chat_id, **kwargs):
+        outbox_calls.append((method, chat_id, kwargs))
+        return render.get_done_future('queued')
+
+    monkeypatch.setattr(render, 'send', send)
+
+    return outbox_calls
+
+
+def test_text_message_is_edited(bot, outbox_calls):
+    bot.answers['edit_message_text'] = 'edited'
+    message = create_message(bot, text='Cart is empty')
+
+    shown_message = render_text(bot, 1, message, 'Menu', REPLY_MARKUP)
+
+    assert shown_message.result() == 'edited'
+    assert bot.calls == [('edit_message_text', {
+        'chat_id': 1,
+        'message_id': 10,
+        'text': 'Menu',
+        'reply_markup': REPLY_MARKUP,
+    })]
+    assert outbox_calls == []
+
+
+def test_unchanged_screen_is_skipped(bot, outbox_calls):
+    bot.answers['edit_message_text'] = BadRequest(
+        'Bad Request: message is not modified',
+    )
+    message = create_message(bot, text='Menu')
+
+    shown_message = render_text(bot, 1, message, 'Menu', REPLY_MARKUP)
+
+    assert shown_message.result() is message
+    assert outbox_calls == []
+
+
+def test_edit_waits_in_outbox_on_flood_wait(bot, outbox_calls):
+    bot.answers['edit_message_text'] = RetryAfter(1)
+    message = create_message(bot, text='Cart is empty')
+
+    render_text(bot, 1, message, 'Menu')
+
+    assert outbox_calls == [('edit_message_text', 1, {
+        'message_id': 10,
+        'text': 'Menu',
+        'reply_markup': None,
+    })]
+
+
+def test_photo_message_is_replaced(bot, outbox_calls):
+    message = create_message(
+        bot,
+        photo=[{'file_id': 'photo', 'width': 1, 'height': 1}],
+    )
+
+    shown_message = render_text(bot, 1, message, 'Menu', REPLY_MARKUP)
+
+    assert shown_message.result() == 'queued'
+    assert outbox_calls == [('send_message', 1, {
+        'text': 'Menu',
+        'reply_markup': REPLY_MARKUP,
+    })]
+    assert bot.calls == [('delete_message', {
+        'chat_id': 1,
+        'message_id': 10,
+    })]
+
+
+def test_message_that_cant_be_edited_is_replaced(bot, outbox_calls):
+    bot.answers['edit_message_text'] = BadRequest(
+        "Bad Request: message can't be edited",
+    )
+    message = create_message(bot, text='Cart is empty')
+
+    render_text(bot, 1, message, 'Menu')
+
+    assert [method for method, _, _ in outbox_calls] == ['send_message']
+    assert bot.get_methods() == ['edit_message_text', 'delete_message']
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from app.bots.scheduler import (
+    CLAIM_JOB_SCRIPT,
+    cancel_job,
+    get_job_keys,
+    register_job,
+    run_due_jobs,
+    schedule_job,
+)
+
+
+@pytest.fixture
+def payloads():
+    payloads = []
+    register_job('test', lambda bot, payload: payloads.append(payload))
+
+    return payloads
+
+
+def test_due_job_runs_once(redis_db, bot, payloads):
+    schedule_job(redis_db, 'job', 'test', 0, {'chat_id': 1})
+    schedule_job(redis_db, 'later', 'test', 60, {'chat_id': 2})
+
+    assert run_due_jobs(redis_db, bot) == 1
+    assert run_due_jobs(redis_db, bot) == 0
+    assert payloads == [{'chat_id': 1}]
+
+
+def test_rescheduled_job_replaces_previous(redis_db, bot, payloads):
+    schedule_job(redis_db, 'job', 'test', 0, {'quantity': 1})
+    schedule_job(redis_db, 'job', 'test', 0, {'quantity': 2})
+
+    assert run_due_jobs(redis_db, bot) == 1
+    assert payloads == [{'quantity': 2}]
+
+
+def test_cancelled_job_does_not_run(redis_db, bot, payloads):
+    schedule_job(redis_db, 'job', 'test', 0, {})
+
+    assert cancel_job(redis_db, 'job')
+    assert not cancel_job(redis_db, 'job')
+    assert run_due_jobs(redis_db, bot) == 0
+    assert payloads == []
+
+
+def test_shard_jobs_run_only_by_their_shard(redis_db, bot, payloads):
+    schedule_job(redis_db, 'common', 'test', 0, 'common')
+    schedule_job(redis_db, 'own', 'test', 0, 'own', shard_id=1)
+    schedule_job(redis_db, 'other', 'test', 0, 'other', shard_id=2)
+
+    assert run_due_jobs(redis_db, bot) == 1
+    assert run_due_jobs(redis_db, bot, shard_id=1) == 1
+    assert payloads == ['common', 'own']
+
+
+def test_job_is_claimed_by_one_worker(redis_db):
+    schedule_job(redis_db, 'job', 'test', 0, {'chat_id': 1})
+    claim_job = redis_db.register_script(CLAIM_JOB_SCRIPT)
+    job_keys = list(get_job_keys())
+
+    serialized_job = claim_job(keys=job_keys, args=['job'])
+    assert json.loads(serialized_job) == {
+        'name': 'test',
+        'payload': {'chat_id': 1},
+    }
+    assert claim_job(keys=job_keys, args=['job']) is None
+    assert not redis_db.exists(*job_keys)
+
+
+def test_failed_job_does_not_stop_others(redis_db, bot, payloads):
+    def fail(bot, payload):
+        raise RuntimeError('failed')
+
+    register_job('failing', fail)
+    schedule_job(redis_db, 'failing', 'failing', 0, {})
+    schedule_job(redis_db, 'job', 'test', 0, {})
+
+    assert run_due_jobs(redis_db, bot) == 2
+    assert payloads == [{}]
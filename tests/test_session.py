@@ -0,0 +1,34 @@
+from app.bots.session import SESSION_KEY, load_session, save_session
+from app.bots.settings import SESSION_TTL
+
+
+def test_saved_session_is_loaded(redis_db):
+    save_session(redis_db, 1, {'state': 'HANDLE_MENU', 'page': '2'})
+
+    assert load_session(redis_db, 1) == {'state': 'HANDLE_MENU', 'page': '2'}
+    assert 0 < redis_db.ttl(SESSION_KEY.format(1)) <= SESSION_TTL
+
+
+def test_fields_set_to_none_are_removed(redis_db):
+    save_session(redis_db, 1, {'state': 'HANDLE_MENU', 'page': '2'})
+    save_session(redis_db, 1, {'state': 'HANDLE_CART', 'page': None})
+
+    assert load_session(redis_db, 1) == {'state': 'HANDLE_CART'}
+
+
+def test_missing_session_is_empty(redis_db):
+    assert load_session(redis_db, 1) == {}
+
+
+def test_legacy_state_is_moved_to_session(redis_db):
+    redis_db.set(1, 'HANDLE_CART')
+
+    assert load_session(redis_db, 1) == {'state': 'HANDLE_CART'}
+    assert not redis_db.exists(1)
+
+
+def test_session_state_wins_over_legacy_state(redis_db):
+    save_session(redis_db, 1, {'state': 'HANDLE_MENU'})
+    redis_db.set(1, 'HANDLE_CART')
+
+    assert load_session(redis_db, 1) == {'state': 'HANDLE_MENU'}
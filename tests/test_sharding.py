@@ -0,0 +1,36 @@
+from app.bots.sharding import ShardRing
+
+CHAT_IDS = range(100000, 110000)
+
+
+def test_chat_always_gets_the_same_shard():
+    first_ring = ShardRing(4)
+    second_ring = ShardRing(4)
+
+    assert all(
+        first_ring.get_shard(chat_id) == second_ring.get_shard(chat_id)
+        for chat_id in CHAT_IDS
+    )
+
+
+def test_chats_are_spread_over_all_shards():
+    ring = ShardRing(4)
+    shard_sizes = [0] * 4
+    for chat_id in CHAT_IDS:
+        shard_sizes[ring.get_shard(chat_id)] += 1
+
+    assert min(shard_sizes) > len(CHAT_IDS) / 4 * 0.6
+
+
+def test_added_shard_takes_chats_only_from_others():
+    ring = ShardRing(4)
+    grown_ring = ShardRing(5)
+
+    moved_shards = [
+        grown_ring.get_shard(chat_id)
+        for chat_id in CHAT_IDS
+        if ring.get_shard(chat_id) != grown_ring.get_shard(chat_id)
+    ]
+
+    assert set(moved_shards) == {4}
+    assert len(moved_shards) < len(CHAT_IDS) * 0.35